@@ -36,22 +36,23 @@ def add_test_entries():
     
     print("Adding test entries to the backend...")
     
-    for i, entry in enumerate(test_entries):
-        try:
-            response = requests.post(
-                f"{base_url}/checkin",
-                json={"user_text": entry["user_text"]},
-                headers={"Content-Type": "application/json"}
-            )
-            
-            if response.status_code == 200:
-                data = response.json()
+    try:
+        # One request for the whole set: batched inference and a single insert_many
+        response = requests.post(
+            f"{base_url}/checkin/batch",
+            json={"entries": [{"user_text": entry["user_text"]} for entry in test_entries]},
+            headers={"Content-Type": "application/json"}
+        )
+        
+        if response.status_code == 200:
+            saved = response.json()["entries"]
+            for i, (entry, data) in enumerate(zip(test_entries, saved)):
                 print(f"✓ Entry {i+1}: Sentiment {data['sentiment_score']:.2f} ({entry['expected_sentiment']})")
-            else:
-                print(f"✗ Entry {i+1}: Failed with status {response.status_code}")
-                
-        except Exception as e:
-            print(f"✗ Entry {i+1}: Error - {e}")
+        else:
+            print(f"✗ Batch failed with status {response.status_code}")
+            
+    except Exception as e:
+        print(f"✗ Batch error - {e}")
     
     # Check timeline
     try:
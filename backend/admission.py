@@ -0,0 +1,226 @@
+# admission.py
+"""
+Adaptive admission control for check-in inference.
+
+Without a limit, an overloaded worker accepts every check-in and queues it on
+the inference executor. Every request then gets slower until clients time out,
+and by then the work done for them is wasted. With ADMISSION_CONTROL=1, POST
+/checkin and /checkin/batch must get a slot before they reach the model:
+
+- At most `limit` requests are in inference at once. Others wait in a short FIFO
+  queue (ADMISSION_MAX_QUEUED deep, ADMISSION_QUEUE_TIMEOUT_MS long).
+- Requests that find the queue full, or wait out the timeout, are shed.
+  main.py answers them with 503 and Retry-After, or with
+  ADMISSION_OVERLOAD_ACTION=defer stores them for a background job (202).
+- The limit follows observed inference latency, AIMD style. After each window of
+  about `limit` completed requests, a p90 above ADMISSION_TARGET_MS scales the limit
+  by target / p90, but never below half. A window within target that ran into the
+  limit raises it by one. The limit settles where the model is kept busy and
+  latency stays near the target.
+
+All state lives on the event loop, so no locks are needed; each pre-forked worker
+has its own controller.
+"""
+
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from contextlib import nullcontext
+from typing import Optional
+
+from metrics import register_gauge_callback
+
+# --- Configuration ---
+ADMISSION_CONTROL = os.environ.get("ADMISSION_CONTROL", "0").lower() in ("1", "true", "yes")
+# p90 inference latency (executor wait, micro-batching and forward pass) the limit is steered to
+ADMISSION_TARGET_MS = float(os.environ.get("ADMISSION_TARGET_MS", "1000"))
+# Bounds of the concurrency limit. 0 for the maximum means INFERENCE_EXECUTOR_WORKERS
+ADMISSION_MIN_LIMIT = int(os.environ.get("ADMISSION_MIN_LIMIT", "1"))
+ADMISSION_MAX_LIMIT = int(os.environ.get("ADMISSION_MAX_LIMIT", "0"))
+# Requests beyond the limit wait this long for a slot, at most ADMISSION_MAX_QUEUED of them at once
+ADMISSION_QUEUE_TIMEOUT_MS = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT_MS", "100"))
+ADMISSION_MAX_QUEUED = int(os.environ.get("ADMISSION_MAX_QUEUED", "64"))
+# "reject": 503 with Retry-After. "defer": store single check-ins unscored and analyse them in a job.
+ADMISSION_OVERLOAD_ACTION = os.environ.get("ADMISSION_OVERLOAD_ACTION", "reject").lower()
+# ---------------------
+
+if ADMISSION_OVERLOAD_ACTION not in ("reject", "defer"):
+    raise ValueError(f"Unknown ADMISSION_OVERLOAD_ACTION '{ADMISSION_OVERLOAD_ACTION}'. Use 'reject' or 'defer'.")
+
+# Largest multiplicative decrease per window
+MAX_BACKOFF = 0.5
+# Fewest samples per adjustment, so a small limit isn't steered by one or two requests
+MIN_WINDOW = 10
+# Weight of each new sample in the latency average behind Retry-After
+LATENCY_SMOOTHING = 0.1
+MAX_RETRY_AFTER_SECONDS = 60
+
+
+class Overloaded(Exception):
+    """Raised by AdmissionController.acquire() for a request that is shed."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionSlot:
+    """One admitted request. Exiting the `with` block frees the slot and reports the latency."""
+
+    __slots__ = ("controller", "observe", "started")
+
+    def __init__(self, controller: "AdmissionController", observe: bool):
+        self.controller = controller
+        self.observe = observe
+        self.started = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        # Failed calls say nothing about capacity, so only successes are timed
+        observed = self.observe and exc_type is None
+        self.controller.release(time.perf_counter() - self.started if observed else None)
+        return False
+
+
+class AdmissionController:
+    """Concurrency limit with a bounded wait queue, adapted to observed latency."""
+
+    def __init__(self, max_limit: int, enabled: bool = ADMISSION_CONTROL, target_ms: float = ADMISSION_TARGET_MS,
+                 min_limit: int = ADMISSION_MIN_LIMIT, queue_timeout_ms: float = ADMISSION_QUEUE_TIMEOUT_MS,
+                 max_queued: int = ADMISSION_MAX_QUEUED):
+        self.enabled = enabled
+        self.target = target_ms / 1000.0
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.queue_timeout = max(0.0, queue_timeout_ms) / 1000.0
+        self.max_queued = max(0, max_queued)
+        # Starts fully open, as without admission control; the first slow window brings it down
+        self.limit = float(self.max_limit)
+
+        self.in_flight = 0
+        self._waiters = deque()
+        self._window = []
+        self._saturated = False  # A request found no free slot during the current window
+        self.latency_average = None
+        self.window_p90 = None
+
+        self.admitted = 0
+        self.shed = 0
+        self.queue_timeouts = 0
+        self.increases = 0
+        self.decreases = 0
+
+    async def acquire(self, observe: bool = True):
+        """
+        Waits for a slot and returns it as a context manager for the inference call.
+        observe=False keeps the call's latency out of the limit (e.g. large batches).
+        Raises Overloaded when the request is shed.
+        """
+        if not self.enabled:
+            return nullcontext()
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            return AdmissionSlot(self, observe)
+
+        self._saturated = True
+        if len(self._waiters) >= self.max_queued or self.queue_timeout <= 0:
+            self.shed += 1
+            raise Overloaded(f"Inference is at capacity ({self.in_flight} in flight, {len(self._waiters)} queued)", self.retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.shed += 1
+            self.queue_timeouts += 1
+            raise Overloaded(f"No inference slot freed up within {self.queue_timeout * 1000.0:.0f}ms", self.retry_after())
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as the client went away
+                self.release(None)
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+        self.admitted += 1
+        return AdmissionSlot(self, observe)
+
+    def release(self, latency: Optional[float]):
+        """Frees a slot, handing it to the oldest waiter if the limit allows."""
+        if latency is not None:
+            self._observe(latency)
+        self.in_flight -= 1
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def _observe(self, latency: float):
+        if self.latency_average is None:
+            self.latency_average = latency
+        else:
+            self.latency_average += LATENCY_SMOOTHING * (latency - self.latency_average)
+
+        self._window.append(latency)
+        if len(self._window) < max(MIN_WINDOW, int(self.limit)):
+            return
+        window = sorted(self._window)
+        self._window = []
+        self.window_p90 = window[int(0.9 * (len(window) - 1))]
+        if self.window_p90 > self.target:
+            # Latency grows about linearly with the limit once the model is saturated
+            limit = max(float(self.min_limit), self.limit * max(MAX_BACKOFF, self.target / self.window_p90))
+            if int(limit) < int(self.limit):
+                self.decreases += 1
+            self.limit = limit
+        elif self._saturated and self.limit < self.max_limit:
+            self.limit = min(float(self.max_limit), math.floor(self.limit) + 1.0)
+            self.increases += 1
+        self._saturated = False
+
+    def retry_after(self) -> int:
+        """Seconds until a retry is likely to be admitted: the queue ahead of it, drained `limit` at a time."""
+        latency = self.latency_average if self.latency_average is not None else self.target
+        rounds = 1 + len(self._waiters) / max(1, int(self.limit))
+        return max(1, min(MAX_RETRY_AFTER_SECONDS, math.ceil(latency * rounds)))
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "limit": int(self.limit),
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "target_ms": self.target * 1000.0,
+            "in_flight": self.in_flight,
+            "queued": len(self._waiters),
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "queue_timeouts": self.queue_timeouts,
+            "limit_increases": self.increases,
+            "limit_decreases": self.decreases,
+            "latency_ms_average": self.latency_average * 1000.0 if self.latency_average is not None else None,
+            "latency_ms_window_p90": self.window_p90 * 1000.0 if self.window_p90 is not None else None,
+            "overload_action": ADMISSION_OVERLOAD_ACTION,
+        }
+
+
+def register_admission_gauges(controller: AdmissionController):
+    register_gauge_callback(
+        "admission_limit", "Current adaptive limit on concurrent check-in inference.", (),
+        lambda: {(): int(controller.limit)})
+    register_gauge_callback(
+        "admission_requests", "Check-ins in inference and waiting for an inference slot.", ("state",),
+        lambda: {("in_flight",): controller.in_flight, ("queued",): len(controller._waiters)})
+    register_gauge_callback(
+        "admission_events", "Requests admitted and shed (at once or after a queue timeout), and limit changes.", ("event",),
+        lambda: {(event,): value for event, value in (
+            ("admitted", controller.admitted), ("shed", controller.shed), ("queue_timeouts", controller.queue_timeouts),
+            ("limit_increases", controller.increases), ("limit_decreases", controller.decreases))})
@@ -0,0 +1,432 @@
+# anomaly.py
+import math
+import os
+from collections import deque
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from baseline import BaselineStore, new_baseline, BASELINE_MODE, BASELINE_WINDOW
+from versions import on_local_bump, user_versions
+
+# --- Configuration ---
+# Comma-separated detectors that can flag a check-in. "iqr" alone is the original rule.
+ANOMALY_DETECTORS = os.environ.get("ANOMALY_DETECTORS", "iqr")
+# Past check-ins needed before any detector may fire (e.g. 3 days + new day)
+ANOMALY_MIN_HISTORY = max(2, int(os.environ.get("ANOMALY_MIN_HISTORY", "4")))
+IQR_MULTIPLIER = float(os.environ.get("IQR_MULTIPLIER", "1.5"))
+ZSCORE_WINDOW = int(os.environ.get("ZSCORE_WINDOW", "30"))
+ZSCORE_THRESHOLD = float(os.environ.get("ZSCORE_THRESHOLD", "3.0"))
+EWMA_ALPHA = float(os.environ.get("EWMA_ALPHA", "0.2"))
+EWMA_THRESHOLD = float(os.environ.get("EWMA_THRESHOLD", "3.0"))
+# CUSUM allowance and decision interval, both in standard deviations of the history
+CUSUM_K = float(os.environ.get("CUSUM_K", "0.5"))
+CUSUM_H = float(os.environ.get("CUSUM_H", "5.0"))
+# Rows per np.quantile call when scoring a windowed IQR history
+HISTORY_CHUNK_SIZE = 4096
+# ---------------------
+
+# Every detector only looks for drops: a sudden or sustained dip below the user's norm.
+
+
+def detector_result(name: str, value: float, statistic=None, threshold=None, magnitude=None) -> dict:
+    """
+    One detector's verdict. `magnitude` is how far past its threshold the point
+    landed, in the detector's own units (IQRs, standard deviations); it is > 0
+    exactly when the detector fired and None while there is not enough history.
+    """
+    fired = magnitude is not None and magnitude > 0
+    return {
+        "detector": name,
+        "fired": fired,
+        "value": value,
+        "statistic": statistic,
+        "threshold": threshold,
+        "magnitude": magnitude,
+    }
+
+
+def _prefix_moments(values: np.ndarray):
+    """Running sums of x and x², with a leading zero, so any window's mean/variance is two subtractions."""
+    sums = np.concatenate(([0.0], np.cumsum(values)))
+    squares = np.concatenate(([0.0], np.cumsum(values * values)))
+    return sums, squares
+
+
+def _moments(count, total, total_sq):
+    """Mean and sample standard deviation from window sums; works on floats and arrays alike."""
+    mean = total / count
+    variance = (total_sq - total * total / count) / (count - 1)
+    return mean, np.sqrt(np.maximum(variance, 0.0))
+
+
+class IQRDetector:
+    """
+    The original rule: flag a score more than IQR_MULTIPLIER interquartile ranges
+    below the first quartile of the user's history. State is the incremental
+    baseline from baseline.py, so checks are O(1) reads.
+    """
+
+    name = "iqr"
+
+    def __init__(self, multiplier: float = IQR_MULTIPLIER, mode: str = BASELINE_MODE, window: int = BASELINE_WINDOW):
+        self.multiplier = multiplier
+        self.mode = mode
+        self.window = window
+
+    def new_state(self):
+        return new_baseline(self.mode, self.window)
+
+    def update(self, state, value: float):
+        state.add(value)
+
+    def check(self, state, value: float) -> dict:
+        if state.count < ANOMALY_MIN_HISTORY:
+            return detector_result(self.name, value)
+        q1, q3 = state.quantile(0.25), state.quantile(0.75)
+        return self._verdict(value, q1, q3)
+
+    def _verdict(self, value, q1, q3) -> dict:
+        iqr = q3 - q1
+        lower_bound = q1 - self.multiplier * iqr
+        # With a flat history any drop below it counts, measured in score units
+        magnitude = (lower_bound - value) / iqr if iqr > 0 else lower_bound - value
+        return detector_result(self.name, value, statistic=value, threshold=lower_bound, magnitude=magnitude)
+
+    def score_history(self, values: np.ndarray):
+        """Magnitudes for every point against the points before it (NaN where not scored)."""
+        magnitudes = np.full(len(values), np.nan)
+        if self.mode == "exact" and self.window:
+            # Fixed-size windows: one vectorized quantile call per chunk of rows
+            first = max(self.window, ANOMALY_MIN_HISTORY)
+            self._score_sequentially(values, magnitudes, stop=min(first, len(values)))
+            if len(values) > first:
+                windows = np.lib.stride_tricks.sliding_window_view(values[:-1], self.window)[first - self.window:]
+                for offset in range(0, len(windows), HISTORY_CHUNK_SIZE):
+                    rows = windows[offset:offset + HISTORY_CHUNK_SIZE]
+                    q1, q3 = np.quantile(rows, [0.25, 0.75], axis=1)
+                    iqr = q3 - q1
+                    lower_bound = q1 - self.multiplier * iqr
+                    points = values[first + offset:first + offset + len(rows)]
+                    with np.errstate(divide="ignore", invalid="ignore"):
+                        magnitude = np.where(iqr > 0, (lower_bound - points) / iqr, lower_bound - points)
+                    magnitudes[first + offset:first + offset + len(rows)] = magnitude
+        else:
+            # Expanding quantiles have no vectorized form; replay the incremental baseline instead
+            self._score_sequentially(values, magnitudes, stop=len(values))
+        return magnitudes
+
+    def _score_sequentially(self, values, magnitudes, stop):
+        state = self.new_state()
+        for index in range(stop):
+            magnitude = self.check(state, float(values[index]))["magnitude"]
+            magnitudes[index] = np.nan if magnitude is None else magnitude
+            state.add(float(values[index]))
+
+
+class RollingMomentsState:
+    """Running sums plus the sums as they stood ZSCORE_WINDOW points ago."""
+
+    def __init__(self, window: int):
+        self.count = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.prefix = deque([(0.0, 0.0)], maxlen=window + 1)
+
+    def copy(self) -> "RollingMomentsState":
+        clone = RollingMomentsState(self.prefix.maxlen - 1)
+        clone.count, clone.total, clone.total_sq = self.count, self.total, self.total_sq
+        clone.prefix = deque(self.prefix, maxlen=self.prefix.maxlen)
+        return clone
+
+
+class RollingZScoreDetector:
+    """Flags a point more than ZSCORE_THRESHOLD standard deviations below the mean of the last ZSCORE_WINDOW points."""
+
+    name = "zscore"
+
+    def __init__(self, window: int = ZSCORE_WINDOW, threshold: float = ZSCORE_THRESHOLD):
+        self.window = max(2, window)
+        self.threshold = threshold
+
+    def new_state(self) -> RollingMomentsState:
+        return RollingMomentsState(self.window)
+
+    def update(self, state: RollingMomentsState, value: float):
+        state.count += 1
+        state.total += value
+        state.total_sq += value * value
+        state.prefix.append((state.total, state.total_sq))
+
+    def check(self, state: RollingMomentsState, value: float) -> dict:
+        in_window = len(state.prefix) - 1
+        if state.count < ANOMALY_MIN_HISTORY or in_window < 2:
+            return detector_result(self.name, value)
+        start_total, start_sq = state.prefix[0]
+        mean, std = _moments(in_window, state.total - start_total, state.total_sq - start_sq)
+        if std <= 0:
+            return detector_result(self.name, value)
+        z = float((value - mean) / std)
+        return detector_result(self.name, value, statistic=z, threshold=-self.threshold, magnitude=-z - self.threshold)
+
+    def score_history(self, values: np.ndarray):
+        sums, squares = _prefix_moments(values)
+        positions = np.arange(len(values))
+        starts = np.maximum(positions - self.window, 0)
+        counts = positions - starts
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean, std = _moments(counts, sums[positions] - sums[starts], squares[positions] - squares[starts])
+            magnitudes = -(values - mean) / std - self.threshold
+        scored = (positions >= ANOMALY_MIN_HISTORY) & (counts >= 2) & (std > 0)
+        return np.where(scored, magnitudes, np.nan)
+
+
+class EWMAState:
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.variance = 0.0
+
+    def copy(self) -> "EWMAState":
+        clone = EWMAState()
+        clone.count, clone.mean, clone.variance = self.count, self.mean, self.variance
+        return clone
+
+
+class EWMADetector:
+    """
+    EWMA control chart for individual check-ins: the centre line is an
+    exponentially weighted mean of the history and the lower control limit sits
+    EWMA_THRESHOLD exponentially weighted standard deviations below it.
+    """
+
+    name = "ewma"
+
+    def __init__(self, alpha: float = EWMA_ALPHA, threshold: float = EWMA_THRESHOLD):
+        self.alpha = alpha
+        self.threshold = threshold
+
+    def new_state(self) -> EWMAState:
+        return EWMAState()
+
+    def update(self, state: EWMAState, value: float):
+        if state.count == 0:
+            state.mean = value
+        else:
+            deviation = value - state.mean
+            state.mean = (1 - self.alpha) * state.mean + self.alpha * value
+            state.variance = (1 - self.alpha) * state.variance + self.alpha * ((1 - self.alpha) * deviation * deviation)
+        state.count += 1
+
+    def check(self, state: EWMAState, value: float) -> dict:
+        if state.count < ANOMALY_MIN_HISTORY or state.variance <= 0:
+            return detector_result(self.name, value)
+        sigma = math.sqrt(state.variance)
+        limit = state.mean - self.threshold * sigma
+        return detector_result(self.name, value, statistic=state.mean, threshold=limit, magnitude=(limit - value) / sigma)
+
+    def score_history(self, values: np.ndarray):
+        """Same recursions as update(), run by pandas' compiled EWM (equal up to float rounding)."""
+        import pandas as pd
+
+        if not len(values):
+            return np.array([])
+        means = pd.Series(values).ewm(alpha=self.alpha, adjust=False).mean().to_numpy()
+        # Each point's deviation from the mean of the points before it
+        deviations = np.concatenate(([0.0], values[1:] - means[:-1]))
+        variances = pd.Series((1 - self.alpha) * deviations * deviations).ewm(alpha=self.alpha, adjust=False).mean().to_numpy()
+
+        prior_mean = np.concatenate(([np.nan], means[:-1]))
+        prior_variance = np.concatenate(([np.nan], variances[:-1]))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            sigma = np.sqrt(prior_variance)
+            magnitudes = (prior_mean - self.threshold * sigma - values) / sigma
+        scored = (np.arange(len(values)) >= ANOMALY_MIN_HISTORY) & (prior_variance > 0)
+        return np.where(scored, magnitudes, np.nan)
+
+
+class CUSUMState:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+        # Lower CUSUM as (cumulative increments) - (their running minimum since the last alarm)
+        self.cumulative = 0.0
+        self.floor = 0.0
+
+    @property
+    def statistic(self) -> float:
+        return self.cumulative - self.floor
+
+    def copy(self) -> "CUSUMState":
+        clone = CUSUMState()
+        clone.count, clone.total, clone.total_sq = self.count, self.total, self.total_sq
+        clone.cumulative, clone.floor = self.cumulative, self.floor
+        return clone
+
+
+class CUSUMDetector:
+    """
+    Tabular lower CUSUM for sustained downward shifts (change points). Each
+    check-in adds its standardized drop below the historical mean, less the
+    CUSUM_K allowance; the detector fires when the sum crosses CUSUM_H and then
+    restarts from zero.
+    """
+
+    name = "cusum"
+
+    def __init__(self, allowance: float = CUSUM_K, decision_interval: float = CUSUM_H):
+        self.allowance = allowance
+        self.decision_interval = decision_interval
+
+    def new_state(self) -> CUSUMState:
+        return CUSUMState()
+
+    def _increment(self, state: CUSUMState, value: float) -> float:
+        if state.count < ANOMALY_MIN_HISTORY:
+            return 0.0
+        mean, std = _moments(state.count, state.total, state.total_sq)
+        if std <= 0:
+            return 0.0
+        return float((mean - value) / std - self.allowance)
+
+    def check(self, state: CUSUMState, value: float) -> dict:
+        if state.count < ANOMALY_MIN_HISTORY:
+            return detector_result(self.name, value)
+        cumulative = state.cumulative + self._increment(state, value)
+        statistic = cumulative - min(state.floor, cumulative)
+        return detector_result(
+            self.name, value, statistic=statistic, threshold=self.decision_interval,
+            magnitude=statistic - self.decision_interval,
+        )
+
+    def update(self, state: CUSUMState, value: float):
+        state.cumulative += self._increment(state, value)
+        state.floor = min(state.floor, state.cumulative)
+        if state.statistic > self.decision_interval:
+            state.floor = state.cumulative
+        state.count += 1
+        state.total += value
+        state.total_sq += value * value
+
+    def score_history(self, values: np.ndarray):
+        sums, squares = _prefix_moments(values)
+        positions = np.arange(len(values))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean, std = _moments(positions, sums[:-1], squares[:-1])
+            increments = (mean - values) / std - self.allowance
+        scored = (positions >= ANOMALY_MIN_HISTORY) & (std > 0)
+        increments = np.where(scored, increments, 0.0)
+        cumulative = np.cumsum(increments)
+
+        # Lindley recursion as cumsum minus running minimum; restart after every alarm
+        statistics = np.empty(len(values))
+        start, floor = 0, 0.0
+        while start < len(values):
+            tail = cumulative[start:]
+            running_floor = np.minimum.accumulate(np.minimum(tail, floor))
+            segment = tail - running_floor
+            alarms = np.flatnonzero(segment > self.decision_interval)
+            end = start + alarms[0] + 1 if len(alarms) else len(values)
+            statistics[start:end] = segment[:end - start]
+            floor = cumulative[end - 1] if len(alarms) else floor
+            start = end
+        return np.where(positions >= ANOMALY_MIN_HISTORY, statistics - self.decision_interval, np.nan)
+
+
+# Detectors selectable through ANOMALY_DETECTORS; add new ones here
+DETECTORS = {
+    IQRDetector.name: IQRDetector,
+    RollingZScoreDetector.name: RollingZScoreDetector,
+    EWMADetector.name: EWMADetector,
+    CUSUMDetector.name: CUSUMDetector,
+}
+
+
+def build_detectors(names) -> list:
+    if isinstance(names, str):
+        names = [name.strip() for name in names.split(",") if name.strip()]
+    unknown = [name for name in names if name not in DETECTORS]
+    if unknown or not names:
+        raise ValueError(f"Unknown anomaly detector(s): {', '.join(unknown) or '(none)'}. Available: {', '.join(DETECTORS)}")
+    return [DETECTORS[name]() for name in names]
+
+
+class AnomalyState:
+    """One user's state for every configured detector. Adding a score is O(1) per detector (O(log n) for exact IQR)."""
+
+    def __init__(self, detectors: list, states: Optional[list] = None):
+        self._detectors = detectors
+        self._states = states if states is not None else [detector.new_state() for detector in detectors]
+        self.count = 0
+
+    def add(self, score: float):
+        score = float(score)
+        for detector, state in zip(self._detectors, self._states):
+            detector.update(state, score)
+        self.count += 1
+
+    def copy(self) -> "AnomalyState":
+        """Independent copy, e.g. for scoring a batch before it is committed."""
+        clone = AnomalyState(self._detectors, [state.copy() for state in self._states])
+        clone.count = self.count
+        return clone
+
+    def check(self, score: float) -> List[dict]:
+        return [detector.check(state, float(score)) for detector, state in zip(self._detectors, self._states)]
+
+
+def fired_magnitudes(report: dict) -> dict:
+    """{detector: magnitude} for the detectors that fired; this is what check-in documents store."""
+    return {result["detector"]: result["magnitude"] for result in report["detectors"] if result["fired"]}
+
+
+class AnomalyEngine:
+    """Runs a set of detectors, either against stored per-user state or over a whole history at once."""
+
+    def __init__(self, detectors: list):
+        self.detectors = detectors
+
+    @property
+    def names(self) -> List[str]:
+        return [detector.name for detector in self.detectors]
+
+    def new_state(self) -> AnomalyState:
+        return AnomalyState(self.detectors)
+
+    def check(self, state: Optional[AnomalyState], score: float) -> dict:
+        """
+        Scores one new check-in against a user's state without changing it.
+        Returns {"is_anomaly", "fired": [detector names], "detectors": [per-detector results]}.
+        """
+        results = state.check(score) if state is not None else [detector_result(name, score) for name in self.names]
+        fired = [result["detector"] for result in results if result["fired"]]
+        if fired:
+            details = ", ".join(f"{result['detector']} +{result['magnitude']:.2f}" for result in results if result["fired"])
+            print(f"ANOMALY DETECTED! New Score ({score:.2f}) flagged by {details}")
+        return {"is_anomaly": bool(fired), "fired": fired, "detectors": results}
+
+    def score_history(self, scores: Iterable[float]) -> Dict[str, np.ndarray]:
+        """
+        Scores every check-in of a chronologically ordered history against the
+        ones before it, in one vectorized pass per detector. Returns per-detector
+        magnitude arrays (NaN where not scored) plus the combined `is_anomaly` mask;
+        the verdicts match what check() would have said at each point in time.
+        """
+        values = np.asarray(list(scores), dtype=float)
+        report = {}
+        is_anomaly = np.zeros(len(values), dtype=bool)
+        for detector in self.detectors:
+            magnitudes = detector.score_history(values)
+            report[detector.name] = magnitudes
+            is_anomaly |= np.nan_to_num(magnitudes, nan=0.0) > 0
+        report["is_anomaly"] = is_anomaly
+        return report
+
+
+anomaly_engine = AnomalyEngine(build_detectors(ANOMALY_DETECTORS))
+
+# Per-user detector state, shared by the database layer and the anomaly check. Re-seeded
+# when another process (pre-forked worker, job worker, import script) writes the user's history
+baseline_store = BaselineStore(anomaly_engine.new_state, version_of=user_versions.get)
+on_local_bump(baseline_store.acknowledge)
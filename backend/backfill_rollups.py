@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Rebuild the day/week/month trend rollups from the stored check-ins.
+
+New check-ins update their rollups as they are inserted; run this once after
+upgrading to fill in existing history, or any time the rollups need repairing.
+Entries are streamed per user in timestamp order (the user_timestamp index),
+so memory stays bounded by one user's bucket count rather than their history.
+
+Each user's rollups are replaced wholesale, so check-ins written for that user
+while the backfill is reading them may be missed; run it during quiet hours or
+re-run it for the affected users.
+
+Usage:
+    python backfill_rollups.py
+    python backfill_rollups.py --user-id alice
+"""
+
+import argparse
+import time
+
+from database import (
+    close_mongo_connection, ensure_indexes, get_mongo_collection, get_rollup_collection, TIMELINE_BATCH_SIZE,
+)
+from rollups import accumulate, rollup_documents
+from versions import bump_user_versions
+
+# Only the fields the rollups aggregate leave the database
+ROLLUP_SOURCE_PROJECTION = {"user_id": 1, "timestamp": 1, "sentiment_score": 1, "anomaly_flag": 1, "keyword_terms": 1, "_id": 0}
+
+
+def replace_user_rollups(user_id, partials):
+    """Swaps one user's stored rollups for freshly computed ones."""
+    rollups = get_rollup_collection()
+    rollups.delete_many({"user_id": user_id})
+    documents = rollup_documents(partials)
+    if documents:
+        rollups.insert_many(documents, ordered=False)
+    bump_user_versions(user_id)
+    return len(documents)
+
+
+def backfill_rollups(user_id=None, batch_size=TIMELINE_BATCH_SIZE):
+    """Rebuilds rollups for one user, or for every user when user_id is None."""
+    ensure_indexes()
+    collection = get_mongo_collection()
+    query = {"user_id": user_id} if user_id else {}
+    cursor = collection.find(query, ROLLUP_SOURCE_PROJECTION)
+    cursor = cursor.sort([("user_id", 1), ("timestamp", 1)]).batch_size(batch_size)
+
+    started = time.perf_counter()
+    totals = {"users": 0, "entries": 0, "rollups": 0}
+    current_user, partials = None, {}
+
+    def flush():
+        written = replace_user_rollups(current_user, partials)
+        totals["users"] += 1
+        totals["rollups"] += written
+        elapsed = time.perf_counter() - started
+        print(f"  {current_user}: {written} rollups ({totals['entries']} entries so far, {elapsed:.1f}s)")
+
+    for entry in cursor:
+        if entry["user_id"] != current_user:
+            if current_user is not None:
+                flush()
+            current_user, partials = entry["user_id"], {}
+        accumulate([entry], partials)
+        totals["entries"] += 1
+
+    if current_user is not None:
+        flush()
+
+    print(f"Done: {totals['rollups']} rollups for {totals['users']} users from {totals['entries']} entries")
+    return totals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild trend rollups from the stored check-ins")
+    parser.add_argument("--user-id", help="Only rebuild this user's rollups (default: every user)")
+    parser.add_argument("--batch-size", type=int, default=TIMELINE_BATCH_SIZE, help="Documents fetched per MongoDB round trip")
+    args = parser.parse_args()
+
+    try:
+        backfill_rollups(user_id=args.user_id, batch_size=args.batch_size)
+    finally:
+        close_mongo_connection()
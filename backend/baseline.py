@@ -0,0 +1,256 @@
+# baseline.py
+import bisect
+import copy
+import os
+import threading
+from array import array
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+# --- Configuration ---
+# "exact" keeps every score (or the last BASELINE_WINDOW scores) in sorted order and
+# reproduces the pandas IQR rule exactly. "sketch" keeps constant-size P² quantile
+# estimators instead, trading exactness for O(1) memory per baseline.
+BASELINE_MODE = os.environ.get("BASELINE_MODE", "exact")
+# Only used in exact mode. 0 means "all history", which matches the original rule.
+BASELINE_WINDOW = int(os.environ.get("BASELINE_WINDOW", "0"))
+# ---------------------
+
+
+def _lerp(low: float, high: float, t: float) -> float:
+    """Linear interpolation done the same way as numpy, so quantiles match pandas bit-for-bit."""
+    diff = high - low
+    if t >= 0.5:
+        return high - diff * (1 - t)
+    return low + diff * t
+
+
+class ExactBaseline:
+    """
+    Sorted score buffer with O(1) quantile reads.
+    Inserts are a binary search plus a memmove; with a window, the oldest
+    score is dropped from both the arrival ring and the sorted buffer.
+    Both are float64 arrays, 8 bytes per score, where a list costs a pointer
+    plus a 24-byte float object per score, for every seeded user.
+    """
+
+    def __init__(self, window: int = 0):
+        self.window = window
+        self._sorted = array("d")
+        # Ring of the last `window` scores in arrival order; _oldest is the next slot to overwrite
+        self._arrivals = array("d")
+        self._oldest = 0
+
+    @property
+    def count(self) -> int:
+        return len(self._sorted)
+
+    def add(self, score: float):
+        score = float(score)
+        bisect.insort(self._sorted, score)
+        if self.window:
+            if len(self._arrivals) < self.window:
+                self._arrivals.append(score)
+                return
+            oldest = self._arrivals[self._oldest]
+            self._arrivals[self._oldest] = score
+            self._oldest = (self._oldest + 1) % self.window
+            del self._sorted[bisect.bisect_left(self._sorted, oldest)]
+
+    def quantile(self, q: float) -> float:
+        """Linear-interpolated quantile, the pandas/numpy default."""
+        if not self._sorted:
+            return float("nan")
+        position = (len(self._sorted) - 1) * q
+        low = int(position)
+        high = min(low + 1, len(self._sorted) - 1)
+        return _lerp(self._sorted[low], self._sorted[high], position - low)
+
+    def copy(self) -> "ExactBaseline":
+        """Independent copy, e.g. for scoring a batch before it is committed."""
+        clone = ExactBaseline(self.window)
+        clone._sorted = array("d", self._sorted)
+        clone._arrivals = array("d", self._arrivals)
+        clone._oldest = self._oldest
+        return clone
+
+
+class P2Quantile:
+    """Jain & Chlamtac P² streaming estimator for a single quantile (five markers, O(1) update)."""
+
+    def __init__(self, q: float):
+        self.q = q
+        self._initial = []
+        self._heights = []
+        self._positions = []
+        self._desired = []
+        self._increments = [0.0, q / 2, q, (1 + q) / 2, 1.0]
+
+    def add(self, x: float):
+        x = float(x)
+        if len(self._initial) < 5:
+            bisect.insort(self._initial, x)
+            if len(self._initial) == 5:
+                self._heights = list(self._initial)
+                self._positions = [1, 2, 3, 4, 5]
+                q = self.q
+                self._desired = [1, 1 + 2 * q, 1 + 4 * q, 3 + 2 * q, 5]
+            return
+
+        h, n = self._heights, self._positions
+        if x < h[0]:
+            h[0] = x
+            k = 0
+        elif x >= h[4]:
+            h[4] = x
+            k = 3
+        else:
+            k = bisect.bisect_right(h, x) - 1
+            k = min(max(k, 0), 3)
+
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self._desired[i] += self._increments[i]
+
+        # Adjust the three middle markers towards their desired positions
+        for i in range(1, 4):
+            d = self._desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                step = 1 if d > 0 else -1
+                candidate = self._parabolic(i, step)
+                if not h[i - 1] < candidate < h[i + 1]:
+                    candidate = h[i] + step * (h[i + step] - h[i]) / (n[i + step] - n[i])
+                h[i] = candidate
+                n[i] += step
+
+    def _parabolic(self, i: int, d: int) -> float:
+        h, n = self._heights, self._positions
+        return h[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (h[i + 1] - h[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - d) * (h[i] - h[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    def value(self) -> float:
+        if len(self._initial) < 5:
+            if not self._initial:
+                return float("nan")
+            position = (len(self._initial) - 1) * self.q
+            low = int(position)
+            high = min(low + 1, len(self._initial) - 1)
+            return _lerp(self._initial[low], self._initial[high], position - low)
+        return self._heights[2]
+
+
+class SketchBaseline:
+    """Approximate baseline backed by one P² estimator per tracked quantile."""
+
+    def __init__(self, quantiles: Iterable[float] = (0.25, 0.75)):
+        self._estimators = {q: P2Quantile(q) for q in quantiles}
+        self._count = 0
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    def add(self, score: float):
+        self._count += 1
+        for estimator in self._estimators.values():
+            estimator.add(score)
+
+    def quantile(self, q: float) -> float:
+        if q not in self._estimators:
+            raise ValueError(f"Sketch baseline does not track quantile {q}")
+        return self._estimators[q].value()
+
+    def copy(self) -> "SketchBaseline":
+        """Independent copy; the estimators are a handful of floats each."""
+        return copy.deepcopy(self)
+
+
+def new_baseline(mode: str = BASELINE_MODE, window: int = BASELINE_WINDOW):
+    """Returns an empty exact or sketch quantile baseline."""
+    if mode not in ("exact", "sketch"):
+        raise ValueError(f"Unknown BASELINE_MODE '{mode}', expected 'exact' or 'sketch'")
+    if mode == "sketch":
+        return SketchBaseline()
+    return ExactBaseline(window)
+
+
+class BaselineStore:
+    """
+    Keeps one baseline per user id up to date as check-ins are inserted.
+    A key is seeded from stored history, after which every insert is an
+    incremental update and every anomaly check is a constant-time read.
+    `factory` builds an empty baseline: anything with count, add() and copy().
+
+    Only inserts made by this process reach its baselines. With `version_of`
+    (a shared per-key data version, see versions.py), each baseline remembers
+    the version it was seeded at. It counts as loaded only while that version
+    is current, so writes by other workers, job processes or scripts cause a
+    re-seed. This process's own bumps are passed to acknowledge() and don't.
+    """
+
+    def __init__(self, factory: Callable[[], object] = new_baseline,
+                 version_of: Optional[Callable[[str], int]] = None):
+        self._new_baseline = factory
+        self._version_of = version_of
+        self._baselines = {}
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def version(self, key: str) -> Optional[int]:
+        """The key's shared data version. Read it before loading the history to seed from."""
+        return self._version_of(key) if self._version_of is not None else None
+
+    def is_loaded(self, key: str) -> bool:
+        if key not in self._baselines:
+            return False
+        return self._version_of is None or self._versions.get(key) == self._version_of(key)
+
+    def build(self, scores: Iterable[float]):
+        """A baseline of chronologically ordered scores that is not cached under any key."""
+        baseline = self._new_baseline()
+        for score in scores:
+            baseline.add(score)
+        return baseline
+
+    def seed(self, key: str, scores: Iterable[float], version: Optional[int] = None):
+        """Builds a baseline from chronologically ordered historical scores, read at `version`."""
+        baseline = self.build(scores)
+        with self._lock:
+            self._baselines[key] = baseline
+            self._versions[key] = version
+
+    def acknowledge(self, changes: Dict[str, Tuple[int, int]]):
+        """
+        Takes this process's own version bumps ({key: (before, after)}); their
+        writes have already been added here. A baseline that was current before
+        the bump stays current. One that had already missed another process's
+        write stays stale.
+        """
+        with self._lock:
+            for key, (before, after) in changes.items():
+                if key in self._versions and self._versions[key] == before:
+                    self._versions[key] = after
+
+    def add(self, key: str, score: float):
+        """Records a newly inserted score. Keys that were never seeded are skipped;
+        they will pick the score up from storage when they are first read."""
+        with self._lock:
+            baseline = self._baselines.get(key)
+            if baseline is not None:
+                baseline.add(score)
+
+    def get(self, key: str) -> Optional[object]:
+        return self._baselines.get(key)
+
+    def reset(self, key: Optional[str] = None):
+        """Drops cached baselines so they are re-seeded on next use."""
+        with self._lock:
+            if key is None:
+                self._baselines.clear()
+                self._versions.clear()
+            else:
+                self._baselines.pop(key, None)
+                self._versions.pop(key, None)
+
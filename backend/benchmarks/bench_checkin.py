@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Benchmark and load-test harness for the check-in pipeline.
+
+Runs fully offline: MongoDB is replaced by mongomock (or a local mongod via
+--mongo-uri) and the sentiment model by a deterministic stub with a configurable
+per-batch latency (or the real model via --model real). Every (storage, endpoint,
+history size) scenario runs in a fresh process so peak RSS is measured per scenario.
+--storage mongo,sqlite runs each scenario against both storage backends; SQLite
+scenarios use a fresh database file in a temporary directory.
+
+Usage:
+    python benchmarks/bench_checkin.py --history 10,1000,10000 --concurrency 16
+    python benchmarks/bench_checkin.py --storage mongo,sqlite --history 1000,100000
+    python benchmarks/bench_checkin.py --save-baseline benchmarks/baselines/local.json
+    python benchmarks/bench_checkin.py --compare benchmarks/baselines/local.json --tolerance 0.25
+"""
+
+import argparse
+import asyncio
+import datetime
+import hashlib
+import json
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENDPOINTS = {
+    "checkin": ("POST", "/checkin"),
+    "timeline": ("GET", "/timeline"),
+    "timeline_page": ("GET", "/timeline?limit=100&fields=sentiment_score,anomaly_flag"),
+    "trends": ("GET", "/trends?granularity=day"),
+}
+
+SAMPLE_TEXTS = [
+    "Today was a really good day! I felt productive and accomplished a lot of my goals.",
+    "Feeling a bit overwhelmed with work lately. There's so much to do and not enough time.",
+    "Had a great conversation with my friend today and I feel excited about what's next.",
+    "I'm struggling with some personal issues and feeling quite down.",
+    "Today was an average day. Nothing particularly exciting happened, but nothing bad either.",
+]
+
+
+class StubTokenizer:
+    """Whitespace tokenizer with a RoBERTa-sized limit, enough for nlp_model's long-entry chunking."""
+
+    model_max_length = 512
+
+    def num_special_tokens_to_add(self, pair=False):
+        return 2
+
+    def __call__(self, text, add_special_tokens=False, **kwargs):
+        return {"input_ids": text.split()}
+
+    def decode(self, ids, **kwargs):
+        return " ".join(ids)
+
+
+class StubPipeline:
+    """Deterministic stand-in for the transformers pipeline with a fixed cost per forward pass."""
+
+    def __init__(self, latency_ms):
+        self.latency = latency_ms / 1000.0
+        self.tokenizer = StubTokenizer()
+
+    def __call__(self, texts, batch_size=1, **kwargs):
+        if isinstance(texts, str):
+            texts = [texts]
+        time.sleep(self.latency)
+        results = []
+        for text in texts:
+            digest = hashlib.sha1(text.encode("utf-8")).digest()
+            label = ("negative", "neutral", "positive")[digest[0] % 3]
+            results.append({"label": label, "score": 0.5 + digest[1] / 512.0})
+        return results
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(p * len(sorted_values)))]
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024.0 * 1024.0) if sys.platform == "darwin" else peak / 1024.0
+
+
+async def seed_history(history, user_id):
+    """Inserts `history` synthetic check-ins spread over the past days, in chunks, with their rollups."""
+    from storage import insert_checkin_entries_async
+    rng = random.Random(42)
+    now = datetime.datetime.now()
+    chunk = []
+    for index in range(history):
+        chunk.append({
+            "user_id": user_id,
+            "timestamp": now - datetime.timedelta(minutes=history - index),
+            "user_text": SAMPLE_TEXTS[index % len(SAMPLE_TEXTS)],
+            "sentiment_score": rng.random(),
+            "keyword_intensity": rng.random(),
+            "anomaly_flag": False,
+        })
+        if len(chunk) == 5000:
+            await insert_checkin_entries_async(chunk)
+            chunk = []
+    if chunk:
+        await insert_checkin_entries_async(chunk)
+
+
+async def drive(storage, endpoint, history, options):
+    import httpx
+    import database_async
+    import main
+    import nlp_model
+
+    if options["mongo_uri"]:
+        database_async.MONGO_URI = options["mongo_uri"]
+    else:
+        import mongomock_motor
+        database_async.AsyncIOMotorClient = lambda *args, **kwargs: mongomock_motor.AsyncMongoMockClient()
+
+    if options["model"] == "stub":
+        nlp_model.sentiment_pipeline = StubPipeline(options["model_latency_ms"])
+        nlp_model.global_labels = {0: "negative", 1: "neutral", 2: "positive"}
+        nlp_model.model_status = "ready"
+
+    user_id = "bench-user"
+    method, path = ENDPOINTS[endpoint]
+    separator = "&" if "?" in path else "?"
+    url = f"{path}{separator}user_id={user_id}" if method == "GET" else path
+
+    # The SQLite file is new for each scenario; only a real MongoDB holds earlier runs' documents
+    clean_mongo = storage == "mongo" and options["mongo_uri"]
+    async with main.lifespan(main.app):
+        if clean_mongo:
+            await database_async.get_async_collection().delete_many({"user_id": user_id})
+            await database_async.get_async_rollup_collection().delete_many({"user_id": user_id})
+        seed_start = time.perf_counter()
+        await seed_history(history, user_id)
+        seed_seconds = time.perf_counter() - seed_start
+
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            semaphore = asyncio.Semaphore(options["concurrency"])
+            latencies = []
+            errors = 0
+
+            async def one_request(index):
+                nonlocal errors
+                async with semaphore:
+                    started = time.perf_counter()
+                    if method == "POST":
+                        text = f"{SAMPLE_TEXTS[index % len(SAMPLE_TEXTS)]} (#{index})"
+                        response = await client.post(url, json={"user_text": text, "user_id": user_id})
+                    else:
+                        response = await client.get(url)
+                        await response.aread()
+                    latencies.append((time.perf_counter() - started) * 1000.0)
+                    if response.status_code != 200:
+                        errors += 1
+
+            wall_start = time.perf_counter()
+            await asyncio.gather(*(one_request(index) for index in range(options["requests"])))
+            wall_seconds = time.perf_counter() - wall_start
+
+        if clean_mongo:
+            await database_async.get_async_collection().delete_many({"user_id": user_id})
+            await database_async.get_async_rollup_collection().delete_many({"user_id": user_id})
+
+    latencies.sort()
+    return {
+        "storage": storage,
+        "endpoint": endpoint,
+        "history": history,
+        "requests": options["requests"],
+        "concurrency": options["concurrency"],
+        "errors": errors,
+        "seed_seconds": round(seed_seconds, 3),
+        "p50_ms": round(percentile(latencies, 0.50), 3),
+        "p95_ms": round(percentile(latencies, 0.95), 3),
+        "p99_ms": round(percentile(latencies, 0.99), 3),
+        "throughput_rps": round(options["requests"] / wall_seconds, 2) if wall_seconds > 0 else 0.0,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def run_scenario(storage, endpoint, history, options, results):
+    """Entry point of each scenario's child process."""
+    sys.path.insert(0, BACKEND_DIR)
+    # Read by storage.py when main is imported, so it must be set before drive() imports it
+    os.environ["STORAGE_BACKEND"] = storage
+    scratch = tempfile.TemporaryDirectory(prefix="bench-checkin-")
+    os.environ["SQLITE_PATH"] = os.path.join(scratch.name, "checkins.sqlite3")
+    os.environ.setdefault("USER_VERSION_PATH", os.path.join(scratch.name, "user_versions.bin"))
+    os.environ.setdefault("MODEL_LOAD_MODE", "lazy")
+    # The sentiment cache would turn repeated texts into free hits; measure the model path
+    os.environ.setdefault("SENTIMENT_CACHE_SIZE", "0")
+    # Keep the pipeline's per-entry prints out of the measurements
+    sys.stdout = open(os.devnull, "w")
+    try:
+        results.put(asyncio.run(drive(storage, endpoint, history, options)))
+    except Exception as e:
+        results.put({"storage": storage, "endpoint": endpoint, "history": history, "error": repr(e)})
+    finally:
+        scratch.cleanup()
+
+
+def run_all(storages, endpoints, histories, options):
+    context = multiprocessing.get_context("spawn")
+    rows = []
+    for history in histories:
+        for endpoint in endpoints:
+            for storage in storages:
+                results = context.Queue()
+                process = context.Process(target=run_scenario, args=(storage, endpoint, history, options, results))
+                process.start()
+                row = results.get()
+                process.join()
+                if "error" in row:
+                    raise RuntimeError(f"{endpoint} on {storage} with history={history} failed: {row['error']}")
+                rows.append(row)
+                print(
+                    f"{row['storage']:<6} {row['endpoint']:<14} history={row['history']:<8} p50={row['p50_ms']:>9.2f}ms "
+                    f"p95={row['p95_ms']:>9.2f}ms p99={row['p99_ms']:>9.2f}ms "
+                    f"{row['throughput_rps']:>9.1f} req/s rss={row['peak_rss_mb']:>7.1f}MB errors={row['errors']}"
+                )
+    return rows
+
+
+def compare_to_baseline(rows, baseline_path, tolerance, min_delta_ms):
+    """
+    Returns the list of regressions: p95 latency, throughput or peak RSS worse than the
+    baseline by more than `tolerance`. Latency changes under `min_delta_ms` are treated as noise.
+    Scenarios the baseline has no entry for (e.g. a storage backend added since) are listed
+    and skipped, not counted as regressions.
+    """
+    with open(baseline_path, encoding="utf-8") as handle:
+        # Baselines saved before --storage existed were all MongoDB runs
+        baseline = {(row.get("storage", "mongo"), row["endpoint"], row["history"]): row for row in json.load(handle)["results"]}
+
+    regressions = []
+    for row in rows:
+        scenario = f"{row['storage']} {row['endpoint']} history={row['history']}"
+        previous = baseline.get((row["storage"], row["endpoint"], row["history"]))
+        if previous is None:
+            print(f"Not in baseline, skipped: {scenario}")
+            continue
+        if row["p95_ms"] > previous["p95_ms"] * (1 + tolerance) and row["p95_ms"] - previous["p95_ms"] > min_delta_ms:
+            regressions.append(f"{scenario}: p95 {previous['p95_ms']}ms -> {row['p95_ms']}ms")
+        if row["throughput_rps"] < previous["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{scenario}: throughput {previous['throughput_rps']} -> {row['throughput_rps']} req/s")
+        if row["peak_rss_mb"] > previous["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(f"{scenario}: peak RSS {previous['peak_rss_mb']}MB -> {row['peak_rss_mb']}MB")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark /checkin and /timeline against a local MongoDB stand-in or SQLite")
+    parser.add_argument("--history", default="10,1000,10000", help="Comma-separated history sizes to seed (up to 1000000)")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help=f"Comma-separated subset of: {', '.join(ENDPOINTS)}")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight at once")
+    parser.add_argument("--model", choices=("stub", "real"), default="stub", help="Stubbed pipeline or the configured model")
+    parser.add_argument("--model-latency-ms", type=float, default=5.0, help="Stub forward-pass cost per batch")
+    parser.add_argument("--storage", default="mongo", help="Comma-separated storage backends to run each scenario on: mongo, sqlite")
+    parser.add_argument("--mongo-uri", help="Use this MongoDB instead of mongomock (bench documents are cleaned up)")
+    parser.add_argument("--save-baseline", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Baseline JSON to compare against; exits 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression when comparing")
+    parser.add_argument("--min-delta-ms", type=float, default=5.0, help="Ignore p95 changes smaller than this")
+    args = parser.parse_args()
+
+    endpoints = [name.strip() for name in args.endpoints.split(",") if name.strip()]
+    unknown = [name for name in endpoints if name not in ENDPOINTS]
+    if unknown:
+        parser.error(f"Unknown endpoint(s): {', '.join(unknown)}")
+    storages = [name.strip() for name in args.storage.split(",") if name.strip()]
+    unknown = [name for name in storages if name not in ("mongo", "sqlite")]
+    if unknown:
+        parser.error(f"Unknown storage backend(s): {', '.join(unknown)}")
+
+    options = {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "model": args.model,
+        "model_latency_ms": args.model_latency_ms,
+        "mongo_uri": args.mongo_uri,
+    }
+    rows = run_all(storages, endpoints, [int(size) for size in args.history.split(",")], options)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as handle:
+            json.dump({"created_at": datetime.datetime.now().isoformat(), "options": options, "results": rows}, handle, indent=2)
+        print(f"Saved baseline to {args.save_baseline}")
+
+    if args.compare:
+        regressions = compare_to_baseline(rows, args.compare, args.tolerance, args.min_delta_ms)
+        if regressions:
+            print("REGRESSIONS:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.compare}")
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Memory benchmark for per-user check-in history.
+
+Compares the compact history structures with the list- and dict-based ones they
+replaced, using tracemalloc:
+
+- baseline: the exact anomaly baseline seeded from one user's scores. The scores
+  were loaded into a list of floats and kept in a sorted list; now both are
+  float64 arrays (database.load_sentiment_history and baseline.ExactBaseline).
+- export: one export chunk of projected documents, held as a list of decoded
+  dicts, against export_checkins.ExportChunk column buffers.
+
+Documents are BSON-encoded up front and decoded one at a time while the
+structure is built, as they would arrive from a cursor. The benchmark reports
+bytes still held per entry once the structure is built ("retained"), the
+high-water mark while building it ("peak"), and the live allocations per
+entry ("blocks").
+
+Usage:
+    python benchmarks/bench_history.py
+    python benchmarks/bench_history.py --entries 10000,100000 --window 500
+"""
+
+import argparse
+import bisect
+import datetime
+import gc
+import os
+import random
+import sys
+import tracemalloc
+from array import array
+from collections import deque
+
+import bson
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from baseline import ExactBaseline  # noqa: E402
+from export_checkins import ExportChunk  # noqa: E402
+
+KEYWORD_TERMS = [["deadline"], ["tired", "sleep"], [], ["grateful"], None]
+
+
+def encode_documents(count: int, include_export_fields: bool) -> list:
+    """BSON for `count` check-ins of one user, holding only the projected fields."""
+    rng = random.Random(count)
+    start = datetime.datetime(2025, 1, 1)
+    documents = []
+    for index in range(count):
+        document = {"_id": bson.ObjectId(), "sentiment_score": round(rng.uniform(-1.0, 1.0), 4)}
+        if include_export_fields:
+            document.update({
+                "user_id": "bench-user",
+                "timestamp": start + datetime.timedelta(minutes=17 * index),
+                "keyword_intensity": rng.random(),
+                "keyword_terms": KEYWORD_TERMS[index % len(KEYWORD_TERMS)],
+                "anomaly_flag": index % 23 == 0,
+                "model_version": "cardiffnlp/twitter-roberta-base-sentiment-latest@main",
+            })
+        documents.append(bson.encode(document))
+    return documents
+
+
+def measure(build, documents: list) -> dict:
+    """Builds a structure from freshly decoded documents and reports its memory per entry."""
+    gc.collect()
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    result = build(bson.decode(data) for data in documents)
+    retained, peak = tracemalloc.get_traced_memory()
+    blocks = sum(stat.count for stat in tracemalloc.take_snapshot().statistics("filename"))
+    tracemalloc.stop()
+    del result
+    count = len(documents)
+    return {"retained": retained / count, "peak": peak / count, "blocks": blocks / count}
+
+
+def seed_list_baseline(documents, window: int):
+    """The previous path: scores into a list, then a sorted list (and an arrival deque with a window)."""
+    scores = [document["sentiment_score"] for document in documents]
+    scores = scores[-window:] if window else scores
+    ordered, arrivals = [], deque()
+    for score in scores:
+        bisect.insort(ordered, float(score))
+        if window:
+            arrivals.append(score)
+    return ordered, arrivals
+
+
+def seed_array_baseline(documents, window: int):
+    scores = array("d", (document["sentiment_score"] for document in documents))
+    scores = scores[-window:] if window else scores
+    baseline = ExactBaseline(window)
+    for score in scores:
+        baseline.add(score)
+    return baseline
+
+
+def collect_dict_chunk(documents):
+    return list(documents)
+
+
+def collect_export_chunk(documents):
+    chunk = ExportChunk()
+    for document in documents:
+        chunk.add(document)
+    return chunk
+
+
+def report(title: str, before: dict, after: dict):
+    print(f"{title:<34} {'retained B/entry':>17} {'peak B/entry':>13} {'blocks/entry':>13}")
+    for label, row in (("  before", before), ("  after", after)):
+        print(f"{label:<34} {row['retained']:>17.1f} {row['peak']:>13.1f} {row['blocks']:>13.2f}")
+    # Array-backed structures hold a handful of blocks in total, so their ratio would only measure the entry count
+    blocks = f"{before['blocks'] / after['blocks']:.1f}x" if after["blocks"] >= 0.01 else "-"
+    print(f"{'  reduction':<34} {before['retained'] / after['retained']:>16.1f}x "
+          f"{before['peak'] / after['peak']:>12.1f}x {blocks:>13}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure memory per history entry for baselines and export chunks")
+    parser.add_argument("--entries", default="10000,100000", help="Comma-separated history sizes")
+    parser.add_argument("--window", type=int, default=0, help="BASELINE_WINDOW to seed with (0: all history)")
+    args = parser.parse_args()
+
+    for count in [int(value) for value in args.entries.split(",") if value.strip()]:
+        print(f"\n{count} entries")
+        # With a window only the newest `window` scores are queried
+        scores_only = encode_documents(min(count, args.window) if args.window else count, include_export_fields=False)
+        report(f"baseline (window={args.window or 'all'})",
+               measure(lambda documents: seed_list_baseline(documents, args.window), scores_only),
+               measure(lambda documents: seed_array_baseline(documents, args.window), scores_only))
+        export_rows = encode_documents(count, include_export_fields=True)
+        report("export chunk", measure(collect_dict_chunk, export_rows), measure(collect_export_chunk, export_rows))
@@ -1,10 +1,20 @@
 # database.py (MongoDB Version)
 import pymongo
-from pymongo.errors import ConnectionFailure
+from pymongo.errors import BulkWriteError, ConnectionFailure, PyMongoError
+from bson import ObjectId
+from bson.errors import InvalidId
+from array import array
+import base64
 import datetime
 import os
 from dotenv import load_dotenv
 
+from anomaly import baseline_store
+from baseline import BASELINE_WINDOW
+from metrics import MongoPoolListener
+from rollups import rollup_updates
+from versions import bump_user_versions
+
 # Optional: Load environment variables from a .env file for security
 load_dotenv()
 
@@ -16,6 +26,27 @@ load_dotenv()
 MONGO_URI = os.environ.get("MONGO_URI") 
 DB_NAME = "amhci_data_db"
 COLLECTION_NAME = "checkin_entries"
+# Per-user day/week/month aggregates kept up to date on every insert (see rollups.py)
+ROLLUP_COLLECTION_NAME = "checkin_rollups"
+ROLLUP_INDEX = [("user_id", 1), ("granularity", 1), ("bucket_start", 1)]
+# Owner of check-ins that don't name a user (the single-user frontend, legacy documents)
+DEFAULT_USER_ID = "default"
+# Compound index serving per-user history, timeline pages and baseline seeding
+USER_TIMELINE_INDEX = [("user_id", 1), ("timestamp", 1), ("_id", 1)]
+# Fields a timeline caller may project; _id and timestamp are always returned
+TIMELINE_FIELDS = ("sentiment_score", "keyword_intensity", "keyword_terms", "anomaly_flag", "anomaly_detectors", "user_text", "analysis_status")
+TIMELINE_BATCH_SIZE = int(os.environ.get("TIMELINE_BATCH_SIZE", "500"))
+TIMELINE_SORT = [("timestamp", 1), ("_id", 1)]
+# Documents per insert_many round trip for bulk ingestion
+INSERT_CHUNK_SIZE = int(os.environ.get("INSERT_CHUNK_SIZE", "500"))
+DUPLICATE_KEY_ERROR = 11000
+# Baseline reads only need the score column
+SCORE_PROJECTION = {"sentiment_score": 1, "_id": 0}
+# Deferred check-ins are stored before analysis with this status and no score (see jobs.py)
+PENDING_STATUS = "pending"
+COMPLETE_STATUS = "complete"
+# Pending entries have no score yet, so baselines and rollups skip them
+ANALYZED_FILTER = {"sentiment_score": {"$ne": None}}
 # ---------------------
 
 # Global variables for the client and collection objects
@@ -34,7 +65,7 @@ def get_mongo_collection():
 
     try:
         # Create a connection using MongoClient
-        mongo_client = pymongo.MongoClient(MONGO_URI)
+        mongo_client = pymongo.MongoClient(MONGO_URI, event_listeners=[MongoPoolListener()])
         
         # Access the specified database and collection
         db = mongo_client[DB_NAME]
@@ -48,6 +79,11 @@ def get_mongo_collection():
         # Exit the program or handle the error gracefully
         raise
 
+def get_rollup_collection():
+    """Returns the rollups collection on the same client as get_mongo_collection()."""
+    get_mongo_collection()
+    return mongo_client[DB_NAME][ROLLUP_COLLECTION_NAME]
+
 def close_mongo_connection():
     """Closes the MongoDB connection."""
     global mongo_client
@@ -56,26 +92,313 @@ def close_mongo_connection():
         print("MongoDB connection closed.")
 
 
-def insert_checkin_entry(user_text, sentiment_score, keyword_intensity, anomaly_flag=False):
+def build_checkin_entry(user_text, sentiment_score, keyword_intensity, anomaly_flag=False, timestamp=None, user_id=DEFAULT_USER_ID,
+                        anomaly_detectors=None, model_version=None, keyword_terms=None):
     """
-    Inserts a new check-in document into the MongoDB collection.
+    Builds the check-in document shared by the sync and async insert paths.
+    `anomaly_detectors` maps each detector that fired to how far past its threshold the score was.
+    `keyword_terms` are the lexicon terms matched in the text (see lexicon.py).
+    `model_version` records which model produced the score (None for fallback scores),
+    so re-scoring jobs only touch entries scored by an older model.
     """
-    collection = get_mongo_collection()
-    
     # MongoDB stores data as documents (Python dictionaries)
-    entry_data = {
-        "timestamp": datetime.datetime.now(), # MongoDB handles datetime objects natively
+    entry = {
+        "user_id": user_id,
+        "timestamp": timestamp or datetime.datetime.now(), # MongoDB handles datetime objects natively
         "user_text": user_text,
         "sentiment_score": sentiment_score,
         "keyword_intensity": keyword_intensity,
         "anomaly_flag": anomaly_flag
     }
+    if keyword_terms is not None:
+        entry["keyword_terms"] = keyword_terms
+    if anomaly_detectors:
+        entry["anomaly_detectors"] = anomaly_detectors
+    if model_version:
+        entry["model_version"] = model_version
+    return entry
+
+
+def build_pending_entry(user_text, user_id=DEFAULT_USER_ID, timestamp=None):
+    """Builds a deferred check-in: stored right away, scored later by an analyze_checkin job."""
+    entry = build_checkin_entry(user_text, None, None, timestamp=timestamp, user_id=user_id)
+    entry["analysis_status"] = PENDING_STATUS
+    return entry
+
+
+def insert_checkin_entry(user_text, sentiment_score, keyword_intensity, anomaly_flag=False, user_id=DEFAULT_USER_ID, anomaly_detectors=None,
+                         model_version=None, keyword_terms=None):
+    """
+    Inserts a new check-in document into the MongoDB collection.
+    """
+    collection = get_mongo_collection()
+    entry_data = build_checkin_entry(
+        user_text, sentiment_score, keyword_intensity, anomaly_flag, user_id=user_id, anomaly_detectors=anomaly_detectors,
+        model_version=model_version, keyword_terms=keyword_terms,
+    )
     
     # Insert the document
     result = collection.insert_one(entry_data)
     print(f"Inserted document ID: {result.inserted_id}")
+
+    # Keep the in-memory anomaly baseline and the trend rollups in step with the collection
+    baseline_store.add(user_id, sentiment_score)
+    update_rollups([entry_data])
+    # Cached timelines and trends of this user are stale now
+    bump_user_versions(user_id)
     return result.inserted_id
 
+
+def ensure_indexes():
+    """
+    Creates the indexes the app relies on (no-op if they already exist) and assigns
+    legacy documents without a user_id to DEFAULT_USER_ID.
+    """
+    collection = get_mongo_collection()
+    collection.create_index(USER_TIMELINE_INDEX, name="user_timestamp")
+    # Unique import_ref, so re-running an interrupted import never duplicates entries
+    collection.create_index("import_ref", unique=True, sparse=True)
+    # Missing fields are indexed as null, so this is an index lookup, not a collection scan
+    result = collection.update_many({"user_id": None}, {"$set": {"user_id": DEFAULT_USER_ID}})
+    if result.modified_count:
+        print(f"Assigned {result.modified_count} legacy entries to user '{DEFAULT_USER_ID}'")
+        bump_user_versions(DEFAULT_USER_ID)
+    get_rollup_collection().create_index(ROLLUP_INDEX, name="user_granularity_bucket", unique=True)
+
+
+def update_rollups(entries):
+    """
+    Merges newly written entries into their day/week/month rollups, one upsert
+    per touched bucket. A failure here never fails the check-in itself: the
+    entry is already stored and backfill_rollups.py can rebuild the aggregates.
+    """
+    rollups = get_rollup_collection()
+    try:
+        for query, update in rollup_updates(entries):
+            rollups.update_one(query, update, upsert=True)
+    except PyMongoError as e:
+        print(f"WARNING: Could not update trend rollups ({e}). Run backfill_rollups.py to rebuild them.")
+
+
+def insert_checkin_entries(entries, chunk_size=INSERT_CHUNK_SIZE):
+    """
+    Bulk-inserts prepared check-in documents with insert_many, chunk_size at a time.
+    Entries whose import_ref already exists are skipped, so replays are idempotent.
+    Returns the number of newly inserted documents.
+    """
+    collection = get_mongo_collection()
+    inserted = 0
+    for offset in range(0, len(entries), chunk_size):
+        chunk = entries[offset:offset + chunk_size]
+        try:
+            result = collection.insert_many(chunk, ordered=False)
+            written = chunk
+            inserted += len(result.inserted_ids)
+        except BulkWriteError as e:
+            written = written_entries(chunk, e)
+            inserted += len(written)
+
+        # Keep the in-memory anomaly baseline in step, in chronological order
+        for entry in written:
+            baseline_store.add(entry["user_id"], entry["sentiment_score"])
+        update_rollups(written)
+        bump_user_versions(*{entry["user_id"] for entry in written})
+    return inserted
+
+
+def complete_pending_entry(entry, analysis, anomaly_flag, anomaly_detectors):
+    """
+    Stores the analysis of a deferred check-in and merges it into the rollups.
+    Only a still-pending entry is updated, so a job that runs twice writes once.
+    Returns True if this call completed the entry.
+    """
+    update = {
+        "$set": {
+            "sentiment_score": analysis["sentiment"],
+            "keyword_intensity": analysis["intensity"],
+            "keyword_terms": analysis.get("terms", []),
+            "anomaly_flag": anomaly_flag,
+        },
+        "$unset": {"analysis_status": ""},
+    }
+    if anomaly_detectors:
+        update["$set"]["anomaly_detectors"] = anomaly_detectors
+    if analysis.get("model_version"):
+        update["$set"]["model_version"] = analysis["model_version"]
+    result = get_mongo_collection().update_one({"_id": entry["_id"], "analysis_status": PENDING_STATUS}, update)
+    if not result.modified_count:
+        return False
+    # Like the inserts: this process's cached baseline follows its own write, so the bump doesn't re-seed it
+    baseline_store.add(entry["user_id"], analysis["sentiment"])
+    update_rollups([dict(entry, **update["$set"])])
+    bump_user_versions(entry["user_id"])
+    return True
+
+
+def written_entries(chunk, error):
+    """Works out which entries of an unordered insert_many landed, re-raising anything but duplicate keys."""
+    write_errors = error.details.get("writeErrors", [])
+    if any(write_error.get("code") != DUPLICATE_KEY_ERROR for write_error in write_errors):
+        raise error
+    failed = {write_error["index"] for write_error in write_errors}
+    return [entry for index, entry in enumerate(chunk) if index not in failed]
+
+
+def load_sentiment_history(user_id=DEFAULT_USER_ID, limit=None, until=None):
+    """
+    Returns one user's historical sentiment scores in chronological order, as a
+    float64 array. Only the score field is read, so user_text never leaves the database.
+    With `until`, only entries stamped at or before that time are read.
+    """
+    collection = get_mongo_collection()
+    query = dict(ANALYZED_FILTER, user_id=user_id)
+    if until is not None:
+        query["timestamp"] = {"$lte": until}
+
+    if limit:
+        # Newest N scores, flipped back into chronological order
+        cursor = collection.find(query, SCORE_PROJECTION).sort("timestamp", -1).limit(limit)
+        return array("d", (doc["sentiment_score"] for doc in cursor))[::-1]
+
+    cursor = collection.find(query, SCORE_PROJECTION).sort("timestamp", 1)
+    return array("d", (doc["sentiment_score"] for doc in cursor))
+
+
+def has_entries_after(user_id, until):
+    return get_mongo_collection().find_one(dict(ANALYZED_FILTER, user_id=user_id, timestamp={"$gt": until}), {"_id": 1}) is not None
+
+
+def get_score_baseline(user_id=DEFAULT_USER_ID, until=None):
+    """
+    Returns a user's incrementally maintained anomaly detector state.
+    The history is read from MongoDB the first time a user is requested, and again
+    once another process has written to it; otherwise insert_checkin_entry keeps it up to date.
+
+    `until` is the earliest timestamp of a batch about to be flagged. If the user
+    already has entries after it, a separate state built from the history up to
+    that time is returned and the cached one is left as it is.
+    """
+    if until is not None and has_entries_after(user_id, until):
+        return baseline_store.build(load_sentiment_history(user_id, limit=BASELINE_WINDOW or None, until=until))
+    if not baseline_store.is_loaded(user_id):
+        version = baseline_store.version(user_id)
+        baseline_store.seed(user_id, load_sentiment_history(user_id, limit=BASELINE_WINDOW or None), version)
+    return baseline_store.get(user_id)
+
+
+def encode_timeline_cursor(entry):
+    """Builds an opaque pagination token from the (timestamp, _id) sort key of an entry."""
+    raw = f"{entry['timestamp'].isoformat()}|{entry['_id']}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_timeline_cursor(token):
+    """Reverses encode_timeline_cursor. Raises ValueError for malformed tokens."""
+    try:
+        raw = base64.urlsafe_b64decode(token.encode("ascii")).decode("utf-8")
+        timestamp, entry_id = raw.split("|", 1)
+        return datetime.datetime.fromisoformat(timestamp), ObjectId(entry_id)
+    except (ValueError, UnicodeError, InvalidId) as e:
+        raise ValueError(f"Invalid timeline cursor: {token}") from e
+
+
+def naive_local(moment):
+    """Stored timestamps are naive local time, like datetime.now() in the single check-in path."""
+    if moment is not None and moment.tzinfo is not None:
+        return moment.astimezone().replace(tzinfo=None)
+    return moment
+
+
+def build_timeline_query(user_id=DEFAULT_USER_ID, start=None, end=None, after=None):
+    """
+    Builds the filter for a chronological scan of one user's timeline.
+    `after` is a decoded (timestamp, _id) cursor; ties on timestamp are broken by _id
+    so pages never skip or repeat entries. With the user_timestamp index this is
+    an index range scan. Timezone-aware bounds are compared as naive local time,
+    like the stored timestamps.
+    """
+    start, end = naive_local(start), naive_local(end)
+    clauses = [{"user_id": user_id}]
+    time_range = {}
+    if start is not None:
+        time_range["$gte"] = start
+    if end is not None:
+        time_range["$lt"] = end
+    if time_range:
+        clauses.append({"timestamp": time_range})
+    if after is not None:
+        after_timestamp, after_id = after
+        clauses.append({"$or": [
+            {"timestamp": {"$gt": after_timestamp}},
+            {"timestamp": after_timestamp, "_id": {"$gt": after_id}},
+        ]})
+
+    if len(clauses) == 1:
+        return clauses[0]
+    return {"$and": clauses}
+
+
+def timeline_projection(fields=None):
+    """MongoDB projection for the requested timeline fields (all of them by default)."""
+    projection = {"timestamp": 1}
+    for field in (fields or TIMELINE_FIELDS):
+        projection[field] = 1
+    return projection
+
+
+def find_timeline_entries(user_id=DEFAULT_USER_ID, start=None, end=None, after=None, limit=None, fields=None):
+    """
+    Returns a MongoDB cursor over check-ins in chronological order.
+    Documents are fetched from the server in TIMELINE_BATCH_SIZE batches, so
+    iterating the cursor keeps memory flat regardless of collection size.
+    """
+    collection = get_mongo_collection()
+    cursor = collection.find(build_timeline_query(user_id, start, end, after), timeline_projection(fields))
+    cursor = cursor.sort(TIMELINE_SORT).batch_size(TIMELINE_BATCH_SIZE)
+    if limit:
+        cursor = cursor.limit(limit)
+    return cursor
+
+
+def build_rollup_query(user_id=DEFAULT_USER_ID, granularity="day", start=None, end=None):
+    """Filter for one user's rollups of a granularity, optionally bounded by bucket start (naive local time)."""
+    start, end = naive_local(start), naive_local(end)
+    query = {"user_id": user_id, "granularity": granularity}
+    bucket_range = {}
+    if start is not None:
+        bucket_range["$gte"] = start
+    if end is not None:
+        bucket_range["$lt"] = end
+    if bucket_range:
+        query["bucket_start"] = bucket_range
+    return query
+
+
+def find_rollups(user_id=DEFAULT_USER_ID, granularity="day", start=None, end=None):
+    """Returns a cursor over one user's rollups in bucket order (an index range scan)."""
+    collection = get_rollup_collection()
+    return collection.find(build_rollup_query(user_id, granularity, start, end)).sort("bucket_start", 1)
+
+
+def serialize_timeline_entry(entry, fields=None):
+    """Converts a raw MongoDB document into a JSON-ready dict without building a Pydantic model."""
+    data = {
+        "id": str(entry["_id"]),
+        "timestamp": entry["timestamp"].isoformat(),
+    }
+    for field in (fields or TIMELINE_FIELDS):
+        if field == "anomaly_flag":
+            data[field] = entry.get(field, False)
+        elif field == "anomaly_detectors":
+            data[field] = entry.get(field, {})
+        elif field == "user_text":
+            data[field] = entry.get(field, "")
+        elif field == "analysis_status":
+            data[field] = entry.get(field, COMPLETE_STATUS)
+        else:
+            data[field] = entry.get(field)
+    return data
+
 # --- Example Usage ---
 if __name__ == '__main__':
     try:
@@ -0,0 +1,242 @@
+# database_async.py (Motor Version)
+import asyncio
+import os
+from array import array
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from anomaly import baseline_store
+from baseline import BASELINE_WINDOW
+from metrics import MongoPoolListener
+from database import (
+    MONGO_URI, DB_NAME, COLLECTION_NAME, ROLLUP_COLLECTION_NAME, ROLLUP_INDEX, TIMELINE_BATCH_SIZE, TIMELINE_SORT,
+    SCORE_PROJECTION, INSERT_CHUNK_SIZE, DEFAULT_USER_ID, USER_TIMELINE_INDEX, ANALYZED_FILTER,
+    build_checkin_entry, build_pending_entry, build_rollup_query, build_timeline_query, timeline_projection, written_entries,
+)
+from rollups import rollup_updates
+from versions import bump_user_versions
+from write_buffer import WriteBehindBuffer
+
+# --- Connection Pool Configuration ---
+# Each in-flight request holds at most one pooled connection while it awaits MongoDB,
+# so the pool size caps concurrent database round trips per worker process.
+MONGO_MAX_POOL_SIZE = int(os.environ.get("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.environ.get("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_IDLE_TIME_MS = int(os.environ.get("MONGO_MAX_IDLE_TIME_MS", "60000"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get("MONGO_WAIT_QUEUE_TIMEOUT_MS", "10000"))
+# ---------------------
+
+# Created in the app lifespan (see main.py), never at import time
+async_mongo_client = None
+async_mongo_collection = None
+
+
+async def connect_async_mongo():
+    """
+    Creates the Motor client and returns the collection object.
+    Motor clients are bound to the running event loop, so call this from the
+    app lifespan rather than at import time.
+    """
+    global async_mongo_client, async_mongo_collection
+
+    if async_mongo_collection is not None:
+        return async_mongo_collection
+
+    async_mongo_client = AsyncIOMotorClient(
+        MONGO_URI,
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+        waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        event_listeners=[MongoPoolListener()], # Pool gauges on /metrics
+    )
+    async_mongo_collection = async_mongo_client[DB_NAME][COLLECTION_NAME]
+
+    print(f"Connected to MongoDB (async, pool {MONGO_MIN_POOL_SIZE}-{MONGO_MAX_POOL_SIZE}): Database '{DB_NAME}', Collection '{COLLECTION_NAME}'")
+    return async_mongo_collection
+
+
+def get_async_collection():
+    """Returns the Motor collection created by connect_async_mongo()."""
+    if async_mongo_collection is None:
+        raise RuntimeError("Async MongoDB client is not connected. Call connect_async_mongo() first.")
+    return async_mongo_collection
+
+
+def get_async_rollup_collection():
+    """Returns the Motor rollups collection on the client created by connect_async_mongo()."""
+    get_async_collection()
+    return async_mongo_client[DB_NAME][ROLLUP_COLLECTION_NAME]
+
+
+async def close_async_mongo():
+    """Closes the Motor client and its connection pool."""
+    global async_mongo_client, async_mongo_collection
+    if async_mongo_client:
+        async_mongo_client.close()
+        async_mongo_client = None
+        async_mongo_collection = None
+        print("Async MongoDB connection closed.")
+
+
+async def ensure_indexes_async():
+    """Async counterpart of database.ensure_indexes(), run once from the app lifespan."""
+    collection = get_async_collection()
+    await collection.create_index(USER_TIMELINE_INDEX, name="user_timestamp")
+    await collection.create_index("import_ref", unique=True, sparse=True)
+    result = await collection.update_many({"user_id": None}, {"$set": {"user_id": DEFAULT_USER_ID}})
+    if result.modified_count:
+        print(f"Assigned {result.modified_count} legacy entries to user '{DEFAULT_USER_ID}'")
+        bump_user_versions(DEFAULT_USER_ID)
+    await get_async_rollup_collection().create_index(ROLLUP_INDEX, name="user_granularity_bucket", unique=True)
+
+
+async def update_rollups_async(entries):
+    """Async counterpart of database.update_rollups(); the bucket upserts run concurrently."""
+    rollups = get_async_rollup_collection()
+    try:
+        await asyncio.gather(*(rollups.update_one(query, update, upsert=True) for query, update in rollup_updates(entries)))
+    except PyMongoError as e:
+        print(f"WARNING: Could not update trend rollups ({e}). Run backfill_rollups.py to rebuild them.")
+
+
+async def insert_checkin_entry_async(user_text, sentiment_score, keyword_intensity, anomaly_flag=False, user_id=DEFAULT_USER_ID,
+                                     anomaly_detectors=None, model_version=None, keyword_terms=None):
+    """
+    Inserts a new check-in document without blocking the event loop.
+    With WRITE_BEHIND the entry is buffered and written by the next batched flush.
+    """
+    entry_data = build_checkin_entry(
+        user_text, sentiment_score, keyword_intensity, anomaly_flag, user_id=user_id, anomaly_detectors=anomaly_detectors,
+        model_version=model_version, keyword_terms=keyword_terms,
+    )
+
+    if write_buffer.enabled:
+        # The baseline moves now, so the user's next check-in is scored against this one;
+        # the rollups follow when the batch is written
+        entry_id = await write_buffer.add(entry_data)
+        baseline_store.add(user_id, sentiment_score)
+        # /timeline merges buffered entries, so the user's timeline changes now
+        bump_user_versions(user_id)
+        return entry_id
+
+    collection = get_async_collection()
+    result = await collection.insert_one(entry_data)
+    print(f"Inserted document ID: {result.inserted_id}")
+
+    # Keep the in-memory anomaly baseline and the trend rollups in step with the collection
+    baseline_store.add(user_id, sentiment_score)
+    await update_rollups_async([entry_data])
+    # Cached timelines and trends of this user are stale now
+    bump_user_versions(user_id)
+    return result.inserted_id
+
+
+async def insert_pending_entry_async(user_text, user_id=DEFAULT_USER_ID):
+    """
+    Stores a deferred check-in without a score. The baseline and rollups are
+    left alone until its analyze_checkin job completes it.
+    """
+    entry_data = build_pending_entry(user_text, user_id=user_id)
+    result = await get_async_collection().insert_one(entry_data)
+    print(f"Inserted pending document ID: {result.inserted_id}")
+    bump_user_versions(user_id)
+    return result.inserted_id, entry_data["timestamp"]
+
+
+async def write_entries_async(chunk):
+    """
+    Writes one chunk with an unordered insert_many and merges the newly written
+    entries into the rollups. Entries that already exist (same _id or import_ref)
+    are skipped; returns the ones that were written.
+    """
+    collection = get_async_collection()
+    try:
+        await collection.insert_many(chunk, ordered=False)
+        written = chunk
+    except BulkWriteError as e:
+        written = written_entries(chunk, e)
+    await update_rollups_async(written)
+    # Also after a write-behind flush: the entries were visible already, but the trends only change now
+    bump_user_versions(*{entry["user_id"] for entry in written})
+    return written
+
+
+# Batches single check-ins when WRITE_BEHIND is on; started and drained by the app lifespan
+write_buffer = WriteBehindBuffer(write_entries_async)
+
+
+async def insert_checkin_entries_async(entries, chunk_size=INSERT_CHUNK_SIZE):
+    """Async counterpart of database.insert_checkin_entries()."""
+    inserted = 0
+    for offset in range(0, len(entries), chunk_size):
+        written = await write_entries_async(entries[offset:offset + chunk_size])
+        inserted += len(written)
+        for entry in written:
+            baseline_store.add(entry["user_id"], entry["sentiment_score"])
+    return inserted
+
+
+async def load_sentiment_history_async(user_id=DEFAULT_USER_ID, limit=None, until=None):
+    """Async counterpart of database.load_sentiment_history()."""
+    collection = get_async_collection()
+    query = dict(ANALYZED_FILTER, user_id=user_id)
+    if until is not None:
+        query["timestamp"] = {"$lte": until}
+
+    if limit:
+        cursor = collection.find(query, SCORE_PROJECTION).sort("timestamp", -1).limit(limit)
+    else:
+        cursor = collection.find(query, SCORE_PROJECTION).sort("timestamp", 1).batch_size(TIMELINE_BATCH_SIZE)
+    scores = array("d")
+    async for doc in cursor:
+        scores.append(doc["sentiment_score"])
+    return scores[::-1] if limit else scores
+
+
+async def has_entries_after_async(user_id, until):
+    if any(entry["timestamp"] > until for entry in write_buffer.buffered(user_id)):
+        return True
+    query = dict(ANALYZED_FILTER, user_id=user_id, timestamp={"$gt": until})
+    return await get_async_collection().find_one(query, {"_id": 1}) is not None
+
+
+async def get_score_baseline_async(user_id=DEFAULT_USER_ID, until=None):
+    """
+    Async counterpart of database.get_score_baseline(). Check-ins still in the
+    write-behind buffer are part of the history too; holding the buffer's lock
+    means no flush moves them into MongoDB mid-read.
+    """
+    if until is not None:
+        async with write_buffer.lock:
+            if await has_entries_after_async(user_id, until):
+                scores = await load_sentiment_history_async(user_id, limit=BASELINE_WINDOW or None, until=until)
+                scores.extend(entry["sentiment_score"] for entry in write_buffer.buffered(user_id) if entry["timestamp"] <= until)
+                return baseline_store.build(scores[-BASELINE_WINDOW:] if BASELINE_WINDOW else scores)
+    if not baseline_store.is_loaded(user_id):
+        async with write_buffer.lock:
+            version = baseline_store.version(user_id)
+            scores = await load_sentiment_history_async(user_id, limit=BASELINE_WINDOW or None)
+            scores.extend(entry["sentiment_score"] for entry in write_buffer.buffered(user_id))
+            baseline_store.seed(user_id, scores[-BASELINE_WINDOW:] if BASELINE_WINDOW else scores, version)
+    return baseline_store.get(user_id)
+
+
+def find_timeline_entries_async(user_id=DEFAULT_USER_ID, start=None, end=None, after=None, limit=None, fields=None):
+    """
+    Returns a Motor cursor over check-ins in chronological order.
+    Iterate it with `async for`; documents arrive in TIMELINE_BATCH_SIZE batches.
+    """
+    collection = get_async_collection()
+    cursor = collection.find(build_timeline_query(user_id, start, end, after), timeline_projection(fields))
+    cursor = cursor.sort(TIMELINE_SORT).batch_size(TIMELINE_BATCH_SIZE)
+    if limit:
+        cursor = cursor.limit(limit)
+    return cursor
+
+
+def find_rollups_async(user_id=DEFAULT_USER_ID, granularity="day", start=None, end=None):
+    """Returns a Motor cursor over one user's rollups in bucket order."""
+    collection = get_async_rollup_collection()
+    return collection.find(build_rollup_query(user_id, granularity, start, end)).sort("bucket_start", 1)
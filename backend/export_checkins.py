@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Export check-ins to Arrow IPC or Parquet for analysis.
+
+Entries are streamed from MongoDB in EXPORT_CHUNK_ROWS batches and written as
+one Arrow record batch (or Parquet row group) per chunk, so memory stays
+bounded by the chunk size however many rows are exported. Columns are typed
+and compact: timestamps are int64 milliseconds since the Unix epoch, scores are
+float32 and user_id is dictionary-encoded. user_text is only included on request.
+Each chunk is collected column by column as documents arrive (see ExportChunk),
+so no decoded document is kept once its values are copied out.
+
+The same export is served by GET /export (see main.py).
+
+Usage:
+    python export_checkins.py checkins.parquet
+    python export_checkins.py alice.arrow --user-id alice --start 2025-01-01 --end 2025-07-01
+"""
+
+import argparse
+import datetime
+import math
+import os
+import time
+from array import array
+from typing import Iterator, Optional
+
+import numpy as np
+
+# pyarrow provides the Arrow and Parquet writers; it is optional
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+from database import (
+    close_mongo_connection, get_mongo_collection, build_timeline_query, USER_TIMELINE_INDEX,
+)
+
+# --- Configuration ---
+# Rows per Mongo batch, Arrow record batch and Parquet row group
+EXPORT_CHUNK_ROWS = int(os.environ.get("EXPORT_CHUNK_ROWS", "65536"))
+EXPORT_PARQUET_COMPRESSION = os.environ.get("EXPORT_PARQUET_COMPRESSION", "zstd")
+# ---------------------
+
+EXPORT_FORMATS = {
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+EXPORT_EXTENSIONS = {".arrow": "arrow", ".arrows": "arrow", ".ipc": "arrow", ".parquet": "parquet", ".pq": "parquet"}
+
+EPOCH = datetime.datetime(1970, 1, 1)
+MILLISECOND = datetime.timedelta(milliseconds=1)
+
+
+def export_available() -> bool:
+    return pa is not None
+
+
+def require_pyarrow():
+    if pa is None:
+        raise RuntimeError("Exporting needs the optional 'pyarrow' package")
+
+
+def export_schema(include_text: bool = False):
+    require_pyarrow()
+    fields = [
+        pa.field("id", pa.string()),
+        pa.field("user_id", pa.dictionary(pa.int32(), pa.string())),
+        pa.field("timestamp", pa.int64(), metadata={"unit": "ms since Unix epoch"}),
+        pa.field("sentiment_score", pa.float32()),  # null while a deferred check-in is pending
+        pa.field("keyword_intensity", pa.float32()),
+        pa.field("keyword_terms", pa.list_(pa.string())),
+        pa.field("anomaly_flag", pa.bool_()),
+        pa.field("model_version", pa.dictionary(pa.int32(), pa.string())),
+    ]
+    if include_text:
+        fields.append(pa.field("user_text", pa.string()))
+    return pa.schema(fields)
+
+
+def export_projection(include_text: bool = False) -> dict:
+    projection = {field: 1 for field in ("user_id", "timestamp", "sentiment_score", "keyword_intensity", "keyword_terms", "anomaly_flag", "model_version")}
+    if include_text:
+        projection["user_text"] = 1
+    return projection
+
+
+def build_export_query(user_id: Optional[str] = None, start=None, end=None) -> dict:
+    """One user's entries (an index range scan), or every user's within the time range."""
+    if user_id:
+        return build_timeline_query(user_id, start, end)
+    time_range = {}
+    if start is not None:
+        time_range["$gte"] = start
+    if end is not None:
+        time_range["$lt"] = end
+    return {"timestamp": time_range} if time_range else {}
+
+
+class ExportChunk:
+    """
+    Column buffers for one record batch. Timestamps are int64 epoch milliseconds,
+    scores and keyword_intensity float32 (NaN where missing), anomaly flags one
+    byte each, ids 12-byte ObjectId binaries, and keyword_terms one flat list plus
+    offsets. Repeated strings (user_id, model_version, terms) are stored once per chunk.
+    """
+
+    __slots__ = ("ids", "user_ids", "timestamps", "scores", "anomaly_flags", "keyword_intensities", "terms",
+                 "term_offsets", "terms_missing", "model_versions", "texts", "_strings")
+
+    def __init__(self, include_text: bool = False):
+        self.ids = bytearray()
+        self.user_ids = []
+        self.timestamps = array("q")
+        self.scores = array("f")
+        self.anomaly_flags = bytearray()
+        self.keyword_intensities = array("f")
+        self.terms = []
+        self.term_offsets = array("i", [0])
+        self.terms_missing = bytearray()  # 1 where keyword_terms is absent (null), not just empty
+        self.model_versions = []
+        self.texts = [] if include_text else None
+        self._strings = {}
+
+    def add(self, row: dict):
+        self.ids += row["_id"].binary
+        self.user_ids.append(self._shared(row.get("user_id")))
+        # Naive datetimes are UTC as far as MongoDB is concerned
+        self.timestamps.append((row["timestamp"] - EPOCH) // MILLISECOND)
+        score = row.get("sentiment_score")
+        self.scores.append(math.nan if score is None else score)
+        self.anomaly_flags.append(bool(row.get("anomaly_flag", False)))
+        intensity = row.get("keyword_intensity")
+        self.keyword_intensities.append(math.nan if intensity is None else intensity)
+        terms = row.get("keyword_terms")
+        if terms:
+            self.terms.extend(self._shared(term) for term in terms)
+        self.term_offsets.append(len(self.terms))
+        self.terms_missing.append(terms is None)
+        self.model_versions.append(self._shared(row.get("model_version")))
+        if self.texts is not None:
+            self.texts.append(row.get("user_text", ""))
+
+    def _shared(self, value):
+        return value if value is None else self._strings.setdefault(value, value)
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def record_batch(self, schema):
+        """One record batch over the buffered rows; the numeric columns are handed to Arrow without copying."""
+        hex_ids = self.ids.hex()
+        columns = [
+            pa.array([hex_ids[start:start + 24] for start in range(0, len(hex_ids), 24)], pa.string()),
+            pa.array(self.user_ids, pa.string()).dictionary_encode(),
+            pa.array(np.frombuffer(self.timestamps, dtype=np.int64), pa.int64()),
+            # NaN marks a missing value (pending entries, entries from before keyword intensity existed)
+            pa.array(np.frombuffer(self.scores, dtype=np.float32), pa.float32(), from_pandas=True),
+            pa.array(np.frombuffer(self.keyword_intensities, dtype=np.float32), pa.float32(), from_pandas=True),
+            pa.ListArray.from_arrays(
+                pa.array(np.frombuffer(self.term_offsets, dtype=np.int32)), pa.array(self.terms, pa.string()),
+                mask=pa.array(np.frombuffer(self.terms_missing, dtype=np.bool_))),
+            pa.array(np.frombuffer(self.anomaly_flags, dtype=np.bool_), pa.bool_()),
+            pa.array(self.model_versions, pa.string()).dictionary_encode(),
+        ]
+        if self.texts is not None:
+            columns.append(pa.array(self.texts, pa.string()))
+        return pa.RecordBatch.from_arrays(columns, schema=schema)
+
+
+def iter_record_batches(user_id: Optional[str] = None, start=None, end=None, include_text: bool = False,
+                        chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator:
+    """Yields Arrow record batches of at most chunk_rows entries, in (user_id, timestamp) order."""
+    schema = export_schema(include_text)
+    cursor = get_mongo_collection().find(build_export_query(user_id, start, end), export_projection(include_text))
+    cursor = cursor.sort(USER_TIMELINE_INDEX).batch_size(chunk_rows)
+    include_text = "user_text" in schema.names
+    chunk = ExportChunk(include_text)
+    for row in cursor:
+        chunk.add(row)
+        if len(chunk) >= chunk_rows:
+            yield chunk.record_batch(schema)
+            chunk = ExportChunk(include_text)
+    if len(chunk):
+        yield chunk.record_batch(schema)
+
+
+def open_writer(sink, export_format: str, schema):
+    """Arrow IPC stream or Parquet writer; both take one record batch per write_batch() call."""
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format '{export_format}'. Use one of: {', '.join(EXPORT_FORMATS)}")
+    if export_format == "arrow":
+        return pa.ipc.new_stream(sink, schema)
+    # Each record batch becomes one row group
+    return pq.ParquetWriter(sink, schema, compression=EXPORT_PARQUET_COMPRESSION)
+
+
+class _ChunkSink:
+    """Write-only file object that hands written bytes back to a generator."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_export_bytes(export_format: str = "parquet", user_id: Optional[str] = None, start=None, end=None,
+                      include_text: bool = False, chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator[bytes]:
+    """
+    Yields the encoded export piece by piece: one Arrow IPC stream message or one
+    Parquet row group per chunk, then the footer. Suitable for a streaming response.
+    """
+    sink = _ChunkSink()
+    writer = open_writer(pa.PythonFile(sink, mode="w"), export_format, export_schema(include_text))
+    for batch in iter_record_batches(user_id, start, end, include_text, chunk_rows):
+        writer.write_batch(batch)
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def export_checkins(path: str, export_format: Optional[str] = None, user_id: Optional[str] = None, start=None, end=None,
+                    include_text: bool = False, chunk_rows: int = EXPORT_CHUNK_ROWS) -> dict:
+    """Writes an export file and returns its row count, size and duration."""
+    if export_format is None:
+        export_format = EXPORT_EXTENSIONS.get(os.path.splitext(path)[1].lower())
+        if export_format is None:
+            raise ValueError(f"Cannot guess the format of '{path}', pass --format arrow or --format parquet")
+
+    started = time.perf_counter()
+    rows = 0
+    with open(path, "wb") as output:
+        writer = open_writer(output, export_format, export_schema(include_text))
+        for batch in iter_record_batches(user_id, start, end, include_text, chunk_rows):
+            writer.write_batch(batch)
+            rows += batch.num_rows
+            print(f"  {rows} rows written ({time.perf_counter() - started:.1f}s)")
+        writer.close()
+
+    return {"rows": rows, "bytes": os.path.getsize(path), "seconds": time.perf_counter() - started, "format": export_format}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export check-ins to Arrow IPC or Parquet")
+    parser.add_argument("path", help="Output file (.parquet or .arrow)")
+    parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), help="Output format (default: from the file extension)")
+    parser.add_argument("--user-id", help="Only export this user's check-ins (default: every user)")
+    parser.add_argument("--start", type=datetime.datetime.fromisoformat, help="Only entries at or after this ISO timestamp")
+    parser.add_argument("--end", type=datetime.datetime.fromisoformat, help="Only entries before this ISO timestamp")
+    parser.add_argument("--include-text", action="store_true", help="Also export user_text")
+    parser.add_argument("--chunk-rows", type=int, default=EXPORT_CHUNK_ROWS, help="Rows per record batch / row group")
+    args = parser.parse_args()
+
+    try:
+        summary = export_checkins(
+            args.path, args.format, user_id=args.user_id, start=args.start, end=args.end,
+            include_text=args.include_text, chunk_rows=args.chunk_rows,
+        )
+        print(f"Done: {summary['rows']} rows, {summary['bytes'] / 1e6:.1f} MB of {summary['format']} in {summary['seconds']:.1f}s")
+    finally:
+        close_mongo_connection()
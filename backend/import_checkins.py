@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Bulk-import historical check-ins from a JSONL or CSV file.
+
+Texts are analysed in padded batches, anomaly flags are computed in
+chronological order, and entries are written with insert_many. Progress is
+saved to a checkpoint file after every batch, so an interrupted import can be
+resumed by running the same command again.
+
+Usage:
+    python import_checkins.py journal.jsonl
+    python import_checkins.py partner_export.csv --text-field entry --timestamp-field created_at
+"""
+
+import argparse
+import csv
+import json
+import os
+import time
+
+from database import (
+    close_mongo_connection, ensure_indexes, get_score_baseline, insert_checkin_entries, DEFAULT_USER_ID,
+)
+from ingest import earliest_timestamp, prepare_checkin_batch
+from nlp_model import analyze_texts, load_model
+
+
+def detect_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".jsonl", ".ndjson", ".json"):
+        return "jsonl"
+    if extension == ".csv":
+        return "csv"
+    raise ValueError(f"Cannot guess the format of '{path}', pass --format jsonl or --format csv")
+
+
+def iter_records(path, file_format, text_field, timestamp_field):
+    """Yields (record_number, record) pairs with user_text/timestamp normalised from the source fields."""
+    with open(path, newline="", encoding="utf-8") as source:
+        if file_format == "csv":
+            rows = csv.DictReader(source)
+        else:
+            rows = (json.loads(line) for line in source if line.strip())
+
+        for record_number, row in enumerate(rows):
+            yield record_number, {
+                "user_text": (row.get(text_field) or "").strip(),
+                "timestamp": row.get(timestamp_field),
+            }
+
+
+def load_checkpoint(checkpoint_path, source_path, user_id):
+    """Returns saved progress for this source file and user, or a fresh checkpoint."""
+    fresh = {"source": os.path.abspath(source_path), "user_id": user_id, "records_done": 0, "inserted": 0, "skipped": 0, "anomalies": 0}
+    if not os.path.exists(checkpoint_path):
+        return fresh
+    with open(checkpoint_path, encoding="utf-8") as handle:
+        saved = json.load(handle)
+    if saved.get("source") != fresh["source"] or saved.get("user_id", DEFAULT_USER_ID) != user_id:
+        raise ValueError(
+            f"Checkpoint {checkpoint_path} belongs to {saved.get('source')} (user '{saved.get('user_id')}'), "
+            f"not {fresh['source']} (user '{user_id}')"
+        )
+    return saved
+
+
+def save_checkpoint(checkpoint_path, checkpoint):
+    """Writes the checkpoint atomically so a crash never leaves a half-written file."""
+    temp_path = checkpoint_path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as handle:
+        json.dump(checkpoint, handle)
+    os.replace(temp_path, checkpoint_path)
+
+
+def import_file(path, user_id=DEFAULT_USER_ID, file_format=None, batch_size=256, checkpoint_path=None,
+                text_field="user_text", timestamp_field="timestamp"):
+    """Imports every record in `path` for one user, resuming from the checkpoint if one exists."""
+    file_format = file_format or detect_format(path)
+    checkpoint_path = checkpoint_path or path + ".checkpoint"
+    checkpoint = load_checkpoint(checkpoint_path, path, user_id)
+    source_name = os.path.basename(path)
+
+    total = sum(1 for _ in iter_records(path, file_format, text_field, timestamp_field))
+    if checkpoint["records_done"]:
+        print(f"Resuming {source_name} at record {checkpoint['records_done']} of {total}")
+    else:
+        print(f"Importing {total} records from {source_name} for user '{user_id}'")
+
+    load_model()
+    ensure_indexes()
+    started = time.perf_counter()
+    processed_this_run = 0
+
+    def flush(batch, last_record_number):
+        nonlocal processed_this_run
+        if batch:
+            analyses = analyze_texts([record["user_text"] for record in batch])
+            baseline = get_score_baseline(user_id, until=earliest_timestamp(batch))
+            entries = prepare_checkin_batch(batch, analyses, baseline, user_id)
+            checkpoint["inserted"] += insert_checkin_entries(entries)
+            checkpoint["anomalies"] += sum(1 for entry in entries if entry["anomaly_flag"])
+
+        processed_this_run += last_record_number + 1 - checkpoint["records_done"]
+        checkpoint["records_done"] = last_record_number + 1
+        save_checkpoint(checkpoint_path, checkpoint)
+
+        elapsed = time.perf_counter() - started
+        rate = processed_this_run / elapsed if elapsed > 0 else 0.0
+        percent = 100.0 * checkpoint["records_done"] / total if total else 100.0
+        print(
+            f"  {checkpoint['records_done']}/{total} ({percent:.1f}%) - "
+            f"inserted {checkpoint['inserted']}, skipped {checkpoint['skipped']}, "
+            f"anomalies {checkpoint['anomalies']}, {rate:.0f} records/s"
+        )
+
+    batch = []
+    record_number = checkpoint["records_done"] - 1
+    for record_number, record in iter_records(path, file_format, text_field, timestamp_field):
+        if record_number < checkpoint["records_done"]:
+            continue
+        if not record["user_text"]:
+            checkpoint["skipped"] += 1
+        else:
+            # Stable per-record reference: replaying a batch after a crash is a no-op
+            record["import_ref"] = f"{user_id}:{source_name}:{record_number}"
+            batch.append(record)
+
+        if len(batch) >= batch_size:
+            flush(batch, record_number)
+            batch = []
+
+    if record_number + 1 > checkpoint["records_done"]:
+        flush(batch, record_number)
+
+    print(f"Done: {checkpoint['inserted']} inserted, {checkpoint['skipped']} skipped, {checkpoint['anomalies']} anomalies")
+    return checkpoint
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk-import check-ins from JSONL or CSV")
+    parser.add_argument("path", help="JSONL or CSV file to import")
+    parser.add_argument("--user-id", default=DEFAULT_USER_ID, help="User the imported check-ins belong to")
+    parser.add_argument("--format", choices=("jsonl", "csv"), help="Input format (guessed from the extension by default)")
+    parser.add_argument("--batch-size", type=int, default=256, help="Records analysed and inserted per batch")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: <path>.checkpoint)")
+    parser.add_argument("--text-field", default="user_text", help="Column/key holding the entry text")
+    parser.add_argument("--timestamp-field", default="timestamp", help="Column/key holding the entry time (ISO-8601 or epoch seconds)")
+    args = parser.parse_args()
+
+    try:
+        import_file(
+            args.path,
+            user_id=args.user_id,
+            file_format=args.format,
+            batch_size=args.batch_size,
+            checkpoint_path=args.checkpoint,
+            text_field=args.text_field,
+            timestamp_field=args.timestamp_field,
+        )
+    finally:
+        close_mongo_connection()
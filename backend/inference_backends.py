@@ -0,0 +1,79 @@
+# inference_backends.py
+import os
+
+# --- Configuration ---
+# "torch":      full fp32 PyTorch weights (the original behaviour)
+# "torch-int8": PyTorch with dynamic int8 quantization of every nn.Linear layer
+# "onnx":       ONNX Runtime, exported once via optimum and cached on disk
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "torch")
+# Intra-op threads for the selected backend. 0 keeps the library default (all cores).
+INFERENCE_THREADS = int(os.environ.get("INFERENCE_THREADS", "0"))
+# Where the ONNX export is written, so later starts skip the export step
+ONNX_EXPORT_DIR = os.environ.get("ONNX_EXPORT_DIR", "onnx_model")
+# ---------------------
+
+SUPPORTED_BACKENDS = ("torch", "torch-int8", "onnx")
+
+
+def validate_backend(backend: str) -> str:
+    if backend not in SUPPORTED_BACKENDS:
+        raise ValueError(f"Unknown INFERENCE_BACKEND '{backend}', expected one of: {', '.join(SUPPORTED_BACKENDS)}")
+    return backend
+
+
+def configure_threads(threads: int = INFERENCE_THREADS):
+    """Caps torch's intra-op thread pool. ONNX Runtime threads are set per session in load_weights()."""
+    if threads <= 0:
+        return
+    import torch
+    torch.set_num_threads(threads)
+
+
+def load_weights(model_name: str, backend: str = INFERENCE_BACKEND, threads: int = INFERENCE_THREADS):
+    """
+    Loads the sequence-classification model for the requested backend.
+    The returned object can be passed straight to transformers.pipeline().
+    """
+    validate_backend(backend)
+
+    if backend == "onnx":
+        try:
+            import onnxruntime
+            from optimum.onnxruntime import ORTModelForSequenceClassification
+        except ImportError as e:
+            raise ImportError("INFERENCE_BACKEND=onnx requires 'optimum[onnxruntime]' to be installed") from e
+
+        session_options = onnxruntime.SessionOptions()
+        if threads > 0:
+            session_options.intra_op_num_threads = threads
+            session_options.inter_op_num_threads = 1
+        export_path = os.path.join(ONNX_EXPORT_DIR, model_name.replace("/", "__"))
+
+        if os.path.isdir(export_path):
+            return ORTModelForSequenceClassification.from_pretrained(export_path, session_options=session_options)
+
+        print(f"Exporting {model_name} to ONNX at {export_path} (first start only)...")
+        model = ORTModelForSequenceClassification.from_pretrained(model_name, export=True, session_options=session_options)
+        model.save_pretrained(export_path)
+        return model
+
+    import torch
+    from transformers import AutoModelForSequenceClassification
+
+    configure_threads(threads)
+    model = AutoModelForSequenceClassification.from_pretrained(model_name)
+    model.eval()
+
+    if backend == "torch-int8":
+        # Weights of every Linear layer are stored as int8; activations are quantized on the fly
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+
+def pipeline_device(backend: str = INFERENCE_BACKEND) -> int:
+    """transformers device index for the backend: GPU 0 for fp32 torch when available, otherwise CPU."""
+    if backend != "torch":
+        # Dynamic quantization and the ONNX export here are CPU-only
+        return -1
+    import torch
+    return 0 if torch.cuda.is_available() else -1
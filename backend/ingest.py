@@ -0,0 +1,77 @@
+# ingest.py
+import datetime
+from typing import List, Optional
+
+from anomaly import anomaly_engine, fired_magnitudes
+from database import build_checkin_entry, naive_local, DEFAULT_USER_ID
+
+
+def parse_timestamp(value) -> Optional[datetime.datetime]:
+    """
+    Accepts datetimes, ISO-8601 strings or epoch seconds; empty values mean 'now'.
+    Timezone-aware values are converted to naive local time, so every row of a
+    batch can be compared with the others.
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime.datetime):
+        return naive_local(value)
+    if isinstance(value, (int, float)):
+        return datetime.datetime.fromtimestamp(value)
+    text = str(value).strip()
+    try:
+        return datetime.datetime.fromtimestamp(float(text))
+    except ValueError:
+        pass
+    # Python < 3.11 does not accept a trailing 'Z'
+    return naive_local(datetime.datetime.fromisoformat(text.replace("Z", "+00:00")))
+
+
+def earliest_timestamp(records: List[dict]) -> Optional[datetime.datetime]:
+    """
+    The earliest explicit timestamp in a batch, or None when every record is
+    stamped 'now'. Only history up to this time should seed the batch's baseline.
+    """
+    timestamps = [parse_timestamp(record.get("timestamp")) for record in records]
+    return min((timestamp for timestamp in timestamps if timestamp is not None), default=None)
+
+
+def prepare_checkin_batch(records: List[dict], analyses: List[dict], baseline, user_id: str = DEFAULT_USER_ID) -> List[dict]:
+    """
+    Turns one user's analysed records into check-in documents, ordered
+    chronologically and with anomaly flags computed in that order in a single pass.
+
+    Each record is a dict with `user_text`, an optional `timestamp` and an optional
+    `import_ref`. `baseline` must hold the history up to the batch's earliest
+    timestamp (see earliest_timestamp()). The detector state is copied, so the live
+    one only changes once the documents are actually inserted.
+    """
+    now = datetime.datetime.now()
+    rows = []
+    for position, (record, analysis) in enumerate(zip(records, analyses)):
+        timestamp = parse_timestamp(record.get("timestamp")) or now
+        rows.append((timestamp, position, record, analysis))
+    # Stable sort: entries without a timestamp keep their submission order
+    rows.sort(key=lambda row: (row[0], row[1]))
+
+    running = baseline.copy() if baseline is not None else None
+    entries = []
+    for timestamp, _, record, analysis in rows:
+        report = anomaly_engine.check(running, analysis["sentiment"])
+        entry = build_checkin_entry(
+            user_text=record["user_text"],
+            sentiment_score=analysis["sentiment"],
+            keyword_intensity=analysis["intensity"],
+            anomaly_flag=report["is_anomaly"],
+            timestamp=timestamp,
+            user_id=user_id,
+            anomaly_detectors=fired_magnitudes(report),
+            model_version=analysis.get("model_version"),
+            keyword_terms=analysis.get("terms", []),
+        )
+        if record.get("import_ref"):
+            entry["import_ref"] = record["import_ref"]
+        entries.append(entry)
+        if running is not None:
+            running.add(analysis["sentiment"])
+    return entries
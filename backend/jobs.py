@@ -0,0 +1,461 @@
+#!/usr/bin/env python3
+"""
+Background jobs: deferred check-in analysis and re-scoring with a new model.
+
+Jobs live in a local SQLite queue (WAL mode), so they survive restarts and no
+broker is needed. A JobRunner claims them one at a time and executes them on a
+process pool whose workers each load the model once. A claimed job holds a
+lease; if its worker dies the lease expires and another runner picks it up, and
+failures are retried with backoff up to JOB_MAX_ATTEMPTS. Every handler is
+idempotent, so running a job twice is harmless.
+
+The API runs JOB_WORKERS processes in-app (see main.py). Workers can also run
+on their own, sharing the queue file:
+
+Usage:
+    python jobs.py --workers 2
+    python jobs.py --rescore
+    python jobs.py --rescore --user-id alice
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import signal
+import sqlite3
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Optional
+
+from bson import ObjectId
+
+from anomaly import anomaly_engine, baseline_store, fired_magnitudes
+from backfill_rollups import backfill_rollups
+from database import (
+    close_mongo_connection, complete_pending_entry, get_mongo_collection, get_score_baseline, ANALYZED_FILTER,
+    PENDING_STATUS,
+)
+from metrics import register_gauge_callback
+from nlp_model import analyze_text, analyze_texts, load_model, MODEL_VERSION
+from reflag_anomalies import reflag_user
+from versions import bump_user_versions
+
+# --- Configuration ---
+JOB_QUEUE_PATH = os.environ.get("JOB_QUEUE_PATH", "jobs.sqlite3")
+# Worker processes started inside the API process; 0 leaves jobs to `python jobs.py`
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "0"))
+# A running job whose lease lapses (worker crashed or was killed) is handed out again
+JOB_LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", "300"))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))
+# Retry n waits JOB_RETRY_DELAY_SECONDS * 2 ** (n - 1)
+JOB_RETRY_DELAY_SECONDS = float(os.environ.get("JOB_RETRY_DELAY_SECONDS", "5"))
+# How often an idle runner checks the queue for jobs enqueued by other processes
+JOB_POLL_SECONDS = float(os.environ.get("JOB_POLL_SECONDS", "1.0"))
+# Entries re-analysed per model call (and per MongoDB round trip) by rescore jobs
+RESCORE_BATCH_SIZE = int(os.environ.get("RESCORE_BATCH_SIZE", "256"))
+# ---------------------
+
+JOB_STATUSES = ("queued", "running", "done", "failed")
+
+JOBS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    dedupe_key TEXT,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at REAL NOT NULL,
+    lease_until REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, available_at, id);
+CREATE INDEX IF NOT EXISTS jobs_dedupe ON jobs (dedupe_key, status);
+"""
+
+
+class JobQueue:
+    """
+    Persistent FIFO of jobs in a SQLite file. Safe to share between threads of
+    one process and between processes: claims run in BEGIN IMMEDIATE
+    transactions, so a job is only ever leased to one runner at a time.
+    """
+
+    def __init__(self, path: str = JOB_QUEUE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(JOBS_SCHEMA)
+
+    def enqueue(self, kind: str, payload: dict, dedupe_key: Optional[str] = None) -> int:
+        """
+        Adds a job and returns its id. With a dedupe_key, a job with the same key
+        that is still queued or running is returned instead of adding another.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if dedupe_key is not None:
+                    row = self._conn.execute(
+                        "SELECT id FROM jobs WHERE dedupe_key = ? AND status IN ('queued', 'running')", (dedupe_key,)
+                    ).fetchone()
+                    if row is not None:
+                        self._conn.execute("COMMIT")
+                        return row["id"]
+                cursor = self._conn.execute(
+                    "INSERT INTO jobs (kind, payload, dedupe_key, available_at, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (kind, json.dumps(payload), dedupe_key, now, now, now),
+                )
+                self._conn.execute("COMMIT")
+                return cursor.lastrowid
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def claim(self, lease_seconds: float = JOB_LEASE_SECONDS) -> Optional[dict]:
+        """Leases the oldest runnable job (queued, or running with an expired lease), or returns None."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id, kind, payload, attempts FROM jobs"
+                    " WHERE (status = 'queued' AND available_at <= ?) OR (status = 'running' AND lease_until < ?)"
+                    " ORDER BY id LIMIT 1",
+                    (now, now),
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'running', attempts = attempts + 1, lease_until = ?, updated_at = ? WHERE id = ?",
+                        (now + lease_seconds, now, row["id"]),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        return {"id": row["id"], "kind": row["kind"], "payload": json.loads(row["payload"]), "attempts": row["attempts"] + 1}
+
+    def extend_lease(self, job_id: int, lease_seconds: float = JOB_LEASE_SECONDS):
+        """Keeps a long-running job leased to the runner executing it."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET lease_until = ?, updated_at = ? WHERE id = ? AND status = 'running'",
+                (now + lease_seconds, now, job_id),
+            )
+
+    def complete(self, job_id: int, result: Optional[dict] = None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'done', lease_until = NULL, result = ?, error = NULL, updated_at = ? WHERE id = ?",
+                (json.dumps(result), time.time(), job_id),
+            )
+
+    def fail(self, job_id: int, error: str, attempts: int, max_attempts: int = JOB_MAX_ATTEMPTS) -> str:
+        """Requeues the job with exponential backoff, or marks it failed after max_attempts. Returns the new status."""
+        now = time.time()
+        status = "failed" if attempts >= max_attempts else "queued"
+        available_at = now + JOB_RETRY_DELAY_SECONDS * 2 ** (attempts - 1)
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, lease_until = NULL, available_at = ?, error = ?, updated_at = ? WHERE id = ?",
+                (status, available_at, error, now, job_id),
+            )
+        return status
+
+    def get(self, job_id: int) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def counts(self) -> Dict[str, int]:
+        """Number of jobs per status."""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        counts = dict.fromkeys(JOB_STATUSES, 0)
+        counts.update({row["status"]: row["n"] for row in rows})
+        return counts
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# The queue is opened lazily, once per process (API, runner and pool workers alike)
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    global _job_queue
+    if _job_queue is None:
+        with _job_queue_lock:
+            if _job_queue is None:
+                _job_queue = JobQueue(JOB_QUEUE_PATH)
+    return _job_queue
+
+
+def _reset_after_fork():
+    # The queue's sqlite connection must not cross fork(); a forked worker opens its own
+    global _job_queue, _job_queue_lock
+    _job_queue, _job_queue_lock = None, threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+def job_counts() -> dict:
+    """Jobs by status; all zero until something has opened the queue, so scrapes never create its file."""
+    queue = _job_queue
+    if queue is None:
+        return dict.fromkeys(JOB_STATUSES, 0)
+    return queue.counts()
+
+
+register_gauge_callback(
+    "background_jobs", "Jobs in the local job queue by status.", ("status",),
+    lambda: {(status,): count for status, count in job_counts().items()})
+
+
+def enqueue_analysis(entry_id) -> int:
+    """Queues the analysis of a deferred check-in stored by insert_pending_entry_async."""
+    return get_job_queue().enqueue("analyze_checkin", {"entry_id": str(entry_id)}, dedupe_key=f"analyze:{entry_id}")
+
+
+def enqueue_rescore(user_id: Optional[str] = None, model_version: str = MODEL_VERSION) -> int:
+    """Queues re-scoring of one user's entries, or of every user's when user_id is None."""
+    if user_id is None:
+        return get_job_queue().enqueue("rescore_all", {"model_version": model_version}, dedupe_key=f"rescore:*:{model_version}")
+    return get_job_queue().enqueue(
+        "rescore_user", {"user_id": user_id, "model_version": model_version}, dedupe_key=f"rescore:{user_id}:{model_version}"
+    )
+
+
+# --- Job Handlers (run inside the pool worker processes) ---
+
+def analyze_checkin(payload: dict) -> dict:
+    """
+    Scores a deferred check-in and flags it against the user's history as it
+    stands now. Entries that are gone or already analysed are skipped.
+    """
+    collection = get_mongo_collection()
+    entry = collection.find_one({"_id": ObjectId(payload["entry_id"])})
+    if entry is None or entry.get("analysis_status") != PENDING_STATUS:
+        return {"skipped": True}
+
+    analysis = analyze_text(entry["user_text"])
+    # The worker's cached baseline; re-seeded only if other processes have written to the user's history since
+    report = anomaly_engine.check(get_score_baseline(entry["user_id"]), analysis["sentiment"])
+    completed = complete_pending_entry(entry, analysis, report["is_anomaly"], fired_magnitudes(report))
+    return {
+        "user_id": entry["user_id"],
+        "sentiment": analysis["sentiment"],
+        "anomaly_flag": report["is_anomaly"],
+        "skipped": not completed,
+    }
+
+
+def rescore_user(payload: dict) -> dict:
+    """
+    Re-analyses a user's entries whose model_version differs from the running
+    model, RESCORE_BATCH_SIZE at a time, then re-flags anomalies and rebuilds
+    the user's rollups. Rescored entries stop matching the query, so an
+    interrupted job resumes where it stopped and a repeated one does nothing.
+    """
+    user_id, model_version = payload["user_id"], payload["model_version"]
+    if model_version != MODEL_VERSION:
+        # Retrying on this worker would never help; the job needs a worker running that model
+        raise RuntimeError(f"Job wants model_version {model_version!r} but this worker runs {MODEL_VERSION!r}")
+    if not load_model():
+        raise RuntimeError("Model is not loaded; refusing to overwrite scores with fallback values")
+
+    collection = get_mongo_collection()
+    query = dict(ANALYZED_FILTER, user_id=user_id, model_version={"$ne": model_version})
+    rescored = 0
+    while True:
+        batch = list(collection.find(query, {"user_text": 1}).sort("_id", 1).limit(RESCORE_BATCH_SIZE))
+        if not batch:
+            break
+        analyses = analyze_texts([entry.get("user_text", "") for entry in batch])
+        for entry, analysis in zip(batch, analyses):
+            collection.update_one(
+                {"_id": entry["_id"], "model_version": {"$ne": model_version}},
+                {"$set": {
+                    "sentiment_score": analysis["sentiment"],
+                    "keyword_intensity": analysis["intensity"],
+                    "keyword_terms": analysis.get("terms", []),
+                    "model_version": model_version,
+                }},
+            )
+        rescored += len(batch)
+        bump_user_versions(user_id)
+
+    if rescored:
+        # New scores move every detector statistic and every rollup bucket
+        reflag_user(anomaly_engine, user_id)
+        backfill_rollups(user_id=user_id)
+    return {"user_id": user_id, "rescored": rescored}
+
+
+def rescore_all(payload: dict) -> dict:
+    """Fans out into one rescore_user job per user, so users are re-scored in parallel."""
+    user_ids = sorted(get_mongo_collection().distinct("user_id", ANALYZED_FILTER))
+    for user_id in user_ids:
+        enqueue_rescore(user_id, payload["model_version"])
+    return {"users": len(user_ids)}
+
+
+JOB_HANDLERS: Dict[str, Callable[[dict], dict]] = {
+    "analyze_checkin": analyze_checkin,
+    "rescore_user": rescore_user,
+    "rescore_all": rescore_all,
+}
+
+
+def init_worker():
+    """Pool initializer: load the model once per worker process, not once per job."""
+    # Ctrl-C goes to the whole process group; let the runner decide when workers stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    load_model()
+
+
+def execute_job(kind: str, payload: dict) -> dict:
+    """Entry point in the worker process for one claimed job."""
+    handler = JOB_HANDLERS.get(kind)
+    if handler is None:
+        raise ValueError(f"Unknown job kind '{kind}'. Use one of: {', '.join(JOB_HANDLERS)}")
+    return handler(payload)
+
+
+def apply_job_result(kind: str, result: Optional[dict]):
+    """
+    Drops this process's anomaly baseline of a user whose history a finished job
+    changed. The job worker bumped the user's version after writing, so every
+    process re-seeds that baseline on next use anyway. Adding the job's score
+    here, as before, would count it twice after such a re-seed.
+    """
+    if not result or result.get("skipped"):
+        return
+    if kind == "analyze_checkin" or (kind == "rescore_user" and result.get("rescored")):
+        baseline_store.reset(result["user_id"])
+
+
+class JobRunner:
+    """
+    Claims jobs from the queue and runs them on a process pool, keeping at most
+    one job per worker in flight. One dispatcher thread does the claiming and
+    renews the lease of every job still running.
+    """
+
+    def __init__(self, queue: JobQueue, workers: int, on_result: Callable[[str, Optional[dict]], None] = apply_job_result):
+        self.queue = queue
+        self.workers = max(1, workers)
+        self.on_result = on_result
+        self._executor = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._in_flight = {}
+        self._slots = threading.Semaphore(self.workers)
+
+    def start(self):
+        # spawn: workers must not inherit the parent's Mongo clients, event loop or threads
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"), initializer=init_worker,
+        )
+        self._thread = threading.Thread(target=self._dispatch, name="job-dispatcher", daemon=True)
+        self._thread.start()
+        print(f"Job runner started: {self.workers} worker process(es), queue '{self.queue.path}'")
+
+    def notify(self):
+        """Wakes the dispatcher right away instead of at the next poll."""
+        self._wake.set()
+
+    def stop(self, wait: bool = True):
+        """Stops claiming jobs. With wait, jobs already running finish; otherwise their leases expire and they are retried."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+        print("Job runner stopped.")
+
+    def _dispatch(self):
+        last_renewal = time.monotonic()
+        while not self._stop.is_set():
+            if time.monotonic() - last_renewal > JOB_LEASE_SECONDS / 3:
+                for job_id in list(self._in_flight):
+                    self.queue.extend_lease(job_id)
+                last_renewal = time.monotonic()
+
+            if not self._slots.acquire(timeout=JOB_POLL_SECONDS):
+                continue
+            job = self.queue.claim() if not self._stop.is_set() else None
+            if job is None:
+                self._slots.release()
+                self._wake.wait(JOB_POLL_SECONDS)
+                self._wake.clear()
+                continue
+
+            self._in_flight[job["id"]] = job
+            future = self._executor.submit(execute_job, job["kind"], job["payload"])
+            future.add_done_callback(lambda done, job=job: self._finish(job, done))
+
+    def _finish(self, job: dict, future):
+        self._in_flight.pop(job["id"], None)
+        self._slots.release()
+        if future.cancelled():
+            return  # Shut down before it started; the lease expires and it runs again
+        error = future.exception()
+        if error is not None:
+            message = "".join(traceback.format_exception_only(type(error), error)).strip()
+            status = self.queue.fail(job["id"], message, job["attempts"])
+            print(f"WARNING: Job {job['id']} ({job['kind']}) failed on attempt {job['attempts']}: {message} -> {status}")
+            return
+        result = future.result()
+        self.queue.complete(job["id"], result)
+        try:
+            self.on_result(job["kind"], result)
+        except Exception as e:
+            print(f"WARNING: Could not apply result of job {job['id']} ({job['kind']}): {e}")
+        self._wake.set()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run background job workers or enqueue re-scoring")
+    parser.add_argument("--workers", type=int, default=max(1, JOB_WORKERS), help="Worker processes to run")
+    parser.add_argument("--rescore", action="store_true", help=f"Enqueue re-scoring with {MODEL_VERSION} and exit")
+    parser.add_argument("--user-id", help="With --rescore, only re-score this user")
+    args = parser.parse_args()
+
+    if args.rescore:
+        job_id = enqueue_rescore(args.user_id)
+        print(f"Enqueued re-scoring job {job_id} for {args.user_id or 'every user'} ({MODEL_VERSION})")
+    else:
+        runner = JobRunner(get_job_queue(), args.workers)
+        runner.start()
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            print("Stopping, waiting for running jobs...")
+        finally:
+            runner.stop(wait=True)
+            close_mongo_connection()
@@ -0,0 +1,158 @@
+# lexicon.py
+"""
+Keyword intensity stage: matches distress and coping terms in check-in texts.
+
+All lexicon terms are compiled into one Aho-Corasick automaton over words, so an
+entry is scanned once, in time linear in its length, however many terms the
+lexicon holds. Multi-word terms ("can't sleep", "panic attack") match as
+phrases. Overlapping matches resolve to the leftmost longest term, so "panic
+attack" never also counts as "panic".
+
+keyword_intensity is the saturating distress load of an entry,
+1 - exp(-sum of matched distress weights): one strong term gives ~0.6, two ~0.85.
+Coping terms don't lower it; they are reported and stored alongside, so trends
+can show both.
+
+The built-in lexicon can be replaced with LEXICON_PATH, a JSON file of the form
+{"distress": {"hopeless": 1.0, ...}, "coping": {"went for a run": 0.5, ...}}.
+"""
+
+import hashlib
+import json
+import math
+import os
+import re
+from typing import Dict, List, Tuple
+
+# --- Configuration ---
+# Optional JSON lexicon replacing DEFAULT_LEXICON
+LEXICON_PATH = os.environ.get("LEXICON_PATH", "")
+# ---------------------
+
+CATEGORIES = ("distress", "coping")
+
+# Weights are how strongly a term signals its category, in (0, 1]
+DEFAULT_LEXICON = {
+    "distress": {
+        "hopeless": 1.0, "hopelessness": 1.0, "worthless": 1.0, "suicidal": 1.0, "self harm": 1.0,
+        "want to die": 1.0, "end it all": 1.0, "no way out": 0.9, "no point": 0.8, "give up": 0.7,
+        "panic attack": 0.9, "panic": 0.6, "anxiety": 0.6, "anxious": 0.6, "terrified": 0.7, "scared": 0.5,
+        "depressed": 0.8, "depression": 0.8, "miserable": 0.7, "empty": 0.5, "numb": 0.6, "crying": 0.6,
+        "lonely": 0.6, "alone": 0.4, "isolated": 0.6, "overwhelmed": 0.6, "exhausted": 0.5, "burned out": 0.6,
+        "burnt out": 0.6, "stressed": 0.5, "stress": 0.4, "can't cope": 0.8, "cant cope": 0.8,
+        "can't sleep": 0.6, "cant sleep": 0.6, "insomnia": 0.6, "nightmares": 0.5, "angry": 0.4,
+        "ashamed": 0.6, "guilty": 0.5, "failure": 0.6, "broken": 0.6, "trapped": 0.7, "desperate": 0.8,
+    },
+    "coping": {
+        "therapy": 0.6, "therapist": 0.6, "counselor": 0.6, "meditated": 0.5, "meditation": 0.5,
+        "breathing exercises": 0.5, "went for a walk": 0.5, "went for a run": 0.5, "exercise": 0.4,
+        "exercised": 0.4, "journaling": 0.4, "talked to": 0.4, "called my": 0.4, "reached out": 0.6,
+        "support": 0.4, "rested": 0.3, "slept well": 0.5, "grateful": 0.5, "gratitude": 0.5,
+        "calm": 0.4, "relaxed": 0.4, "hopeful": 0.5, "better": 0.3, "proud": 0.4,
+    },
+}
+
+_WORD = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+# Curly quotes are common on phones; match them like a plain apostrophe
+_APOSTROPHES = str.maketrans({"’": "'", "‘": "'", "ʼ": "'"})
+
+
+def tokenize(text: str) -> List[str]:
+    return _WORD.findall(text.lower().translate(_APOSTROPHES))
+
+
+def load_lexicon(path: str = LEXICON_PATH) -> Dict[str, Dict[str, float]]:
+    """The lexicon at `path`, or DEFAULT_LEXICON. Terms are normalized to their tokenized form."""
+    if not path:
+        raw = DEFAULT_LEXICON
+    else:
+        with open(path, encoding="utf-8") as handle:
+            raw = json.load(handle)
+    unknown = set(raw) - set(CATEGORIES)
+    if unknown:
+        raise ValueError(f"Unknown lexicon categories: {', '.join(sorted(unknown))}. Use: {', '.join(CATEGORIES)}")
+    lexicon = {}
+    for category in CATEGORIES:
+        lexicon[category] = {}
+        for term, weight in raw.get(category, {}).items():
+            normalized = " ".join(tokenize(term))
+            if not normalized:
+                raise ValueError(f"Lexicon term {term!r} has no words")
+            lexicon[category][normalized] = float(weight)
+    return lexicon
+
+
+class LexiconMatcher:
+    """Word-level Aho-Corasick automaton over every term of a lexicon."""
+
+    def __init__(self, lexicon: Dict[str, Dict[str, float]]):
+        # Trie over words: goto[state] maps the next word to a state; state 0 is the root
+        self.goto = [{}]
+        self.fail = [0]
+        self.outputs = [[]]  # state -> [(term, category, weight, length in words)], own term first
+        for category, terms in lexicon.items():
+            for term, weight in terms.items():
+                state = 0
+                words = term.split(" ")
+                for word in words:
+                    following = self.goto[state].get(word)
+                    if following is None:
+                        following = self.goto[state][word] = len(self.goto)
+                        self.goto.append({})
+                        self.fail.append(0)
+                        self.outputs.append([])
+                    state = following
+                self.outputs[state] = [(term, category, weight, len(words))]
+        self._link()
+        self.terms = sum(len(terms) for terms in lexicon.values())
+        self.version = hashlib.sha1(json.dumps(lexicon, sort_keys=True).encode("utf-8")).hexdigest()[:8]
+
+    def _link(self):
+        """Breadth-first pass setting failure links and merging each state's outputs with its fallback's."""
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for word, following in self.goto[state].items():
+                fallback = self.fail[state]
+                while fallback and word not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[following] = self.goto[fallback].get(word, 0)
+                self.outputs[following] = self.outputs[following] + self.outputs[self.fail[following]]
+                queue.append(following)
+
+    def find(self, text: str) -> List[Tuple[str, str, float]]:
+        """(term, category, weight) for each match, leftmost longest first, without overlaps."""
+        matches = []  # (start word, -length, term, category, weight)
+        state = 0
+        for position, word in enumerate(tokenize(text)):
+            while state and word not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(word, 0)
+            for term, category, weight, length in self.outputs[state]:
+                matches.append((position - length + 1, -length, term, category, weight))
+
+        found, covered_until = [], 0
+        for start, negative_length, term, category, weight in sorted(matches):
+            if start >= covered_until:
+                found.append((term, category, weight))
+                covered_until = start - negative_length
+        return found
+
+    def analyze(self, text: str) -> dict:
+        """Matched terms (distinct, in order of appearance) and the entry's distress intensity."""
+        terms, distress = [], 0.0
+        for term, category, weight in self.find(text):
+            if term in terms:
+                continue  # A repeated word is not extra evidence
+            terms.append(term)
+            if category == "distress":
+                distress += weight
+        return {"intensity": 1.0 - math.exp(-distress), "terms": terms}
+
+    def analyze_batch(self, texts: List[str]) -> List[dict]:
+        return [self.analyze(text) for text in texts]
+
+
+# Compiled once per process at import; forked workers share it
+lexicon_matcher = LexiconMatcher(load_lexicon())
+LEXICON_VERSION = lexicon_matcher.version
+
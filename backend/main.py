@@ -1,74 +1,172 @@
 # main.py
+import asyncio
 import datetime
-from typing import List, Optional
+import itertools
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import AsyncIterable, AsyncIterator, Dict, List, Optional
 
 # Third-party libraries
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-import pandas as pd
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
 
 # Local modules
-from database import get_mongo_collection, insert_checkin_entry, close_mongo_connection
-from nlp_model import analyze_text
+from database import (
+    close_mongo_connection, serialize_timeline_entry, encode_timeline_cursor, decode_timeline_cursor, naive_local,
+    TIMELINE_FIELDS, DEFAULT_USER_ID,
+)
+from admission import AdmissionController, Overloaded, register_admission_gauges, ADMISSION_MAX_LIMIT, ADMISSION_OVERLOAD_ACTION
+from anomaly import anomaly_engine, fired_magnitudes
+from ingest import earliest_timestamp, prepare_checkin_batch
+from jobs import enqueue_analysis, enqueue_rescore, get_job_queue, JobRunner, JOB_WORKERS
+from metrics import http_request_seconds, render_metrics, span
+from nlp_model import (
+    analyze_text, analyze_texts, get_inference_stats, get_model_status, start_model_loading, INFERENCE_MAX_BATCH_SIZE, MODEL_VERSION,
+)
+from response_cache import cache_streamed_body, etag_matches, response_cache, response_etag
+from rollups import summarize_rollup, GRANULARITIES
+from storage import (
+    connect_storage, close_storage, ensure_schema_async, get_score_baseline_async, insert_checkin_entry_async,
+    insert_checkin_entries_async, insert_pending_entry_async, find_timeline_entries_async, find_rollups_async, write_buffer,
+    require_mongo, STORAGE_BACKEND,
+)
+from profiling import request_profiler, PROFILING_TOKEN
+from write_buffer import WriteBufferFull
 from bson import ObjectId 
 
+# --- Inference Executor ---
+# Model inference is the only CPU-bound step of a check-in; it runs on this bounded
+# pool so the event loop stays free for I/O. Workers only wait on the micro-batcher,
+# so the default leaves room for two full batches in flight.
+INFERENCE_EXECUTOR_WORKERS = int(os.environ.get("INFERENCE_EXECUTOR_WORKERS", str(max(4, INFERENCE_MAX_BATCH_SIZE * 2))))
+inference_executor = None
+# Check-ins beyond the executor would only queue in front of it, so that caps the admission limit
+admission_controller = AdmissionController(max_limit=ADMISSION_MAX_LIMIT or INFERENCE_EXECUTOR_WORKERS)
+register_admission_gauges(admission_controller)
+
+# --- Check-in Mode ---
+# "sync": analyse before responding. "deferred": store the entry, respond 202 and
+# let a background job analyse it (see jobs.py). A request's `defer` field overrides this.
+CHECKIN_MODE = os.environ.get("CHECKIN_MODE", "sync").lower()
+if CHECKIN_MODE not in ("sync", "deferred"):
+    raise ValueError(f"Unknown CHECKIN_MODE '{CHECKIN_MODE}'. Use 'sync' or 'deferred'.")
+if CHECKIN_MODE == "deferred":
+    require_mongo("CHECKIN_MODE=deferred")
+if admission_controller.enabled and ADMISSION_OVERLOAD_ACTION == "defer":
+    require_mongo("ADMISSION_OVERLOAD_ACTION=defer")
+job_runner = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Starts model loading, opens the storage backend (the async MongoDB pool by default)
+    and inference executor, starts the in-app job workers if JOB_WORKERS is set, and
+    closes everything on shutdown.
+    """
+    global inference_executor, job_runner
+    start_model_loading()
+    inference_executor = ThreadPoolExecutor(max_workers=INFERENCE_EXECUTOR_WORKERS, thread_name_prefix="inference")
+    await connect_storage()
+    await ensure_schema_async()
+    await write_buffer.start()
+    if JOB_WORKERS > 0 and STORAGE_BACKEND == "mongo":
+        job_runner = JobRunner(get_job_queue(), JOB_WORKERS)
+        job_runner.start()
+    try:
+        yield
+    finally:
+        if job_runner is not None:
+            # Unfinished jobs stay in the queue and are retried once their lease expires
+            await asyncio.to_thread(job_runner.stop, False)
+            job_runner = None
+        # Write out buffered check-ins while storage is still open
+        await write_buffer.stop()
+        await close_storage()
+        close_mongo_connection()
+        inference_executor.shutdown(wait=False, cancel_futures=True)
+        inference_executor = None
+
 # Initialize the FastAPI application
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+# Largest page a single paginated /timeline request may ask for
+MAX_TIMELINE_PAGE_SIZE = 1000
+# Most entries accepted by one POST /checkin/batch; larger imports should use import_checkins.py
+MAX_CHECKIN_BATCH_SIZE = 1000
 
 # --- Pydantic Models for Data Validation ---
 
+# Identifies whose history a check-in belongs to; anomaly baselines are per user
+UserId = Field(DEFAULT_USER_ID, min_length=1, max_length=128)
+
 class CheckinRequest(BaseModel):
     """Model for incoming user check-in data."""
     user_text: str
+    user_id: str = UserId
+    defer: Optional[bool] = None # Analyse in the background and respond 202; defaults to CHECKIN_MODE
+
+class DetectorResult(BaseModel):
+    """One anomaly detector's verdict; magnitude is how far past its threshold the score was."""
+    detector: str
+    fired: bool
+    value: float
+    statistic: Optional[float] = None
+    threshold: Optional[float] = None
+    magnitude: Optional[float] = None # None until the user has enough history
 
 class CheckinResponse(BaseModel):
     """Model for data returned after a single check-in."""
     id: str
     timestamp: datetime.datetime
-    sentiment_score: float
+    sentiment_score: Optional[float] = None # None while a deferred check-in awaits analysis
+    keyword_intensity: Optional[float] = None # Distress load of the matched lexicon terms, 0 to 1
+    keyword_terms: Optional[List[str]] = None # Distress and coping terms found in the text
     anomaly_flag: bool
     support_message: Optional[str] = None # The supportive message/nudge
     user_text: Optional[str] = None
+    user_id: Optional[str] = None
+    anomaly_detectors: Dict[str, float] = Field(default_factory=dict) # Detectors that fired -> magnitude
+    anomaly_details: Optional[List[DetectorResult]] = None # Every configured detector (single check-ins only)
+    analysis_status: str = "complete" # "pending" until a deferred check-in's job has run
+    job_id: Optional[int] = None # Poll GET /jobs/{job_id} for a deferred check-in
 
-# --- Helper Functions ---
+class BatchCheckinItem(BaseModel):
+    """One historical or backfilled entry inside a batch upload."""
+    user_text: str
+    timestamp: Optional[datetime.datetime] = None # Defaults to the time of the upload
 
-def check_for_anomaly(all_entries: List[dict], new_score: float) -> bool:
-    """
-    Checks if the new score represents a significant, negative shift 
-    using the Interquartile Range (IQR) rule against historical data.
-    """
-    
-    # Needs at least 4 past data points to establish a stable baseline (e.g., 3 days + new day)
-    if len(all_entries) < 4: 
-        return False
-        
-    # Gather only historical scores (sentiment_score is a float from 0.0 to 1.0)
-    historical_scores = [entry['sentiment_score'] for entry in all_entries]
-    
-    df = pd.DataFrame(historical_scores, columns=['score'])
-    
-    # Calculate key statistics (Median and IQR are robust against outliers)
-    Q1 = df['score'].quantile(0.25)
-    Q3 = df['score'].quantile(0.75)
-    IQR = Q3 - Q1
+class CheckinBatchRequest(BaseModel):
+    """Model for bulk check-in ingestion. All entries belong to one user."""
+    user_id: str = UserId
+    entries: List[BatchCheckinItem] = Field(..., min_length=1, max_length=MAX_CHECKIN_BATCH_SIZE)
 
-    # Anomaly Rule: 1.5 * IQR below the first quartile (Q1)
-    LOWER_BOUND = Q1 - (1.5 * IQR)
-    
-    # Anomaly is flagged if the new score is significantly below the typical low point.
-    if new_score < LOWER_BOUND:
-        print(f"ANOMALY DETECTED! New Score ({new_score:.2f}) is below Lower Bound ({LOWER_BOUND:.2f})")
-        return True
-        
-    return False
+class CheckinBatchResponse(BaseModel):
+    """Summary and saved entries for a bulk check-in upload, in chronological order."""
+    inserted: int
+    anomalies: int
+    entries: List[CheckinResponse]
 
+# --- Helper Functions ---
 
-def generate_support_message(sentiment_score: float, is_anomaly: bool) -> str:
+def generate_support_message(sentiment_score: float, is_anomaly: bool, anomaly_detectors: Optional[Dict[str, float]] = None) -> str:
     """
     Generates a supportive message (nudge) based on the analysis.
+    `anomaly_detectors` says which detectors fired, so a gradual decline
+    (change point) gets a different nudge from a single sharp dip.
     """
     
     # 1. Anomaly/Crisis Nudge (Highest Priority)
+    if is_anomaly and "cusum" in (anomaly_detectors or {}):
+        return (
+            "📉 Sustained Change Detected. Your entries have been trending below your usual level for a while now. "
+            "Consider talking it through with someone you trust or a support professional. "
+            "Remember: small steps are still progress."
+        )
     if is_anomaly:
         return (
             "⚠️ Significant Change Detected. Your recent entries show a notable dip below your typical baseline. "
@@ -98,79 +196,547 @@ def generate_support_message(sentiment_score: float, is_anomaly: bool) -> str:
         )
 
 
+def parse_timeline_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """Validates the comma-separated `fields` projection for /timeline."""
+    if not fields:
+        return None
+    selected = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in selected if field not in TIMELINE_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown timeline field(s): {', '.join(unknown)}. Allowed: {', '.join(TIMELINE_FIELDS)}")
+    return selected
+
+
+async def prefetch_first(entries: AsyncIterable[dict]) -> AsyncIterator[dict]:
+    """Reads the first entry eagerly and returns an async iterator that yields everything."""
+    iterator = entries.__aiter__()
+    try:
+        first = await iterator.__anext__()
+    except StopAsyncIteration:
+        return iterate_list([])
+
+    async def chained():
+        yield first
+        async for entry in iterator:
+            yield entry
+    return chained()
+
+
+def timeline_key(entry: dict):
+    return entry["timestamp"], entry["_id"]
+
+
+def buffered_timeline_entries(user_id: str, start, end, after) -> List[dict]:
+    """Accepted check-ins the write-behind buffer has not written yet that match a timeline query, in timeline order."""
+    # Bounded like build_timeline_query: aware bounds as naive local time
+    start, end = naive_local(start), naive_local(end)
+    entries = [
+        entry for entry in write_buffer.buffered(user_id)
+        if (start is None or entry["timestamp"] >= start)
+        and (end is None or entry["timestamp"] < end)
+        and (after is None or timeline_key(entry) > (naive_local(after[0]), after[1]))
+    ]
+    return sorted(entries, key=timeline_key)
+
+
+async def merge_buffered(entries: AsyncIterable[dict], buffered: List[dict]) -> AsyncIterator[dict]:
+    """
+    Interleaves buffered check-ins into a timeline stream in (timestamp, _id) order.
+    An entry flushed while the request runs can show up in both; the buffered copy wins.
+    """
+    buffered_ids = {entry["_id"] for entry in buffered}
+    position = 0
+    async for entry in entries:
+        if entry["_id"] in buffered_ids:
+            continue
+        while position < len(buffered) and timeline_key(buffered[position]) < timeline_key(entry):
+            yield buffered[position]
+            position += 1
+        yield entry
+    for entry in buffered[position:]:
+        yield entry
+
+
+async def iterate_list(entries: List[dict]) -> AsyncIterator[dict]:
+    """Adapts an in-memory page to the async streaming helpers."""
+    for entry in entries:
+        yield entry
+
+
+async def stream_json_array(entries: AsyncIterable[dict], fields: Optional[List[str]]) -> AsyncIterator[str]:
+    """Serializes entries into a JSON array one document at a time."""
+    with span("timeline", "stream"):
+        yield "["
+        separator = ""
+        async for entry in entries:
+            yield separator + json.dumps(serialize_timeline_entry(entry, fields))
+            separator = ","
+        yield "]"
+
+
+async def stream_ndjson(entries: AsyncIterable[dict], fields: Optional[List[str]]) -> AsyncIterator[str]:
+    """Serializes entries as newline-delimited JSON, one document per line."""
+    with span("timeline", "stream"):
+        async for entry in entries:
+            yield json.dumps(serialize_timeline_entry(entry, fields)) + "\n"
+
+
+def cached_response(request: Request, etag: str) -> Optional[Response]:
+    """
+    Answers a GET without MongoDB when possible: 304 if the client already has
+    this version, the stored body if this worker cached it, otherwise None.
+    """
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    cached = response_cache.get(etag)
+    if cached is None:
+        return None
+    body, media_type, extra_headers = cached
+    return Response(content=body, media_type=media_type, headers={**extra_headers, **headers})
+
+
+def require_mongo_storage(feature: str):
+    """501 for features that only work on MongoDB storage (job workers and exports read it directly)."""
+    try:
+        require_mongo(feature)
+    except RuntimeError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+
+
+async def run_inference(text: str) -> dict:
+    """Runs analyze_text on the bounded inference executor without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(inference_executor, analyze_text, text)
+
+
+async def run_batch_inference(texts: List[str]) -> List[dict]:
+    """Runs analyze_texts (padded batches, cache-aware) on the inference executor."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(inference_executor, analyze_texts, texts)
+
+
+# --- Request Instrumentation ---
+
+@app.middleware("http")
+async def instrument_requests(request: Request, call_next):
+    """
+    Records every request in http_request_duration_seconds, labelled by route template
+    so /timeline?cursor=... variants share one series, and runs the sampling
+    profiler for requests it selects. Streamed bodies are timed up to the first byte;
+    the rest shows up in the endpoint's "stream" stage.
+    """
+    profiler = request_profiler.start() if request_profiler.should_profile(request.headers) else None
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        duration = time.perf_counter() - started
+        route = request.scope.get("route")
+        route_path = getattr(route, "path", "unmatched")
+        http_request_seconds.observe(duration, request.method, route_path, str(status))
+        if profiler is not None:
+            profile_id = request_profiler.finish(profiler, request.method, route_path, status, duration)
+            print(f"Profiled {request.method} {request.url.path} as /debug/profiles/{profile_id}")
+
+
 # --- API Endpoints ---
 
 @app.post("/checkin", response_model=CheckinResponse)
-def submit_checkin(request: CheckinRequest):
+async def submit_checkin(request: CheckinRequest, response: Response):
     """
     Receives a new check-in entry, runs AI analysis, checks for anomalies, 
     saves the data, and returns the result with a supportive message.
+    Deferred check-ins are stored unscored and answered with 202; the score,
+    flags and rollups follow once the analyze_checkin job has run. Under overload
+    the admission controller sheds check-ins with 503 and Retry-After, or defers them.
     """
-    
+    defer = request.defer if request.defer is not None else CHECKIN_MODE == "deferred"
+    if not defer:
+        try:
+            slot = await admission_controller.acquire()
+        except Overloaded as e:
+            if ADMISSION_OVERLOAD_ACTION != "defer":
+                raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+            # Shed from the inference path, not dropped: a background job scores it later
+            defer = True
+    if defer:
+        require_mongo_storage("Deferred check-ins")
+        try:
+            with span("checkin", "insert"):
+                entry_id, timestamp = await insert_pending_entry_async(request.user_text, request.user_id)
+            with span("checkin", "enqueue"):
+                job_id = await asyncio.to_thread(enqueue_analysis, entry_id)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error processing check-in: {str(e)}")
+        if job_runner is not None:
+            job_runner.notify()
+        response.status_code = 202
+        return CheckinResponse(
+            id=str(entry_id),
+            timestamp=timestamp,
+            anomaly_flag=False,
+            user_text=request.user_text,
+            user_id=request.user_id,
+            analysis_status="pending",
+            job_id=job_id,
+        )
+
     try:
         # 1. Analyze the text using the sentiment model
-        analysis = analyze_text(request.user_text)
+        with span("checkin", "inference"), slot:
+            analysis = await run_inference(request.user_text)
         
-        # 2. Retrieve all past entries for robust anomaly check
-        collection = get_mongo_collection()
-        # Fetch all entries, ordered by time (descending)
-        past_entries = list(collection.find().sort("timestamp", -1))
+        # 2. Retrieve the historical baseline for a robust anomaly check
+        with span("checkin", "baseline"):
+            baseline = await get_score_baseline_async(request.user_id)
         
-        # 3. Check for anomaly
-        is_anomaly = check_for_anomaly(past_entries, analysis["sentiment"])
+        # 3. Check for anomaly with every configured detector
+        with span("checkin", "anomaly_check"):
+            anomaly = anomaly_engine.check(baseline, analysis["sentiment"])
+        is_anomaly = anomaly["is_anomaly"]
+        anomaly_detectors = fired_magnitudes(anomaly)
         
         # 4. Generate the supportive message
-        support_message = generate_support_message(analysis["sentiment"], is_anomaly)
+        support_message = generate_support_message(analysis["sentiment"], is_anomaly, anomaly_detectors)
 
         # 5. Save the new entry to the database
-        entry_id = insert_checkin_entry(
-            user_text=request.user_text,
-            sentiment_score=analysis["sentiment"],
-            keyword_intensity=analysis["intensity"],
-            anomaly_flag=is_anomaly
-        )
+        with span("checkin", "insert"):
+            entry_id = await insert_checkin_entry_async(
+                user_text=request.user_text,
+                sentiment_score=analysis["sentiment"],
+                keyword_intensity=analysis["intensity"],
+                anomaly_flag=is_anomaly,
+                user_id=request.user_id,
+                anomaly_detectors=anomaly_detectors,
+                model_version=analysis.get("model_version"),
+                keyword_terms=analysis.get("terms", []),
+            )
         
         # 6. Return the saved entry ALONGSIDE the generated message
         return CheckinResponse(
             id=str(entry_id),
             timestamp=datetime.datetime.now(),
             sentiment_score=analysis["sentiment"],
+            keyword_intensity=analysis["intensity"],
+            keyword_terms=analysis.get("terms", []),
             anomaly_flag=is_anomaly,
             support_message=support_message,
-            user_text=request.user_text
+            user_text=request.user_text,
+            user_id=request.user_id,
+            anomaly_detectors=anomaly_detectors,
+            anomaly_details=anomaly["detectors"]
         )
         
+    except WriteBufferFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing check-in: {str(e)}")
         
-# --- 2. GET Endpoint for Timeline Data ---
-@app.get("/timeline", response_model=List[CheckinResponse])
-def get_timeline():
+@app.post("/checkin/batch", response_model=CheckinBatchResponse)
+async def submit_checkin_batch(request: CheckinBatchRequest):
+    """
+    Bulk ingestion for migrations and partner backfills. All texts go through
+    batched inference, anomaly flags are computed in chronological order in one
+    pass, and the entries are written with insert_many.
+    """
+    
     try:
-        # Retrieve all entries, ordered by time
-        collection = get_mongo_collection()
-        entries = list(collection.find().sort("timestamp", 1))
+        # A batch takes one slot, but its latency is not that of a check-in, so it doesn't steer the limit
+        slot = await admission_controller.acquire(observe=False)
+    except Overloaded as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+    try:
+        records = [item.model_dump() for item in request.entries]
+        with span("checkin_batch", "inference"), slot:
+            analyses = await run_batch_inference([record["user_text"] for record in records])
+        with span("checkin_batch", "baseline"):
+            baseline = await get_score_baseline_async(request.user_id, until=earliest_timestamp(records))
+        with span("checkin_batch", "prepare"):
+            entries = prepare_checkin_batch(records, analyses, baseline, request.user_id)
+        with span("checkin_batch", "insert"):
+            inserted = await insert_checkin_entries_async(entries)
+
+        return CheckinBatchResponse(
+            inserted=inserted,
+            anomalies=sum(1 for entry in entries if entry["anomaly_flag"]),
+            entries=[
+                CheckinResponse(
+                    id=str(entry["_id"]),
+                    timestamp=entry["timestamp"],
+                    sentiment_score=entry["sentiment_score"],
+                    keyword_intensity=entry["keyword_intensity"],
+                    keyword_terms=entry.get("keyword_terms", []),
+                    anomaly_flag=entry["anomaly_flag"],
+                    support_message=generate_support_message(
+                        entry["sentiment_score"], entry["anomaly_flag"], entry.get("anomaly_detectors")
+                    ),
+                    user_text=entry["user_text"],
+                    user_id=entry["user_id"],
+                    anomaly_detectors=entry.get("anomaly_detectors", {})
+                )
+                for entry in entries
+            ]
+        )
         
-        # Convert MongoDB documents to response format
-        timeline_data = []
-        for entry in entries:
-            timeline_data.append(CheckinResponse(
-                id=str(entry["_id"]),
-                timestamp=entry["timestamp"],
-                sentiment_score=entry["sentiment_score"],
-                anomaly_flag=entry.get("anomaly_flag", False),
-                user_text=entry.get("user_text", "")
-            ))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing check-in batch: {str(e)}")
         
-        return timeline_data
+# --- 2. GET Endpoint for Timeline Data ---
+@app.get("/timeline", response_model=List[CheckinResponse])
+async def get_timeline(
+    request: Request,
+    user_id: str = Query(DEFAULT_USER_ID, min_length=1, max_length=128, description="Whose check-ins to return"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_TIMELINE_PAGE_SIZE, description="Page size; omit to return every matching entry"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page"),
+    start: Optional[datetime.datetime] = Query(None, description="Only entries at or after this time"),
+    end: Optional[datetime.datetime] = Query(None, description="Only entries before this time"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return, e.g. 'sentiment_score,anomaly_flag'"),
+    format: str = Query("json", pattern="^(json|ndjson)$", description="'json' array or newline-delimited 'ndjson' stream"),
+):
+    """
+    Returns one user's check-ins in chronological order.
+    Without a limit the response is streamed straight from the MongoDB cursor, so
+    memory use stays flat however large the collection gets. With a limit, the
+    X-Next-Cursor response header holds the token for the following page.
+    Responses carry an ETag; a conditional GET for an unchanged timeline gets 304.
+    """
+    try:
+        selected_fields = parse_timeline_fields(fields)
+        after = decode_timeline_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Taken before the query, so a write landing mid-request leaves this response with an outdated ETag
+    etag = response_etag(user_id, "/timeline", request.query_params.multi_items())
+    cached = cached_response(request, etag)
+    if cached is not None:
+        return cached
+
+    try:
+        headers = {}
+        # Read-your-writes: check-ins still in the write-behind buffer are merged in
+        buffered = buffered_timeline_entries(user_id, start, end, after) if write_buffer.enabled else []
+        if limit:
+            # A single page is bounded by MAX_TIMELINE_PAGE_SIZE, so it is safe to read
+            # one extra document up front to find out whether another page follows.
+            with span("timeline", "query"):
+                page = await find_timeline_entries_async(user_id, start, end, after, limit + 1, selected_fields).to_list(length=limit + 1)
+            if buffered:
+                page = [entry async for entry in merge_buffered(iterate_list(page), buffered)][:limit + 1]
+            if len(page) > limit:
+                page = page[:limit]
+                headers["X-Next-Cursor"] = encode_timeline_cursor(page[-1])
+            entries = iterate_list(page)
+        else:
+            entries = find_timeline_entries_async(user_id, start, end, after, None, selected_fields)
+            # Pull the first batch now so connection errors still turn into a 500
+            with span("timeline", "query"):
+                entries = await prefetch_first(entries)
+            if buffered:
+                entries = merge_buffered(entries, buffered)
+
+        if format == "ndjson":
+            body = stream_ndjson(entries, selected_fields)
+            media_type = "application/x-ndjson"
+        else:
+            body = stream_json_array(entries, selected_fields)
+            media_type = "application/json"
+        body = cache_streamed_body(response_cache, etag, body, media_type, headers)
+        return StreamingResponse(body, media_type=media_type, headers={**headers, "ETag": etag, "Cache-Control": "no-cache"})
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving timeline: {str(e)}")
 
-# --- Health Check Endpoint ---
+# --- Trends Endpoint ---
+class TrendBucket(BaseModel):
+    """Aggregated sentiment for one day, week or month."""
+    bucket_start: datetime.datetime
+    count: int
+    anomaly_count: int
+    mean: Optional[float] = None
+    min: Optional[float] = None
+    max: Optional[float] = None
+    p25: Optional[float] = None
+    p50: Optional[float] = None
+    p75: Optional[float] = None
+    terms: Dict[str, int] = Field(default_factory=dict) # Check-ins that matched each lexicon term
+
+@app.get("/trends", response_model=List[TrendBucket])
+async def get_trends(
+    request: Request,
+    user_id: str = Query(DEFAULT_USER_ID, min_length=1, max_length=128, description="Whose trends to return"),
+    granularity: str = Query("day", pattern=f"^({'|'.join(GRANULARITIES)})$", description="Bucket size: day, week or month"),
+    start: Optional[datetime.datetime] = Query(None, description="Only buckets starting at or after this time"),
+    end: Optional[datetime.datetime] = Query(None, description="Only buckets starting before this time"),
+):
+    """
+    Returns per-bucket sentiment aggregates (mean, min, max, quartiles, counts) for
+    charts. Rollups are maintained on insert, so this reads one document per bucket
+    however many check-ins the user has. ETags and caching work as for /timeline.
+    """
+    etag = response_etag(user_id, "/trends", request.query_params.multi_items())
+    cached = cached_response(request, etag)
+    if cached is not None:
+        return cached
+
+    try:
+        with span("trends", "query"):
+            rollups = await find_rollups_async(user_id, granularity, start, end).to_list(length=None)
+        response = JSONResponse([summarize_rollup(rollup) for rollup in rollups], headers={"ETag": etag, "Cache-Control": "no-cache"})
+        response_cache.put(etag, response.body, response.media_type, {})
+        return response
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error retrieving trends: {str(e)}")
+
+# --- Export Endpoint ---
+# The formats of export_checkins.EXPORT_FORMATS; that module (and pyarrow) is imported on the first export
+EXPORT_FORMAT_PATTERN = "^(parquet|arrow)$"
+
+@app.get("/export")
+async def export_checkins(
+    user_id: Optional[str] = Query(None, min_length=1, max_length=128, description="Only this user's check-ins; omit for every user"),
+    start: Optional[datetime.datetime] = Query(None, description="Only entries at or after this time"),
+    end: Optional[datetime.datetime] = Query(None, description="Only entries before this time"),
+    format: str = Query("parquet", pattern=EXPORT_FORMAT_PATTERN, description="'parquet' file or 'arrow' IPC stream"),
+    include_text: bool = Query(False, description="Also export user_text"),
+):
+    """
+    Downloads check-ins as Parquet or an Arrow IPC stream with typed columns (int64
+    epoch-millisecond timestamps, float32 scores). Rows are read from MongoDB and
+    encoded chunk by chunk, so memory stays flat for multi-million-row exports.
+    """
+    # Imported here so pyarrow is only loaded by workers that actually export
+    from export_checkins import export_available, iter_export_bytes, EXPORT_FORMATS
+    if not export_available():
+        raise HTTPException(status_code=501, detail="Exporting needs the optional 'pyarrow' package")
+    require_mongo_storage("Exporting")
+    try:
+        pieces = iter_export_bytes(format, user_id, start, end, include_text)
+        # Encode the first chunk now so query errors still turn into a 500
+        with span("export", "query"):
+            first = await asyncio.to_thread(next, pieces)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error exporting check-ins: {str(e)}")
+
+    filename = f"checkins-{re.sub(r'[^A-Za-z0-9_.-]', '_', user_id) if user_id else 'all'}.{format}"
+    return StreamingResponse(
+        itertools.chain([first], pieces),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+# --- Background Job Endpoints ---
+class RescoreRequest(BaseModel):
+    """Re-score stored entries with the model this server runs."""
+    user_id: Optional[str] = Field(None, min_length=1, max_length=128) # Omit to re-score every user
+
+@app.post("/jobs/rescore", status_code=202)
+async def request_rescore(request: RescoreRequest):
+    """
+    Queues re-scoring of entries whose model_version differs from the running model.
+    The job is idempotent and incremental: asking again while it is queued returns
+    the same job, and a finished one leaves nothing to redo.
+    """
+    require_mongo_storage("Re-scoring")
+    job_id = await asyncio.to_thread(enqueue_rescore, request.user_id)
+    if job_runner is not None:
+        job_runner.notify()
+    return {"job_id": job_id, "user_id": request.user_id, "model_version": MODEL_VERSION}
+
+@app.get("/jobs")
+async def job_counts():
+    """Number of queued, running, done and failed jobs, and the local worker count."""
+    counts = await asyncio.to_thread(get_job_queue().counts)
+    return {"jobs": counts, "workers": job_runner.workers if job_runner is not None else 0, "checkin_mode": CHECKIN_MODE}
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: int):
+    """Status, attempts, result or last error of one job."""
+    job = await asyncio.to_thread(get_job_queue().get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
+
+# --- Health Check Endpoints ---
 @app.get("/health")
 def health_check():
     return {"status": "healthy", "timestamp": datetime.datetime.now()}
+
+@app.get("/health/live")
+def liveness_check():
+    """The process is up and serving requests, whether or not the model is loaded yet."""
+    return {"status": "alive", "timestamp": datetime.datetime.now()}
+
+@app.get("/health/ready")
+def readiness_check():
+    """Returns 200 once the sentiment model is loaded, 503 while loading or after a failed load."""
+    model = get_model_status()
+    body = {
+        "status": "ready" if model["ready"] else "not_ready",
+        "timestamp": datetime.datetime.now().isoformat(),
+        "model": model,
+        "storage": STORAGE_BACKEND,
+    }
+    return JSONResponse(body, status_code=200 if model["ready"] else 503)
+
+# --- Inference Stats Endpoint ---
+@app.get("/inference/stats")
+def inference_stats():
+    """Returns micro-batching throughput, batch size and latency figures."""
+    return dict(get_inference_stats(), admission=admission_controller.stats())
+
+# --- Metrics and Profiling Endpoints ---
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """Prometheus text exposition: request/stage latencies, model batch sizes, queue depth and Mongo pool stats."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+class ProfilingSettings(BaseModel):
+    """Runtime switch for the per-request sampling profiler."""
+    enabled: bool
+    sample_rate: Optional[float] = Field(None, ge=0.0, le=1.0)
+
+def require_profiling_token(token: Optional[str]):
+    if not PROFILING_TOKEN or token != PROFILING_TOKEN:
+        raise HTTPException(status_code=403, detail="Profiling control needs a valid X-Profiling-Token")
+
+@app.get("/debug/profiling")
+def profiling_status(x_profiling_token: Optional[str] = Header(None)):
+    require_profiling_token(x_profiling_token)
+    return request_profiler.status()
+
+@app.post("/debug/profiling")
+def configure_profiling(settings: ProfilingSettings, x_profiling_token: Optional[str] = Header(None)):
+    """
+    Turns request profiling on or off without a restart. Once on, requests sending
+    `X-Profile: 1` are always profiled and others at `sample_rate`. Only the worker
+    that answers is switched; see `worker_pid` in the response.
+    """
+    require_profiling_token(x_profiling_token)
+    try:
+        request_profiler.configure(settings.enabled, settings.sample_rate)
+    except RuntimeError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    return request_profiler.status()
+
+@app.get("/debug/profiles")
+def list_profiles(x_profiling_token: Optional[str] = Header(None)):
+    require_profiling_token(x_profiling_token)
+    return request_profiler.list_profiles()
+
+@app.get("/debug/profiles/{profile_id}", response_class=PlainTextResponse)
+def get_profile(profile_id: int, x_profiling_token: Optional[str] = Header(None)):
+    """Returns one stored profile as a pyinstrument text call tree."""
+    require_profiling_token(x_profiling_token)
+    profile = request_profiler.get_profile(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail=f"No stored profile {profile_id}")
+    return PlainTextResponse(profile["report"])
     
 # --- CORS Headers (Crucial for Hosting) ---
 # Enable CORS for frontend development
@@ -181,4 +747,5 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"], # Lets the browser read /timeline pagination tokens
 )
\ No newline at end of file
@@ -0,0 +1,222 @@
+# metrics.py
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Tuple
+
+from pymongo import monitoring
+
+# Latency buckets in seconds, from sub-millisecond cache hits to multi-second scans
+DEFAULT_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name, self.help, self.labels = name, help_text, labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1.0):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                yield f"{self.name}{_format_labels(self.labels, label_values)} {value}"
+
+
+class Gauge:
+    """Point-in-time value, either set directly or read from a callback at scrape time."""
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (), callback: Callable[[], Dict] = None):
+        self.name, self.help, self.labels = name, help_text, labels
+        self.callback = callback
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, *label_values):
+        with self._lock:
+            self._values[label_values] = value
+
+    def inc(self, *label_values, amount: float = 1.0):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def dec(self, *label_values, amount: float = 1.0):
+        self.inc(*label_values, amount=-amount)
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} gauge"
+        if self.callback is not None:
+            values = self.callback()
+        else:
+            with self._lock:
+                values = dict(self._values)
+        for label_values, value in sorted(values.items()):
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {value}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus exposition format."""
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (), buckets=DEFAULT_LATENCY_BUCKETS):
+        self.name, self.help, self.labels = name, help_text, labels
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # Per-bucket counts (last slot is +Inf), sum, count
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, *label_values):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *label_values)
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            snapshot = {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+        for label_values, (counts, total, count) in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket_labels = _format_labels(self.labels, label_values, 'le="' + le + '"')
+                yield f"{self.name}_bucket{bucket_labels} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labels, label_values)} {total}"
+            yield f"{self.name}_count{_format_labels(self.labels, label_values)} {count}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Full Prometheus text exposition of every registered metric."""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+# --- Request and stage timing ---
+http_request_seconds = registry.register(Histogram(
+    "http_request_duration_seconds", "Time to produce a response, by route and status.", ("method", "route", "status")))
+stage_seconds = registry.register(Histogram(
+    "checkin_stage_duration_seconds", "Time spent in each stage of an endpoint.", ("endpoint", "stage")))
+
+# --- Model ---
+model_stage_seconds = registry.register(Histogram(
+    "model_stage_duration_seconds", "Time spent inside the pipeline: tokenize, forward pass, postprocess.", ("stage",)))
+inference_batch_size = registry.register(Histogram(
+    "inference_batch_size", "Texts per model forward pass.", (), buckets=BATCH_SIZE_BUCKETS))
+
+# --- MongoDB connection pool (fed by MongoPoolListener) ---
+mongo_pool_connections = registry.register(Gauge(
+    "mongo_pool_connections", "Open pooled connections per server.", ("address",)))
+mongo_pool_checked_out = registry.register(Gauge(
+    "mongo_pool_checked_out", "Connections currently checked out of the pool.", ("address",)))
+mongo_pool_checkout_failures = registry.register(Counter(
+    "mongo_pool_checkout_failures_total", "Failed connection checkouts by reason.", ("address", "reason")))
+mongo_pool_checkout_seconds = registry.register(Histogram(
+    "mongo_pool_checkout_duration_seconds", "Time spent waiting to check a connection out.", ("address",)))
+
+
+@contextmanager
+def span(endpoint: str, stage: str):
+    """Times one stage of an endpoint into checkin_stage_duration_seconds."""
+    with stage_seconds.time(endpoint, stage):
+        yield
+
+
+def register_gauge_callback(name: str, help_text: str, labels: Tuple[str, ...], callback: Callable[[], Dict]):
+    """Adds a gauge whose values are computed at scrape time (e.g. queue depth)."""
+    return registry.register(Gauge(name, help_text, labels, callback=callback))
+
+
+def render_metrics() -> str:
+    return registry.render()
+
+
+class MongoPoolListener(monitoring.ConnectionPoolListener):
+    """Feeds PyMongo/Motor connection pool events into the pool gauges."""
+
+    def _address(self, event) -> str:
+        host, port = event.address
+        return f"{host}:{port}"
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        mongo_pool_connections.inc(self._address(event))
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        mongo_pool_connections.dec(self._address(event))
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        mongo_pool_checkout_failures.inc(self._address(event), event.reason)
+
+    def connection_checked_out(self, event):
+        address = self._address(event)
+        mongo_pool_checked_out.inc(address)
+        # Checkout wait time is reported by PyMongo 4.7+
+        duration = getattr(event, "duration", None)
+        if duration is not None:
+            mongo_pool_checkout_seconds.observe(duration, address)
+
+    def connection_checked_in(self, event):
+        mongo_pool_checked_out.dec(self._address(event))
@@ -1,36 +1,245 @@
 # nlp_model.py
-import torch
-from transformers import AutoTokenizer, AutoModelForSequenceClassification, pipeline
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import List, Optional, Tuple
+
+from lexicon import lexicon_matcher, LEXICON_VERSION
+from inference_backends import INFERENCE_BACKEND, INFERENCE_THREADS, configure_threads, load_weights, pipeline_device, validate_backend
+from metrics import inference_batch_size, model_stage_seconds, register_gauge_callback
+from sentiment_cache import sentiment_cache, make_cache_key
 
 # --- Configuration ---
 # You can replace this with any specific fine-tuned RoBERTa model ID 
 # from the Hugging Face Model Hub, especially one tuned for mood/stress.
 # Example: 'finiteautomata/bertweet-base-sentiment-analysis' or a more general one.
-MODEL_NAME = "cardiffnlp/twitter-roberta-base-sentiment-latest"
+MODEL_NAME = os.environ.get("MODEL_NAME", "cardiffnlp/twitter-roberta-base-sentiment-latest")
+# Bump when map_label_to_score, or the meaning of another stored score, changes, so stored
+# entries are picked up by re-scoring jobs. 2: keyword_intensity is the lexicon's distress
+# load, where 1 stored the classifier's confidence
+SCORE_MAPPING_VERSION = "2"
+# Stored on every analysed entry. Entries whose model_version differs from the
+# running one are what `python jobs.py --rescore` re-analyses. The lexicon is part
+# of it, since it produces keyword_intensity and keyword_terms.
+MODEL_VERSION = os.environ.get("MODEL_VERSION", f"{MODEL_NAME}#map-{SCORE_MAPPING_VERSION}#lex-{LEXICON_VERSION}")
+# Identifies which weights produced a score. Backends drift slightly from fp32,
+# so cached results are never shared between them.
+MODEL_ID = f"{MODEL_NAME}:{INFERENCE_BACKEND}"
+
+# --- Micro-batching Configuration ---
+# Concurrent analyze_text() calls are collected into a single padded forward pass.
+# A batch is dispatched as soon as it is full or the oldest request has waited
+# INFERENCE_MAX_WAIT_MS. Set INFERENCE_MAX_BATCH_SIZE=1 to disable batching.
+INFERENCE_MAX_BATCH_SIZE = int(os.environ.get("INFERENCE_MAX_BATCH_SIZE", "16"))
+INFERENCE_MAX_WAIT_MS = float(os.environ.get("INFERENCE_MAX_WAIT_MS", "10"))
+
+# --- Long Entry Configuration ---
+# "chunk":    entries longer than the model window are split into overlapping token
+#             windows that run in the same batch; their scores are averaged, weighted
+#             by each window's token count (default).
+# "truncate": only the first model window is scored.
+LONG_TEXT_MODE = os.environ.get("LONG_TEXT_MODE", "chunk").lower()
+if LONG_TEXT_MODE not in ("chunk", "truncate"):
+    raise ValueError(f"Unknown LONG_TEXT_MODE '{LONG_TEXT_MODE}'. Use 'chunk' or 'truncate'.")
+# Window size in tokens, capped at what the model accepts once special tokens are added
+CHUNK_MAX_TOKENS = int(os.environ.get("CHUNK_MAX_TOKENS", "512"))
+CHUNK_OVERLAP_TOKENS = int(os.environ.get("CHUNK_OVERLAP_TOKENS", "64"))
+# Per-entry token budget: tokens past it are not scored, so one very long entry
+# costs at most a few windows of a worker's time.
+MAX_TOKENS_PER_TEXT = int(os.environ.get("MAX_TOKENS_PER_TEXT", "2048"))
+# Cached scores of long entries depend on how they were chunked
+SCORING_ID = f"{MODEL_ID}:{MODEL_VERSION}:{LEXICON_VERSION}:{LONG_TEXT_MODE}:{CHUNK_MAX_TOKENS}/{CHUNK_OVERLAP_TOKENS}/{MAX_TOKENS_PER_TEXT}"
+
+# --- Model Loading Configuration ---
+# "background": start loading when the app starts, serve /health/live immediately
+#               and report /health/ready once the model is usable (default).
+# "eager":      block app startup until the model is loaded.
+# "lazy":       load on the first analyze_text() call.
+MODEL_LOAD_MODE = os.environ.get("MODEL_LOAD_MODE", "background")
+# Text used for warm-up and parity forward passes
+WARMUP_TEXT = "Today was an ordinary day."
+# The warm-up runs every batch size here with a short, a typical and a full-window input,
+# so the first real batches of those shapes don't pay torch's lazy allocations and
+# kernel selection. Default: single check-ins and full micro-batches.
+WARMUP_BATCH_SIZES = sorted({
+    max(1, int(size)) for size in os.environ.get("WARMUP_BATCH_SIZES", f"1,{INFERENCE_MAX_BATCH_SIZE}").split(",") if size.strip()
+})
+WARMUP_TEXTS = (
+    WARMUP_TEXT,
+    "Work was stressful and I slept badly, but talking it through with a friend this evening helped me feel calmer.",
+    # Truncated to the model window, like the windows of a chunked long entry
+    " ".join([WARMUP_TEXT] * 128),
+)
+
+# --- Global Model State ---
+# torch and transformers are imported inside load_model(), so importing this module
+# (and main.py) is fast and uvicorn reloads don't pay the model cost up front.
+sentiment_pipeline = None
+global_labels = {}
+model_status = "not_loaded"  # not_loaded -> loading -> ready | failed
+model_error = None
+startup_timings = {}
+warmup_shapes = []  # [{"batch_size", "tokens", "seconds"}] from the last warm-up
+_model_lock = threading.Lock()
+# The pipeline and its tokenizer are not thread-safe; every forward pass holds this
+_inference_lock = threading.Lock()
+_load_thread = None
+_chunk_stats = {"chunked_texts": 0, "chunks": 0, "over_budget_texts": 0}
+_chunk_stats_lock = threading.Lock()
 
-# --- Global Model Initialization ---
-# This runs ONLY ONCE when the FastAPI server starts.
-# We will use a general sentiment pipeline as a placeholder.
-# In a real project, replace this with a fine-tuned mental health model.
-try:
-    print(f"Loading RoBERTa model: {MODEL_NAME}...")
+def _build_pipeline(backend: str, timings: Optional[dict] = None):
+    """Builds a sentiment pipeline for one backend, recording step durations into `timings`."""
+    timings = timings if timings is not None else {}
+    validate_backend(backend)
+
+    step = time.perf_counter()
+    from transformers import AutoTokenizer, pipeline
+    timings["imports"] = time.perf_counter() - step
+
+    step = time.perf_counter()
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+    timings["tokenizer"] = time.perf_counter() - step
+
+    step = time.perf_counter()
+    model = load_weights(MODEL_NAME, backend, INFERENCE_THREADS)
+    timings["weights"] = time.perf_counter() - step
 
     # Use the pipeline for quick, high-level analysis in a hackathon
-    sentiment_pipeline = pipeline(
+    step = time.perf_counter()
+    built = pipeline(
         "sentiment-analysis",
-        model=MODEL_NAME,
-        tokenizer=MODEL_NAME,
-        device=0 if torch.cuda.is_available() else -1 # Use GPU if available
+        model=model,
+        tokenizer=tokenizer,
+        device=pipeline_device(backend) # Use GPU if available (fp32 torch only)
     )
+    timings["pipeline"] = time.perf_counter() - step
+    _instrument_pipeline(built)
+    return built
+
+def _instrument_pipeline(built):
+    """
+    Wraps the pipeline's preprocess/_forward/postprocess steps on this instance so
+    tokenization, the forward pass and postprocessing show up separately in
+    model_stage_duration_seconds, and records how many texts each forward pass saw.
+    """
+    def timed(stage, step):
+        def wrapper(*args, **kwargs):
+            with model_stage_seconds.time(stage):
+                return step(*args, **kwargs)
+        return wrapper
+
+    forward = built._forward
+    def timed_forward(model_inputs, *args, **kwargs):
+        input_ids = model_inputs.get("input_ids") if hasattr(model_inputs, "get") else None
+        if input_ids is not None and hasattr(input_ids, "shape"):
+            inference_batch_size.observe(input_ids.shape[0])
+        with model_stage_seconds.time("forward"):
+            return forward(model_inputs, *args, **kwargs)
+
+    built.preprocess = timed("tokenize", built.preprocess)
+    built._forward = timed_forward
+    built.postprocess = timed("postprocess", built.postprocess)
+
+def load_model(warmup: bool = True) -> bool:
+    """
+    Loads the tokenizer and model, builds the pipeline and runs the warm-up passes.
+    Safe to call from several threads: the first caller loads, the others wait.
+    Returns True when the pipeline is ready to use. The pre-fork launcher passes
+    warmup=False and warms up each worker after forking instead (see prefork.py).
+    """
+    global sentiment_pipeline, global_labels, model_status, model_error
+
+    if model_status == "ready":
+        return True
+
+    with _model_lock:
+        if model_status in ("ready", "failed"):
+            return model_status == "ready"
+
+        model_status = "loading"
+        timings = {}
+        total_start = time.perf_counter()
+        try:
+            print(f"Loading RoBERTa model: {MODEL_NAME} (backend: {INFERENCE_BACKEND})...")
+
+            loaded_pipeline = _build_pipeline(INFERENCE_BACKEND, timings)
+
+            if warmup:
+                step = time.perf_counter()
+                _warm_up(loaded_pipeline)
+                timings["warmup"] = time.perf_counter() - step
+
+            # Store the labels (e.g., ['negative', 'neutral', 'positive']) for later use
+            global_labels = loaded_pipeline.model.config.id2label
+            sentiment_pipeline = loaded_pipeline
+            model_status = "ready"
+            print(f"Model loaded with labels: {global_labels}")
+
+        except Exception as e:
+            print(f"Error loading RoBERTa model: {e}. Check network connection and model name.")
+            model_status = "failed"
+            model_error = str(e)
+
+        timings["total"] = time.perf_counter() - total_start
+        startup_timings.clear()
+        startup_timings.update(timings)
+        print("Model startup timings: " + ", ".join(f"{name}={seconds:.2f}s" for name, seconds in timings.items()))
+        return model_status == "ready"
 
-    # Store the labels (e.g., ['negative', 'neutral', 'positive']) for later use
-    global_labels = sentiment_pipeline.model.config.id2label
-    print(f"Model loaded with labels: {global_labels}")
+def _warm_up(built):
+    """One forward pass per (batch size, input length) shape in WARMUP_BATCH_SIZES x WARMUP_TEXTS."""
+    shapes = []
+    for batch_size in WARMUP_BATCH_SIZES:
+        for text in WARMUP_TEXTS:
+            tokens = len(built.tokenizer(text, truncation=True)["input_ids"])
+            step = time.perf_counter()
+            built([text] * batch_size, batch_size=batch_size, truncation=True)
+            shapes.append({"batch_size": batch_size, "tokens": tokens, "seconds": time.perf_counter() - step})
+    warmup_shapes[:] = shapes
 
-except Exception as e:
-    print(f"Error loading RoBERTa model: {e}. Check network connection and model name.")
-    sentiment_pipeline = None
-    global_labels = {}
+def warm_up_model() -> float:
+    """Runs the warm-up passes on an already loaded pipeline and returns their duration in seconds."""
+    step = time.perf_counter()
+    _warm_up(sentiment_pipeline)
+    startup_timings["warmup"] = time.perf_counter() - step
+    return startup_timings["warmup"]
+
+def set_inference_threads(threads: int):
+    """
+    Changes the intra-op thread count of an already loaded torch model, e.g. in
+    each worker after a pre-fork launcher forked. ONNX Runtime fixes its thread
+    count when the session is created, so there it only changes what is reported.
+    """
+    global INFERENCE_THREADS
+    INFERENCE_THREADS = threads
+    if INFERENCE_BACKEND != "onnx":
+        configure_threads(threads)
+
+def start_model_loading():
+    """Kicks off model loading according to MODEL_LOAD_MODE. Called from the app lifespan."""
+    global _load_thread
+    if MODEL_LOAD_MODE == "eager":
+        load_model()
+    elif MODEL_LOAD_MODE == "background" and _load_thread is None and model_status == "not_loaded":
+        _load_thread = threading.Thread(target=load_model, name="model-loader", daemon=True)
+        _load_thread.start()
+
+def get_model_status() -> dict:
+    """Model readiness plus the measured startup-time breakdown, in seconds."""
+    return {
+        "model": MODEL_NAME,
+        "backend": INFERENCE_BACKEND,
+        "threads": INFERENCE_THREADS,
+        "status": model_status,
+        "ready": model_status == "ready",
+        "load_mode": MODEL_LOAD_MODE,
+        "error": model_error,
+        "startup_timings": dict(startup_timings),
+        "warmup_shapes": list(warmup_shapes),
+    }
 
 def map_label_to_score(label: str, score: float) -> float:
     """Maps the model's categorical output (e.g., NEGATIVE) to a numerical 0.0 to 1.0 score."""
@@ -45,30 +254,374 @@ def map_label_to_score(label: str, score: float) -> float:
         # Neutral scores should hover near the midpoint (0.5)
         return 0.5 + (score * 0.1) # Give it a slight boost based on confidence, but keep it centered
 
-def analyze_text(text: str) -> dict:
-    """Performs RoBERTa analysis and returns scores."""
-    if not sentiment_pipeline:
-        return {"sentiment": 0.5, "intensity": 0.0}
-
-    # 1. Run the pipeline on the input text
-    result = sentiment_pipeline(text)[0]
-    
+def _result_to_scores(result: dict) -> dict:
+    """Converts one raw pipeline prediction into the sentiment score and the model's confidence."""
     label = result['label']
     raw_score = result['score']
 
-    # 2. Map the result to our desired numerical output
+    # Map the result to our desired numerical output
     numerical_sentiment = map_label_to_score(label, raw_score)
-    
-    # 3. Use the raw confidence score as a proxy for intensity/certainty
-    intensity_score = raw_score 
-
-    # Note: For hackathon extension: You could add a separate NER model 
-    # here to extract keywords like 'hopeless' or 'anxiety' for the intensity score.
 
+    # Intensity comes from the lexicon stage (see _with_keywords), not from the classifier
     return {
         "sentiment": numerical_sentiment,  # A continuous score between 0.0 and 1.0
-        "intensity": intensity_score       # The confidence level of the model's prediction
+        "confidence": raw_score            # The confidence level of the model's prediction
+    }
+
+def _with_keywords(texts: List[str], results: List[dict]) -> List[dict]:
+    """
+    Adds the lexicon stage's keyword_intensity and matched terms to each result.
+    It reads the whole text, including tokens past MAX_TOKENS_PER_TEXT; at tens
+    of microseconds per entry it is noise next to the forward pass it rides along with.
+    """
+    for result, keywords in zip(results, lexicon_matcher.analyze_batch(texts)):
+        result.update(keywords)
+    return results
+
+def _fallback_scores(texts: List[str]) -> List[dict]:
+    """Neutral sentiment while the model is unavailable; the lexicon needs no model, so keywords are real."""
+    # No model_version, so re-scoring picks these entries up once the model is loaded
+    return _with_keywords(texts, [{"sentiment": 0.5} for _ in texts])
+
+def _chunk_window() -> int:
+    """Tokens per chunk: CHUNK_MAX_TOKENS, capped by the model's limit minus special tokens."""
+    tokenizer = sentiment_pipeline.tokenizer
+    model_limit = tokenizer.model_max_length - tokenizer.num_special_tokens_to_add()
+    return max(1, min(CHUNK_MAX_TOKENS, model_limit))
+
+def _split_long_text(text: str, window: int) -> List[Tuple[str, int]]:
+    """
+    Splits a text into overlapping windows of at most `window` tokens, returning
+    (chunk_text, token_count) pairs. Short texts come back unchanged as one chunk.
+    Only the first MAX_TOKENS_PER_TEXT tokens are kept.
+    """
+    # Byte-level BPE never yields more tokens than UTF-8 bytes, so most check-ins
+    # skip the extra tokenizer call entirely
+    if len(text.encode("utf-8")) <= window:
+        return [(text, 1)]
+    tokenizer = sentiment_pipeline.tokenizer
+    token_ids = tokenizer(text, add_special_tokens=False)["input_ids"]
+    if len(token_ids) <= window:
+        return [(text, len(token_ids))]
+
+    over_budget = len(token_ids) > MAX_TOKENS_PER_TEXT
+    token_ids = token_ids[:MAX_TOKENS_PER_TEXT]
+    step = max(1, window - CHUNK_OVERLAP_TOKENS)
+    chunks = []
+    for start in range(0, len(token_ids), step):
+        window_ids = token_ids[start:start + window]
+        chunks.append((tokenizer.decode(window_ids), len(window_ids)))
+        if start + window >= len(token_ids):
+            break
+
+    with _chunk_stats_lock:
+        _chunk_stats["chunked_texts"] += 1
+        _chunk_stats["chunks"] += len(chunks)
+        _chunk_stats["over_budget_texts"] += 1 if over_budget else 0
+    return chunks
+
+def _combine_chunk_scores(scores: List[dict], weights: List[int]) -> dict:
+    """Token-count-weighted mean of the per-chunk sentiment/confidence pairs."""
+    total = float(sum(weights)) or 1.0
+    return {
+        "sentiment": sum(score["sentiment"] * weight for score, weight in zip(scores, weights)) / total,
+        "confidence": sum(score["confidence"] * weight for score, weight in zip(scores, weights)) / total,
     }
 
+def _run_model(texts: List[str]) -> List[dict]:
+    """
+    Runs RoBERTa on a list of texts and returns one score dict per text.
+    Texts are padded together so each chunk of INFERENCE_MAX_BATCH_SIZE costs a
+    single forward pass. In chunk mode, long texts contribute one input per
+    window to the same batch. Inputs are ordered by length so each padded batch
+    wastes as little as possible. The lexicon stage runs over the same batch.
+    No caching happens at this level.
+
+    Calls are serialized: the micro-batcher thread, analyze_texts() callers and
+    batching-disabled requests never use the pipeline at the same time.
+    """
+    with _inference_lock:
+        return _score_texts(texts)
+
+def _score_texts(texts: List[str]) -> List[dict]:
+    if LONG_TEXT_MODE == "chunk":
+        window = _chunk_window()
+        split = [_split_long_text(text, window) for text in texts]
+    else:
+        split = [[(text, 1)] for text in texts]
+
+    inputs = [chunk for chunks in split for chunk, _ in chunks]
+    order = sorted(range(len(inputs)), key=lambda index: len(inputs[index]))
+    batch_size = max(1, min(len(inputs), INFERENCE_MAX_BATCH_SIZE))
+    # truncation=True guards against re-encoded windows landing a token or two over the limit
+    raw = sentiment_pipeline([inputs[index] for index in order], batch_size=batch_size, truncation=True)
+    scores = [None] * len(inputs)
+    for index, result in zip(order, raw):
+        scores[index] = _result_to_scores(result)
+
+    combined = []
+    position = 0
+    for chunks in split:
+        chunk_scores = scores[position:position + len(chunks)]
+        position += len(chunks)
+        if len(chunks) == 1:
+            result = chunk_scores[0]
+        else:
+            result = _combine_chunk_scores(chunk_scores, [tokens for _, tokens in chunks])
+        result["model_version"] = MODEL_VERSION
+        combined.append(result)
+    return _with_keywords(texts, combined)
+
+def analyze_texts(texts: List[str]) -> List[dict]:
+    """
+    Batch counterpart of analyze_text(). Cached texts are answered from the
+    sentiment cache and only the misses go through the model.
+    """
+    if not texts:
+        return []
+    if not load_model():
+        return _fallback_scores(texts)
+
+    keys = [make_cache_key(text, SCORING_ID) for text in texts]
+    results = [sentiment_cache.get(key) for key in keys]
+
+    # Score each distinct uncached key once, even if it repeats within the batch
+    pending = {}
+    for index, result in enumerate(results):
+        if result is None:
+            pending.setdefault(keys[index], []).append(index)
+    if pending:
+        first_indexes = [indexes[0] for indexes in pending.values()]
+        fresh = _run_model([texts[index] for index in first_indexes])
+        for (key, indexes), result in zip(pending.items(), fresh):
+            sentiment_cache.put(key, result)
+            for index in indexes:
+                results[index] = dict(result)
+    return results
+
+
+class InferenceBatcher:
+    """
+    Collects concurrent single-text requests into batches for the model.
+
+    Callers block on a Future while one background thread drains the queue:
+    it waits for the first request, keeps collecting until the batch is full
+    or max_wait_ms has passed, runs one forward pass and hands each caller
+    its own result.
+    """
+
+    def __init__(self, run_batch, max_batch_size: int, max_wait_ms: float, latency_window: int = 2048):
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._started_at = time.monotonic()
+
+        # Running totals for get_inference_stats()
+        self._batches = 0
+        self._requests = 0
+        self._errors = 0
+        self._largest_batch = 0
+        self._busy_seconds = 0.0
+        self._latencies_ms = deque(maxlen=latency_window)
+
+    def submit(self, text: str) -> Future:
+        """Queues a text for the next batch and returns a Future for its scores."""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((text, future, time.perf_counter()))
+        return future
+
+    def _ensure_worker(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._worker, name="inference-batcher", daemon=True)
+                self._thread.start()
+
+    def _collect_batch(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        # Take whatever else is already waiting without extending the deadline
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _worker(self):
+        while True:
+            batch = self._collect_batch()
+            texts = [text for text, _, _ in batch]
+            started = time.perf_counter()
+            try:
+                results = self.run_batch(texts)
+            except Exception as e:
+                with self._lock:
+                    self._errors += len(batch)
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            finished = time.perf_counter()
+            with self._lock:
+                self._batches += 1
+                self._requests += len(batch)
+                self._largest_batch = max(self._largest_batch, len(batch))
+                self._busy_seconds += finished - started
+                for _, _, enqueued in batch:
+                    self._latencies_ms.append((finished - enqueued) * 1000.0)
+
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self) -> dict:
+        """Returns throughput and latency figures for the batches run so far."""
+        with self._lock:
+            latencies = sorted(self._latencies_ms)
+            batches = self._batches
+            requests = self._requests
+            busy = self._busy_seconds
+            errors = self._errors
+            largest = self._largest_batch
+
+        def percentile(p):
+            if not latencies:
+                return 0.0
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+        uptime = time.monotonic() - self._started_at
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "queue_depth": self.queue_depth(),
+            "batches": batches,
+            "requests": requests,
+            "errors": errors,
+            "largest_batch": largest,
+            "avg_batch_size": requests / batches if batches else 0.0,
+            "throughput_per_sec": requests / uptime if uptime > 0 else 0.0,
+            "model_throughput_per_sec": requests / busy if busy > 0 else 0.0,
+            "latency_ms_p50": percentile(0.50),
+            "latency_ms_p95": percentile(0.95),
+            "latency_ms_p99": percentile(0.99),
+        }
+
+
+inference_batcher = InferenceBatcher(_run_model, INFERENCE_MAX_BATCH_SIZE, INFERENCE_MAX_WAIT_MS)
+
+register_gauge_callback(
+    "inference_queue_depth", "Texts waiting for the next micro-batch.", (),
+    lambda: {(): inference_batcher.queue_depth()})
+register_gauge_callback(
+    "sentiment_cache_events", "Sentiment cache counters since startup.", ("event",),
+    lambda: {(name,): value for name, value in sentiment_cache.stats().items()
+             if name in ("hits", "disk_hits", "misses", "evictions", "expirations", "disk_evictions", "disk_expirations")})
+register_gauge_callback(
+    "long_text_events", "Long entries split into chunks, chunks scored, and entries cut at MAX_TOKENS_PER_TEXT.", ("event",),
+    lambda: {(name,): value for name, value in dict(_chunk_stats).items()})
+
+def get_inference_stats() -> dict:
+    """Returns the micro-batching scheduler's throughput/latency stats."""
+    stats = inference_batcher.stats()
+    stats["batching_enabled"] = INFERENCE_MAX_BATCH_SIZE > 1
+    stats["cache"] = sentiment_cache.stats()
+    with _chunk_stats_lock:
+        stats["long_texts"] = dict(_chunk_stats, mode=LONG_TEXT_MODE, max_tokens_per_text=MAX_TOKENS_PER_TEXT)
+    return stats
+
+def analyze_text(text: str) -> dict:
+    """Performs RoBERTa analysis and returns scores."""
+    if not load_model():
+        return _fallback_scores([text])[0]
+
+    # Repeated check-ins (quick-pick moods, retries) skip the model entirely
+    cache_key = make_cache_key(text, SCORING_ID)
+    cached = sentiment_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    if INFERENCE_MAX_BATCH_SIZE <= 1:
+        # Batching disabled: one forward pass per request, as before
+        result = _run_model([text])[0]
+    else:
+        # Wait for our slot in the next micro-batch
+        result = inference_batcher.submit(text).result()
+
+    sentiment_cache.put(cache_key, result)
+    return result
+
 # Ensure the database.py and main.py files are correctly referencing this updated 
-# 'analyze_text' function and handling the float outputs. (They already do!)
\ No newline at end of file
+# 'analyze_text' function and handling the float outputs. (They already do!)
+
+# Representative check-ins for backend parity checks: positive, neutral, negative and mixed
+PARITY_SAMPLE_TEXTS = [
+    "Today was a really good day! I felt productive and accomplished a lot of my goals.",
+    "Feeling a bit overwhelmed with work lately. There's so much to do and not enough time.",
+    "Had a great conversation with my friend today and I feel excited about what's next.",
+    "I'm struggling with some personal issues and feeling quite down.",
+    "Today was an average day. Nothing particularly exciting happened, but nothing bad either.",
+    "I can't sleep, everything feels hopeless and I don't know who to talk to.",
+    "Went for a run, ate well and called my mum. Small wins.",
+    "Work was stressful but the evening with family helped me relax.",
+]
+
+def check_backend_parity(backend: str, texts: Optional[List[str]] = None) -> dict:
+    """
+    Runs the same texts through the fp32 baseline and `backend` and reports how far
+    the mapped sentiment (map_label_to_score) drifts, how often the labels agree,
+    and the per-text latency of each backend.
+    """
+    texts = texts or PARITY_SAMPLE_TEXTS
+    report = {"backend": backend, "texts": len(texts)}
+    outputs = {}
+
+    for name in ("torch", backend):
+        if name in outputs:
+            continue
+        built = _build_pipeline(name)
+        built(WARMUP_TEXT)
+        start = time.perf_counter()
+        outputs[name] = built(list(texts), batch_size=len(texts))
+        report[f"{name}_ms_per_text"] = (time.perf_counter() - start) * 1000.0 / len(texts)
+
+    baseline, candidate = outputs["torch"], outputs[backend]
+    drifts = [
+        abs(map_label_to_score(b["label"], b["score"]) - map_label_to_score(c["label"], c["score"]))
+        for b, c in zip(baseline, candidate)
+    ]
+    report["max_abs_drift"] = max(drifts)
+    report["mean_abs_drift"] = sum(drifts) / len(drifts)
+    report["label_agreement"] = sum(b["label"] == c["label"] for b, c in zip(baseline, candidate)) / len(texts)
+    return report
+
+if __name__ == "__main__":
+    # Print the startup-time breakdown so load regressions can be tracked over time, or
+    # compare a backend with fp32: python nlp_model.py --parity torch-int8
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Model startup profile and backend parity check")
+    parser.add_argument("--parity", metavar="BACKEND", help="Report drift of BACKEND's scores from the fp32 baseline")
+    args = parser.parse_args()
+
+    if args.parity:
+        print(json.dumps(check_backend_parity(args.parity), indent=2))
+    else:
+        load_model()
+        print(json.dumps(get_model_status(), indent=2))
@@ -0,0 +1,233 @@
+# prefork.py
+"""
+Pre-fork launcher for production serving.
+
+The parent process imports the app and loads the model weights once, binds the
+listening socket, and then forks the workers. Each worker runs its own uvicorn
+server on the shared socket. Model tensors are never written after loading,
+so the workers share those pages copy-on-write instead of holding one copy of
+RoBERTa each. The parent keeps the workers running: it respawns any that die,
+and on SIGTERM/SIGINT it asks them to shut down gracefully. Each worker's app
+lifespan then stops its job runner and closes its Mongo clients.
+
+Started by `python start_server.py --workers N`.
+"""
+
+import gc
+import math
+import os
+import signal
+import socket
+import sys
+import time
+import traceback
+
+import uvicorn
+
+# --- Configuration ---
+# Seconds a worker gets to finish in-flight requests and its lifespan shutdown before it is killed
+GRACEFUL_TIMEOUT_SECONDS = float(os.environ.get("GRACEFUL_TIMEOUT_SECONDS", "30"))
+# Most workers "auto" starts: each one holds its own activations, caches and baselines
+SERVER_AUTO_MAX_WORKERS = int(os.environ.get("SERVER_AUTO_MAX_WORKERS", "8"))
+# A worker that exits sooner than this after starting is respawned only after a pause
+RESPAWN_BACKOFF_SECONDS = 1.0
+# ---------------------
+
+CGROUP_CPU_MAX = "/sys/fs/cgroup/cpu.max"
+
+
+def available_cpus() -> int:
+    """
+    Cores this process may actually use. os.cpu_count() reports the host's cores,
+    even in a container limited to a few; the CPU affinity mask and a cgroup v2
+    CPU quota are both taken into account instead.
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:  # Not available on macOS
+        cpus = os.cpu_count() or 1
+    try:
+        with open(CGROUP_CPU_MAX) as f:
+            quota, period = f.read().split()[:2]
+        if quota != "max":
+            cpus = min(cpus, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    return max(1, cpus)
+
+
+def resolve_workers(workers) -> int:
+    """Accepts a worker count or "auto" (one worker per available core, at most SERVER_AUTO_MAX_WORKERS)."""
+    if str(workers).lower() == "auto":
+        return max(1, min(available_cpus(), SERVER_AUTO_MAX_WORKERS))
+    return max(1, int(workers))
+
+
+def worker_threads(workers: int, threads: int = 0) -> int:
+    """
+    Intra-op threads per worker. Unless set explicitly, the cores are split
+    evenly so that N workers never run more than one inference thread per core.
+    """
+    if threads > 0:
+        return threads
+    return max(1, available_cpus() // workers)
+
+
+def model_shareable(backend: str) -> bool:
+    """
+    Whether the model can be loaded before forking. Only CPU torch weights can.
+    ONNX Runtime sessions start their thread pools at creation, and a CUDA context
+    cannot be used after fork(), so those backends load in every worker.
+    """
+    if backend == "onnx":
+        return False
+    import torch
+    return not torch.cuda.is_available()
+
+
+class PreforkServer:
+    def __init__(self, host: str, port: int, workers: int, threads: int = 0, log_level: str = "info"):
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.threads = worker_threads(workers, threads)
+        self.log_level = log_level
+        self.children = {}  # pid -> (worker index, start time)
+        self.stopping = False
+
+    def run(self):
+        # Imported here so `import prefork` stays cheap; everything imported now is shared by the workers
+        import main
+        import nlp_model
+
+        backend = nlp_model.INFERENCE_BACKEND
+        if model_shareable(backend):
+            # One thread in the parent: torch never starts its intra-op pool here,
+            # so there are no pool threads or locks to go missing in the children.
+            nlp_model.set_inference_threads(1)
+            if not nlp_model.load_model(warmup=False):
+                raise RuntimeError(f"Could not load the model before forking: {nlp_model.model_error}")
+            print(f"Model loaded once in the launcher; {self.workers} workers will share it")
+        else:
+            print(f"INFERENCE_BACKEND={backend} cannot be shared across fork(); each worker loads its own model")
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(2048)
+        sock.set_inheritable(True)
+
+        # Keep the cyclic GC from touching (and so copying) every object inherited from the parent
+        gc.collect()
+        gc.freeze()
+
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+        print(f"Pre-fork server on http://{self.host}:{self.port}: {self.workers} workers x {self.threads} inference threads")
+        for index in range(self.workers):
+            self._spawn(index, main.app, sock)
+
+        try:
+            while not self.stopping:
+                self._reap(main.app, sock)
+                time.sleep(0.5)
+        finally:
+            self._shutdown()
+            sock.close()
+
+    def _request_stop(self, signum, frame):
+        self.stopping = True
+
+    def _spawn(self, index: int, app, sock: socket.socket):
+        # Unflushed output would otherwise be written once by every child
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid:
+            self.children[pid] = (index, time.monotonic())
+            return
+        # Child: never return into the parent's loop
+        code = 1
+        try:
+            self._serve(index, app, sock)
+            code = 0
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
+
+    def _serve(self, index: int, app, sock: socket.socket):
+        """Runs one worker. uvicorn installs its own SIGTERM/SIGINT handlers for graceful shutdown."""
+        import main
+        import nlp_model
+
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        nlp_model.set_inference_threads(self.threads)
+        if nlp_model.model_status == "ready":
+            # Pays torch's first-call allocations in this worker, with its final thread count
+            nlp_model.warm_up_model()
+        if index > 0:
+            # One set of background job workers per server, owned by the first worker
+            main.JOB_WORKERS = 0
+
+        config = uvicorn.Config(
+            app, log_level=self.log_level, timeout_graceful_shutdown=GRACEFUL_TIMEOUT_SECONDS,
+        )
+        server = uvicorn.Server(config)
+        server.run(sockets=[sock])
+        if not server.started:
+            raise RuntimeError(f"Worker {index} failed to start (see the lifespan error above)")
+
+    def _reap(self, app, sock: socket.socket):
+        """Collects exited workers and starts replacements."""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            index, started = self.children.pop(pid, (None, 0.0))
+            if index is None or self.stopping:
+                continue
+            print(f"WARNING: Worker {index} (pid {pid}) exited with status {os.waitstatus_to_exitcode(status)}; restarting it")
+            if time.monotonic() - started < RESPAWN_BACKOFF_SECONDS:
+                time.sleep(RESPAWN_BACKOFF_SECONDS)
+            self._spawn(index, app, sock)
+
+    def _shutdown(self):
+        """Asks every worker to finish gracefully, then kills whatever is left after the timeout."""
+        print(f"Stopping {len(self.children)} workers...")
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+        deadline = time.monotonic() + GRACEFUL_TIMEOUT_SECONDS + 5
+        while self.children and time.monotonic() < deadline:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid:
+                self.children.pop(pid, None)
+            else:
+                time.sleep(0.1)
+
+        for pid in list(self.children):
+            print(f"WARNING: Worker pid {pid} did not stop in time; killing it")
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+        self.children.clear()
+        print("All workers stopped.")
+
+
+def serve(host: str, port: int, workers, threads: int = 0, log_level: str = "info"):
+    PreforkServer(host, port, resolve_workers(workers), threads, log_level).run()
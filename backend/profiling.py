@@ -0,0 +1,103 @@
+# profiling.py
+import itertools
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+# pyinstrument is a sampling profiler with asyncio support; it is optional
+try:
+    from pyinstrument import Profiler
+except ImportError:
+    Profiler = None
+
+# --- Configuration ---
+# Shared secret for turning profiling on/off at runtime. Unset disables the control endpoint.
+PROFILING_TOKEN = os.environ.get("PROFILING_TOKEN", "")
+# Fraction of requests profiled automatically once profiling is enabled
+PROFILING_SAMPLE_RATE = float(os.environ.get("PROFILING_SAMPLE_RATE", "0"))
+# Completed profiles kept in memory for /debug/profiles
+PROFILE_HISTORY = int(os.environ.get("PROFILE_HISTORY", "20"))
+# Sampling interval for pyinstrument, in seconds
+PROFILING_INTERVAL = float(os.environ.get("PROFILING_INTERVAL", "0.001"))
+# ---------------------
+
+
+class RequestProfiler:
+    """
+    Opt-in per-request sampling profiler.
+    Off by default; once enabled at runtime, a request is profiled when it sends
+    `X-Profile: 1` or falls inside the configured sample rate. Finished profiles are
+    kept in a small ring buffer.
+
+    The switch and the ring buffer belong to one process: with pre-forked workers,
+    each worker is turned on and read separately (status() reports its pid).
+    """
+
+    def __init__(self, sample_rate: float = PROFILING_SAMPLE_RATE, history: int = PROFILE_HISTORY):
+        self.enabled = False
+        self.sample_rate = sample_rate
+        self._profiles = deque(maxlen=history)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    @property
+    def available(self) -> bool:
+        return Profiler is not None
+
+    def configure(self, enabled: bool, sample_rate: Optional[float] = None):
+        if enabled and not self.available:
+            raise RuntimeError("Profiling needs the optional 'pyinstrument' package")
+        self.enabled = enabled
+        if sample_rate is not None:
+            self.sample_rate = min(max(sample_rate, 0.0), 1.0)
+
+    def should_profile(self, headers) -> bool:
+        if not self.enabled:
+            return False
+        return headers.get("x-profile") == "1" or random.random() < self.sample_rate
+
+    def start(self):
+        profiler = Profiler(interval=PROFILING_INTERVAL, async_mode="enabled")
+        profiler.start()
+        return profiler
+
+    def finish(self, profiler, method: str, path: str, status: int, duration: float) -> int:
+        profiler.stop()
+        with self._lock:
+            profile_id = next(self._ids)
+            self._profiles.append({
+                "id": profile_id,
+                "method": method,
+                "path": path,
+                "status": status,
+                "duration_ms": duration * 1000.0,
+                "recorded_at": time.time(),
+                "report": profiler.output_text(unicode=True, color=False),
+            })
+        return profile_id
+
+    def status(self) -> dict:
+        return {
+            "worker_pid": os.getpid(),
+            "available": self.available,
+            "enabled": self.enabled,
+            "sample_rate": self.sample_rate,
+            "stored_profiles": len(self._profiles),
+        }
+
+    def list_profiles(self) -> list:
+        with self._lock:
+            return [{key: value for key, value in profile.items() if key != "report"} for profile in self._profiles]
+
+    def get_profile(self, profile_id: int) -> Optional[dict]:
+        with self._lock:
+            for profile in self._profiles:
+                if profile["id"] == profile_id:
+                    return profile
+        return None
+
+
+request_profiler = RequestProfiler()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Re-score stored check-ins with the anomaly detectors and update their flags.
+
+Each user's history is scored in one vectorized pass (every entry against the
+entries before it), so switching ANOMALY_DETECTORS or tuning a threshold can be
+applied to existing data. Only entries whose verdict changed are written, and
+the affected users' trend rollups are rebuilt afterwards.
+
+Usage:
+    python reflag_anomalies.py --user-id alice --dry-run
+    python reflag_anomalies.py --detectors iqr,cusum
+"""
+
+import argparse
+import time
+
+from anomaly import anomaly_engine, build_detectors, AnomalyEngine
+from backfill_rollups import backfill_rollups
+from database import close_mongo_connection, get_mongo_collection, ANALYZED_FILTER, TIMELINE_BATCH_SIZE, TIMELINE_SORT
+from versions import bump_user_versions
+
+REFLAG_PROJECTION = {"sentiment_score": 1, "anomaly_flag": 1, "anomaly_detectors": 1}
+
+
+def reflag_user(engine, user_id, dry_run=False):
+    """Re-scores one user's history and returns how many entries changed verdict."""
+    collection = get_mongo_collection()
+    cursor = collection.find(dict(ANALYZED_FILTER, user_id=user_id), REFLAG_PROJECTION).sort(TIMELINE_SORT).batch_size(TIMELINE_BATCH_SIZE)
+    entries = list(cursor)
+    report = engine.score_history(entry["sentiment_score"] for entry in entries)
+
+    changed = 0
+    for index, entry in enumerate(entries):
+        detectors = {
+            name: float(report[name][index]) for name in engine.names
+            if report[name][index] > 0  # NaN (not scored) compares False
+        }
+        is_anomaly = bool(report["is_anomaly"][index])
+        if is_anomaly == entry.get("anomaly_flag", False) and detectors == entry.get("anomaly_detectors", {}):
+            continue
+        changed += 1
+        if dry_run:
+            continue
+        update = {"$set": {"anomaly_flag": is_anomaly}}
+        if detectors:
+            update["$set"]["anomaly_detectors"] = detectors
+        else:
+            update["$unset"] = {"anomaly_detectors": ""}
+        collection.update_one({"_id": entry["_id"]}, update)
+    if changed and not dry_run:
+        bump_user_versions(user_id)
+
+    print(f"  {user_id}: {len(entries)} entries, {int(report['is_anomaly'].sum())} anomalies, {changed} changed")
+    return changed
+
+
+def reflag_anomalies(user_id=None, detectors=None, dry_run=False):
+    engine = AnomalyEngine(build_detectors(detectors)) if detectors else anomaly_engine
+    user_ids = [user_id] if user_id else sorted(get_mongo_collection().distinct("user_id"))
+    print(f"Re-scoring {len(user_ids)} user(s) with detectors: {', '.join(engine.names)}{' (dry run)' if dry_run else ''}")
+
+    started = time.perf_counter()
+    total_changed = 0
+    for current_user in user_ids:
+        changed = reflag_user(engine, current_user, dry_run)
+        total_changed += changed
+        if changed and not dry_run:
+            # Anomaly counts live in the rollups too
+            backfill_rollups(user_id=current_user)
+
+    print(f"Done: {total_changed} entries changed in {time.perf_counter() - started:.1f}s")
+    return total_changed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-score stored check-ins with the anomaly detectors")
+    parser.add_argument("--user-id", help="Only re-score this user (default: every user)")
+    parser.add_argument("--detectors", help="Comma-separated detectors to use instead of ANOMALY_DETECTORS")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would change without writing")
+    args = parser.parse_args()
+
+    try:
+        reflag_anomalies(user_id=args.user_id, detectors=args.detectors, dry_run=args.dry_run)
+    finally:
+        close_mongo_connection()
@@ -0,0 +1,158 @@
+# response_cache.py
+"""
+ETags and an in-memory cache of serialized /timeline and /trends responses.
+
+An ETag is a digest of the user's data version (see versions.py), the route and
+the query parameters. The handler can therefore tell before touching MongoDB
+whether a client's copy is current (304) or whether it already holds the body
+(cache hit). A write bumps the version, so every ETag issued before it stops
+matching. Stale bodies are never served, and LRU eviction eventually drops them.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import AsyncIterable, AsyncIterator, Dict, Optional, Tuple
+
+from metrics import register_gauge_callback
+from versions import user_versions
+
+# --- Configuration ---
+# Memory budget for cached response bodies, per worker process. 0 disables the cache (ETags still work).
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", str(64 << 20)))
+# Larger responses are streamed without being cached, so one full-history export cannot flush the cache
+RESPONSE_CACHE_MAX_ENTRY_BYTES = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRY_BYTES", str(1 << 20)))
+# ---------------------
+
+# Rough per-entry bookkeeping cost (key, tuple, dict slot), charged against the budget
+ENTRY_OVERHEAD_BYTES = 256
+
+
+def response_etag(user_id: str, path: str, params) -> str:
+    """Strong ETag for one user's response at their current data version."""
+    version = user_versions.get(user_id)
+    digest = hashlib.blake2b(digest_size=12)
+    digest.update(f"{user_versions.table_id}:{version}:{path}".encode("utf-8"))
+    for name, value in sorted(params):
+        digest.update(f"\0{name}={value}".encode("utf-8"))
+    return f'"{digest.hexdigest()}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match uses weak comparison: W/ prefixes are ignored and '*' matches anything."""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+class ResponseCache:
+    """LRU cache of response bodies keyed by ETag, bounded by total bytes rather than entry count."""
+
+    def __init__(self, max_bytes: int = RESPONSE_CACHE_MAX_BYTES, max_entry_bytes: int = RESPONSE_CACHE_MAX_ENTRY_BYTES):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = min(max_entry_bytes, max_bytes)
+        self._entries = OrderedDict()  # etag -> (body, media_type, headers)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.oversized = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def get(self, etag: str) -> Optional[Tuple[bytes, str, Dict[str, str]]]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            item = self._entries.get(etag)
+            if item is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(etag)
+            self.hits += 1
+            return item
+
+    def put(self, etag: str, body: bytes, media_type: str, headers: Dict[str, str]):
+        if not self.enabled:
+            return
+        if len(body) > self.max_entry_bytes:
+            with self._lock:
+                self.oversized += 1
+            return
+        with self._lock:
+            previous = self._entries.pop(etag, None)
+            if previous is not None:
+                self._bytes -= len(previous[0]) + ENTRY_OVERHEAD_BYTES
+            self._entries[etag] = (body, media_type, dict(headers))
+            self._bytes += len(body) + ENTRY_OVERHEAD_BYTES
+            while self._bytes > self.max_bytes and self._entries:
+                _, (evicted, _, _) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted) + ENTRY_OVERHEAD_BYTES
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "oversized": self.oversized,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+async def cache_streamed_body(cache: ResponseCache, etag: str, chunks: AsyncIterable[str], media_type: str,
+                              headers: Dict[str, str]) -> AsyncIterator[bytes]:
+    """
+    Passes a streamed body through unchanged and keeps a copy. Once the stream
+    has finished, the copy is cached under etag if it stayed within max_entry_bytes.
+    """
+    kept, size = [], 0
+    async for chunk in chunks:
+        data = chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+        if kept is not None:
+            size += len(data)
+            if size <= cache.max_entry_bytes:
+                kept.append(data)
+            else:
+                kept = None
+        yield data
+    if kept is not None:
+        cache.put(etag, b"".join(kept), media_type, headers)
+
+
+# Process-wide cache used by main.py
+response_cache = ResponseCache()
+register_gauge_callback(
+    "response_cache_bytes", "Bytes of /timeline and /trends responses held by the response cache.", (),
+    lambda: {(): response_cache.stats()["bytes"]})
+register_gauge_callback(
+    "response_cache_events", "Response cache hits, misses, evictions and responses too large to cache.", ("event",),
+    lambda: {(event,): response_cache.stats()[event] for event in ("hits", "misses", "evictions", "oversized")})
+
+
+def _reset_after_fork():
+    # Bodies inherited from the parent are still valid; only the lock must be new
+    response_cache._lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,157 @@
+# rollups.py
+import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# --- Configuration ---
+# Bucket sizes kept for every user. Weeks start on Monday; all buckets use the
+# same naive local time as the stored check-in timestamps.
+GRANULARITIES = ("day", "week", "month")
+# Sentiment scores live in [0, 1]; each bucket keeps a fixed histogram with this many
+# bins, so quantiles are mergeable and accurate to 1 / ROLLUP_BINS.
+ROLLUP_BINS = 100
+TREND_QUANTILES = (0.25, 0.5, 0.75)
+# ---------------------
+
+RollupKey = Tuple[str, str, datetime.datetime]
+
+
+def bucket_start(timestamp: datetime.datetime, granularity: str) -> datetime.datetime:
+    """Returns the start of the day, week (Monday) or month containing `timestamp`."""
+    day = datetime.datetime(timestamp.year, timestamp.month, timestamp.day)
+    if granularity == "day":
+        return day
+    if granularity == "week":
+        return day - datetime.timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    raise ValueError(f"Unknown granularity '{granularity}'. Use one of: {', '.join(GRANULARITIES)}")
+
+
+def score_bin(score: float) -> int:
+    return min(max(int(score * ROLLUP_BINS), 0), ROLLUP_BINS - 1)
+
+
+def accumulate(entries: Iterable[dict], partials: Optional[Dict[RollupKey, dict]] = None) -> Dict[RollupKey, dict]:
+    """
+    Folds check-in documents into per-bucket partial aggregates, keyed by
+    (user_id, granularity, bucket_start). The partials are what gets merged into
+    the stored rollups, either as an incremental update or as a full rebuild.
+    Pass `partials` to keep folding into an existing result.
+    """
+    partials = {} if partials is None else partials
+    for entry in entries:
+        if entry.get("sentiment_score") is None:
+            continue  # Deferred check-in not analysed yet
+        score = float(entry["sentiment_score"])
+        for granularity in GRANULARITIES:
+            key = (entry["user_id"], granularity, bucket_start(entry["timestamp"], granularity))
+            partial = partials.get(key)
+            if partial is None:
+                partial = partials[key] = {
+                    "count": 0, "score_sum": 0.0, "anomaly_count": 0,
+                    "score_min": score, "score_max": score, "histogram": {}, "terms": {},
+                }
+            partial["count"] += 1
+            partial["score_sum"] += score
+            partial["anomaly_count"] += 1 if entry.get("anomaly_flag") else 0
+            partial["score_min"] = min(partial["score_min"], score)
+            partial["score_max"] = max(partial["score_max"], score)
+            bin_key = str(score_bin(score))
+            partial["histogram"][bin_key] = partial["histogram"].get(bin_key, 0) + 1
+            # Lexicon terms are lowercase words and spaces, so they are safe as field names
+            for term in entry.get("keyword_terms") or ():
+                partial["terms"][term] = partial["terms"].get(term, 0) + 1
+    return partials
+
+
+def rollup_filter(key: RollupKey) -> dict:
+    user_id, granularity, start = key
+    return {"user_id": user_id, "granularity": granularity, "bucket_start": start}
+
+
+def rollup_updates(entries: Iterable[dict]) -> List[Tuple[dict, dict]]:
+    """
+    (filter, update) pairs that merge newly inserted entries into their buckets.
+    The updates only use $inc/$min/$max, so concurrent writers never lose counts.
+    """
+    updates = []
+    for key, partial in accumulate(entries).items():
+        increments = {
+            "count": partial["count"],
+            "score_sum": partial["score_sum"],
+            "anomaly_count": partial["anomaly_count"],
+        }
+        for bin_key, count in partial["histogram"].items():
+            increments[f"histogram.{bin_key}"] = count
+        for term, count in partial["terms"].items():
+            increments[f"terms.{term}"] = count
+        updates.append((rollup_filter(key), {
+            "$inc": increments,
+            "$min": {"score_min": partial["score_min"]},
+            "$max": {"score_max": partial["score_max"]},
+        }))
+    return updates
+
+
+def merge_partial(stored: Optional[dict], partial: dict) -> dict:
+    """
+    Applies a partial to a stored bucket the way rollup_updates' $inc/$min/$max do,
+    for stores without update operators (see storage_sqlite.py).
+    """
+    if stored is None:
+        return {field: dict(value) if isinstance(value, dict) else value for field, value in partial.items()}
+    merged = dict(stored)
+    for field in ("count", "score_sum", "anomaly_count"):
+        merged[field] = stored.get(field, 0) + partial[field]
+    merged["score_min"] = min(stored["score_min"], partial["score_min"])
+    merged["score_max"] = max(stored["score_max"], partial["score_max"])
+    for field in ("histogram", "terms"):
+        counts = dict(stored.get(field) or {})
+        for key, count in partial[field].items():
+            counts[key] = counts.get(key, 0) + count
+        merged[field] = counts
+    return merged
+
+
+def rollup_documents(partials: Dict[RollupKey, dict]) -> List[dict]:
+    """Complete rollup documents from accumulated partials, used by the backfill job."""
+    return [dict(rollup_filter(key), **partial) for key, partial in partials.items()]
+
+
+def histogram_quantile(histogram: dict, count: int, q: float, low: float, high: float) -> Optional[float]:
+    """
+    Estimates a quantile from a bucket's score histogram, interpolating linearly
+    inside the bin that holds it and clamping to the bucket's exact min/max.
+    """
+    if not count:
+        return None
+    target = q * count
+    seen = 0
+    for index in sorted(int(bin_key) for bin_key in histogram):
+        in_bin = histogram[str(index)]
+        if seen + in_bin >= target:
+            fraction = (target - seen) / in_bin if in_bin else 0.0
+            estimate = (index + fraction) / ROLLUP_BINS
+            return min(max(estimate, low), high)
+        seen += in_bin
+    return high
+
+
+def summarize_rollup(document: dict) -> dict:
+    """Turns a stored rollup into the /trends response row."""
+    count = document.get("count", 0)
+    low, high = document.get("score_min"), document.get("score_max")
+    summary = {
+        "bucket_start": document["bucket_start"].isoformat(),
+        "count": count,
+        "anomaly_count": document.get("anomaly_count", 0),
+        "mean": document.get("score_sum", 0.0) / count if count else None,
+        "min": low,
+        "max": high,
+        # Entries in the bucket that matched each lexicon term, most frequent first
+        "terms": dict(sorted(document.get("terms", {}).items(), key=lambda item: (-item[1], item[0]))),
+    }
+    histogram = document.get("histogram", {})
+    for q in TREND_QUANTILES:
+        summary[f"p{int(q * 100)}"] = histogram_quantile(histogram, count, q, low, high)
+    return summary
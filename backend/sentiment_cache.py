@@ -0,0 +1,250 @@
+# sentiment_cache.py
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Optional
+
+# --- Configuration ---
+# Max results kept in memory. 0 disables the cache entirely.
+SENTIMENT_CACHE_SIZE = int(os.environ.get("SENTIMENT_CACHE_SIZE", "4096"))
+# Seconds before a cached result is recomputed. 0 means results never expire.
+SENTIMENT_CACHE_TTL_SECONDS = float(os.environ.get("SENTIMENT_CACHE_TTL_SECONDS", "0"))
+# Optional sqlite file backing the memory tier so results survive restarts.
+SENTIMENT_CACHE_PATH = os.environ.get("SENTIMENT_CACHE_PATH", "")
+# Max results kept in the sqlite file; least recently used rows are deleted beyond it.
+SENTIMENT_CACHE_DISK_SIZE = int(os.environ.get("SENTIMENT_CACHE_DISK_SIZE", "100000"))
+# ---------------------
+
+# Writes delete expired rows and recount the table (other workers write to the same file) at most this often
+DISK_SWEEP_INTERVAL_SECONDS = 60.0
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """
+    Canonical form used for cache keys: Unicode NFC, trimmed, whitespace runs
+    collapsed. Case is preserved because the model is case-sensitive.
+    """
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+def make_cache_key(text: str, model_name: str) -> str:
+    """Hashes the normalized text together with the model that scored it."""
+    payload = f"{model_name}\x00{normalize_text(text)}".encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+
+class DiskCacheTier:
+    """
+    sqlite-backed second tier. One small table, safe to share between threads.
+    Bounded like the memory tier: past `max_entries` rows, the least recently
+    used are deleted. With a TTL, writes also delete expired rows.
+    """
+
+    def __init__(self, path: str, max_entries: int = SENTIMENT_CACHE_DISK_SIZE, ttl: float = 0):
+        self.path = path
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sentiment_cache ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, used_at REAL NOT NULL)"
+        )
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(sentiment_cache)")]
+        if "used_at" not in columns:
+            # Files written before the tier was bounded
+            self._conn.execute("ALTER TABLE sentiment_cache ADD COLUMN used_at REAL NOT NULL DEFAULT 0")
+            self._conn.execute("UPDATE sentiment_cache SET used_at = created_at")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sentiment_cache_used_at ON sentiment_cache (used_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sentiment_cache_created_at ON sentiment_cache (created_at)")
+        self.rows = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._swept_at = 0.0
+        with self._lock:
+            self._sweep(time.time())
+            self._evict()
+            self._conn.commit()
+
+    def get(self, key: str, ttl: float) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM sentiment_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, created_at = row
+            now = time.time()
+            if ttl and now - created_at > ttl:
+                return None
+            self._conn.execute("UPDATE sentiment_cache SET used_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        return json.loads(value)
+
+    def put(self, key: str, value: dict):
+        now = time.time()
+        with self._lock:
+            inserted = self._conn.execute(
+                "INSERT OR IGNORE INTO sentiment_cache (key, value, created_at, used_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now),
+            ).rowcount
+            if inserted:
+                self.rows += 1
+            else:
+                self._conn.execute(
+                    "UPDATE sentiment_cache SET value = ?, created_at = ?, used_at = ? WHERE key = ?",
+                    (json.dumps(value), now, now, key),
+                )
+            if now - self._swept_at >= DISK_SWEEP_INTERVAL_SECONDS:
+                self._sweep(now)
+            self._evict()
+            self._conn.commit()
+
+    def _sweep(self, now: float):
+        """Deletes expired rows and recounts the table. Called with the lock held."""
+        if self.ttl:
+            self.expirations += self._conn.execute(
+                "DELETE FROM sentiment_cache WHERE created_at < ?", (now - self.ttl,)
+            ).rowcount
+        self.rows = self._conn.execute("SELECT COUNT(*) FROM sentiment_cache").fetchone()[0]
+        self._swept_at = now
+
+    def _evict(self):
+        """Deletes the least recently used rows beyond max_entries. Called with the lock held."""
+        if self.rows <= self.max_entries:
+            return
+        evicted = self._conn.execute(
+            "DELETE FROM sentiment_cache WHERE key IN"
+            " (SELECT key FROM sentiment_cache ORDER BY used_at LIMIT ?)", (self.rows - self.max_entries,)
+        ).rowcount
+        self.rows -= evicted
+        self.evictions += evicted
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def reopen(self):
+        """
+        Opens a fresh connection in a forked child. SQLite connections must not be
+        used across fork(), so the inherited one is abandoned rather than closed.
+        """
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+
+
+class SentimentCache:
+    """
+    Bounded LRU cache of analyze_text results with an optional TTL and disk tier.
+    Lookups fall through memory -> disk -> model; disk hits are promoted back
+    into memory.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float = 0, disk_path: str = "",
+                 disk_max_entries: int = SENTIMENT_CACHE_DISK_SIZE):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.disk = DiskCacheTier(disk_path, disk_max_entries, ttl_seconds) if disk_path and max_entries > 0 else None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get(self, key: str) -> Optional[dict]:
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None:
+                value, stored_at = item
+                if self.ttl and time.monotonic() - stored_at > self.ttl:
+                    del self._entries[key]
+                    self.expirations += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return dict(value)
+
+        if self.disk is not None:
+            value = self.disk.get(key, self.ttl)
+            if value is not None:
+                self._remember(key, value)
+                with self._lock:
+                    self.disk_hits += 1
+                return dict(value)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, value: dict):
+        if not self.enabled:
+            return
+        self._remember(key, value)
+        if self.disk is not None:
+            self.disk.put(key, value)
+
+    def _remember(self, key: str, value: dict):
+        with self._lock:
+            self._entries[key] = (dict(value), time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "disk_path": self.disk.path if self.disk is not None else None,
+                "disk_size": self.disk.rows if self.disk is not None else 0,
+                "disk_evictions": self.disk.evictions if self.disk is not None else 0,
+                "disk_expirations": self.disk.expirations if self.disk is not None else 0,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
+
+
+# Process-wide cache in front of nlp_model.analyze_text
+sentiment_cache = SentimentCache(SENTIMENT_CACHE_SIZE, SENTIMENT_CACHE_TTL_SECONDS, SENTIMENT_CACHE_PATH,
+                                 SENTIMENT_CACHE_DISK_SIZE)
+
+
+def _reset_after_fork():
+    """Gives a forked worker (see prefork.py) its own locks and sqlite connection."""
+    sentiment_cache._lock = threading.Lock()
+    if sentiment_cache.disk is not None:
+        sentiment_cache.disk.reopen()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -2,17 +2,41 @@
 """
 Simple script to start the FastAPI server with proper configuration.
 Run this instead of manually typing the uvicorn command.
+
+    python start_server.py                       # development: one worker, auto-reload
+    python start_server.py --workers 4           # production: pre-forked workers sharing one model
+    python start_server.py --workers auto --threads 2
 """
 
-import uvicorn
+import argparse
 import os
 
+import uvicorn
+
+# --- Configuration ---
+# 0 runs the development server; a count or "auto" (one per available core) runs the pre-fork server
+SERVER_WORKERS = os.environ.get("SERVER_WORKERS", "0")
+# Inference threads per worker; 0 splits the cores evenly between workers
+WORKER_THREADS = int(os.environ.get("WORKER_THREADS", "0"))
+# ---------------------
+
 if __name__ == "__main__":
-    # Start the FastAPI server
-    uvicorn.run(
-        "main:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True,  # Auto-reload on code changes
-        log_level="info"
-    )
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Start the check-in API")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", default=SERVER_WORKERS, help="Pre-forked worker processes, or 'auto' (default: 0 = dev server)")
+    parser.add_argument("--threads", type=int, default=WORKER_THREADS, help="Inference threads per worker (default: cores / workers)")
+    args = parser.parse_args()
+
+    if str(args.workers) not in ("", "0"):
+        from prefork import serve
+        serve(args.host, args.port, args.workers, args.threads)
+    else:
+        # Start the FastAPI server
+        uvicorn.run(
+            "main:app",
+            host=args.host,
+            port=args.port,
+            reload=True,  # Auto-reload on code changes
+            log_level="info"
+        )
@@ -0,0 +1,49 @@
+# storage.py
+"""
+Storage backend used by the API, chosen with STORAGE_BACKEND.
+
+"mongo" (default) is MongoDB through Motor (database_async.py). "sqlite" is an
+embedded SQLite file (storage_sqlite.py) for single-node and edge installs
+and for tests without a MongoDB server. Both provide the same async interface,
+re-exported here: connect/close, schema setup, single and batch inserts,
+timeline cursors, baselines, trend rollups and the write-behind buffer.
+"""
+
+import os
+
+from metrics import register_gauge_callback
+
+# --- Configuration ---
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "mongo").lower()
+# ---------------------
+
+SUPPORTED_STORAGE_BACKENDS = ("mongo", "sqlite")
+
+if STORAGE_BACKEND == "mongo":
+    from database_async import (
+        connect_async_mongo as connect_storage, close_async_mongo as close_storage, ensure_indexes_async as ensure_schema_async,
+        get_score_baseline_async, insert_checkin_entry_async, insert_checkin_entries_async, insert_pending_entry_async,
+        find_timeline_entries_async, find_rollups_async, write_buffer,
+    )
+elif STORAGE_BACKEND == "sqlite":
+    from storage_sqlite import (
+        connect_sqlite as connect_storage, close_sqlite as close_storage, ensure_schema_async,
+        get_score_baseline_async, insert_checkin_entry_async, insert_checkin_entries_async, insert_pending_entry_async,
+        find_timeline_entries_async, find_rollups_async, write_buffer,
+    )
+else:
+    raise ValueError(f"Unknown STORAGE_BACKEND '{STORAGE_BACKEND}', expected one of: {', '.join(SUPPORTED_STORAGE_BACKENDS)}")
+
+
+def require_mongo(feature: str):
+    """For features that read MongoDB directly (job workers, exports)."""
+    if STORAGE_BACKEND != "mongo":
+        raise RuntimeError(f"{feature} needs STORAGE_BACKEND=mongo (running with '{STORAGE_BACKEND}')")
+
+
+register_gauge_callback(
+    "write_buffer_entries", "Check-ins accepted but not yet written by the write-behind buffer.", ("state",),
+    lambda: {(state,): write_buffer.stats()[state] for state in ("pending", "in_flight")})
+register_gauge_callback(
+    "write_buffer_events", "Write-behind flushes, entries written, failed flushes and entries replayed from the WAL.", ("event",),
+    lambda: {(event,): write_buffer.stats()[event] for event in ("flushes", "flushed_entries", "flush_errors", "replayed_entries")})
@@ -0,0 +1,493 @@
+# storage_sqlite.py
+"""
+Embedded SQLite storage backend (STORAGE_BACKEND=sqlite).
+
+Implements the async storage interface of database_async.py (inserts, batch
+inserts, timeline pages and streams, baselines, trend rollups) on a local SQLite
+file, so a single-node or edge install needs no MongoDB server.
+
+- WAL journal: readers never block the writer, or each other.
+- One writer thread per process. Each insert batch and its rollup updates commit
+  in one BEGIN IMMEDIATE transaction. Pre-forked workers serialize on SQLite's
+  file lock, waiting up to SQLITE_BUSY_TIMEOUT_MS.
+- A pool of reader threads, each with its own connection. Statements use fixed
+  SQL text with ? parameters, so sqlite3's statement cache reuses the prepared statement.
+- The (user_id, timestamp, id) index serves timelines, pagination and baseline
+  reads, like the user_timestamp index in MongoDB. Timelines are read in
+  TIMELINE_BATCH_SIZE keyset batches, so a long stream never pins a read snapshot.
+
+Deferred check-ins, background jobs, /export and the maintenance scripts read
+MongoDB directly and are not available on this backend.
+"""
+
+import asyncio
+import datetime
+import json
+import os
+import sqlite3
+import threading
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from bson import ObjectId
+
+from anomaly import baseline_store
+from baseline import BASELINE_WINDOW
+from database import DEFAULT_USER_ID, INSERT_CHUNK_SIZE, TIMELINE_BATCH_SIZE, TIMELINE_FIELDS, build_checkin_entry, naive_local
+from rollups import accumulate, merge_partial
+from versions import bump_user_versions
+from write_buffer import WriteBehindBuffer
+
+# --- Configuration ---
+SQLITE_PATH = os.environ.get("SQLITE_PATH", "checkins.sqlite3")
+# Reader connections (and threads) per process
+SQLITE_READ_THREADS = int(os.environ.get("SQLITE_READ_THREADS", "4"))
+# NORMAL survives an application crash; FULL also survives power loss, at one fsync per commit
+SQLITE_SYNCHRONOUS = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL").upper()
+# How long a write waits for another process holding the write lock
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+# ---------------------
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS checkins (
+        id TEXT PRIMARY KEY,            -- ObjectId hex, so ids look the same as on MongoDB
+        user_id TEXT NOT NULL,
+        timestamp INTEGER NOT NULL,     -- ms since the Unix epoch; naive datetimes count as UTC, as in MongoDB
+        user_text TEXT,
+        sentiment_score REAL,
+        keyword_intensity REAL,
+        keyword_terms TEXT,             -- JSON list
+        anomaly_flag INTEGER NOT NULL DEFAULT 0,
+        anomaly_detectors TEXT,         -- JSON object
+        model_version TEXT,
+        analysis_status TEXT,
+        import_ref TEXT UNIQUE
+    )""",
+    "CREATE INDEX IF NOT EXISTS user_timestamp ON checkins (user_id, timestamp, id)",
+    """CREATE TABLE IF NOT EXISTS rollups (
+        user_id TEXT NOT NULL,
+        granularity TEXT NOT NULL,
+        bucket_start INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        anomaly_count INTEGER NOT NULL,
+        score_sum REAL NOT NULL,
+        score_min REAL NOT NULL,
+        score_max REAL NOT NULL,
+        histogram TEXT NOT NULL,
+        terms TEXT NOT NULL,
+        PRIMARY KEY (user_id, granularity, bucket_start)
+    ) WITHOUT ROWID""",
+)
+
+COLUMNS = ("id", "user_id", "timestamp", "user_text", "sentiment_score", "keyword_intensity", "keyword_terms",
+           "anomaly_flag", "anomaly_detectors", "model_version", "analysis_status", "import_ref")
+JSON_COLUMNS = ("keyword_terms", "anomaly_detectors")
+IMPORT_REF_INDEX = COLUMNS.index("import_ref")
+INSERT_SQL = f"INSERT OR IGNORE INTO checkins ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+ROLLUP_COLUMNS = ("count", "anomaly_count", "score_sum", "score_min", "score_max", "histogram", "terms")
+# Values bound per IN (...) lookup, well under SQLite's limit on host parameters
+LOOKUP_CHUNK_SIZE = 500
+UPSERT_ROLLUP_SQL = (f"INSERT OR REPLACE INTO rollups (user_id, granularity, bucket_start, {', '.join(ROLLUP_COLUMNS)}) "
+                     f"VALUES ({', '.join('?' * (3 + len(ROLLUP_COLUMNS)))})")
+
+EPOCH = datetime.datetime(1970, 1, 1)
+MILLISECOND = datetime.timedelta(milliseconds=1)
+
+
+def to_millis(moment: datetime.datetime) -> int:
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return (moment - EPOCH) // MILLISECOND
+
+
+def from_millis(millis: int) -> datetime.datetime:
+    return EPOCH + datetime.timedelta(milliseconds=millis)
+
+
+def entry_row(entry: dict) -> tuple:
+    """Column values of a check-in document, in COLUMNS order. Assigns an _id like insert_one would."""
+    entry.setdefault("_id", ObjectId())
+    values = []
+    for column in COLUMNS:
+        if column == "id":
+            values.append(str(entry["_id"]))
+        elif column == "timestamp":
+            values.append(to_millis(entry["timestamp"]))
+        elif column == "anomaly_flag":
+            values.append(1 if entry.get("anomaly_flag") else 0)
+        elif column in JSON_COLUMNS:
+            value = entry.get(column)
+            values.append(json.dumps(value) if value is not None else None)
+        else:
+            values.append(entry.get(column))
+    return tuple(values)
+
+
+def row_document(columns: List[str], row: tuple) -> dict:
+    """A MongoDB-shaped document from a row; NULL columns are left out, like missing fields."""
+    document = {}
+    for column, value in zip(columns, row):
+        if value is None:
+            continue
+        if column == "id":
+            document["_id"] = ObjectId(value)
+        elif column == "timestamp":
+            document["timestamp"] = from_millis(value)
+        elif column == "anomaly_flag":
+            document[column] = bool(value)
+        elif column in JSON_COLUMNS:
+            document[column] = json.loads(value)
+        else:
+            document[column] = value
+    return document
+
+
+class SQLiteStore:
+    """One SQLite database file: a writer thread and a pool of reader threads, each with its own connection."""
+
+    def __init__(self, path: str = SQLITE_PATH, read_threads: int = SQLITE_READ_THREADS):
+        self.path = path
+        self.read_threads = max(1, read_threads)
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._writer = None
+        self._readers = None
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # Autocommit mode: transactions are opened explicitly with BEGIN IMMEDIATE
+            connection = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False, cached_statements=256)
+            connection.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}")
+            connection.execute(f"PRAGMA synchronous = {SQLITE_SYNCHRONOUS}")
+            self._local.connection = connection
+            with self._connections_lock:
+                self._connections.append(connection)
+        return connection
+
+    def open(self):
+        if self._writer is not None:
+            return
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-writer")
+        self._readers = ThreadPoolExecutor(max_workers=self.read_threads, thread_name_prefix="sqlite-reader")
+
+    def close(self):
+        if self._writer is None:
+            return
+        self._writer.shutdown(wait=True)
+        self._readers.shutdown(wait=True)
+        self._writer = self._readers = None
+        with self._connections_lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+    def _transaction(self, function, *args):
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            result = function(connection, *args)
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+        return result
+
+    async def write(self, function, *args):
+        """Runs function(connection, *args) in one write transaction on the writer thread."""
+        if self._writer is None:
+            raise RuntimeError("SQLite storage is not open. Call connect_sqlite() first.")
+        return await asyncio.get_running_loop().run_in_executor(self._writer, self._transaction, function, *args)
+
+    async def read(self, function, *args):
+        """Runs function(connection, *args) on a reader thread."""
+        if self._readers is None:
+            raise RuntimeError("SQLite storage is not open. Call connect_sqlite() first.")
+        return await asyncio.get_running_loop().run_in_executor(
+            self._readers, lambda: function(self._connection(), *args))
+
+
+sqlite_store = SQLiteStore()
+
+
+# --- Statements (run on the store's threads) ---
+
+def _create_schema(connection):
+    # journal_mode is persistent and cannot change inside a transaction
+    connection.execute("PRAGMA journal_mode = WAL")
+    for statement in SCHEMA:
+        connection.execute(statement)
+
+
+def _select_in(connection, sql, prefix, values):
+    """Runs `sql` (ending in "IN ({})") over `values` in chunks, yielding every row."""
+    for offset in range(0, len(values), LOOKUP_CHUNK_SIZE):
+        chunk = values[offset:offset + LOOKUP_CHUNK_SIZE]
+        yield from connection.execute(sql.format(", ".join("?" * len(chunk))), prefix + tuple(chunk))
+
+
+def _existing_keys(connection, rows):
+    """The ids and import_refs among `rows` that are already stored."""
+    ids = [row[0] for row in rows]
+    refs = [row[IMPORT_REF_INDEX] for row in rows if row[IMPORT_REF_INDEX] is not None]
+    existing = {id_ for (id_,) in _select_in(connection, "SELECT id FROM checkins WHERE id IN ({})", (), ids)}
+    existing.update(ref for (ref,) in _select_in(connection, "SELECT import_ref FROM checkins WHERE import_ref IN ({})", (), refs))
+    return existing
+
+
+def _stored_rollups(connection, keys):
+    """Stored rollups for (user_id, granularity, bucket_start ms) keys, one query per user and granularity."""
+    starts = {}
+    for user_id, granularity, start in keys:
+        starts.setdefault((user_id, granularity), []).append(start)
+    stored = {}
+    sql = f"SELECT bucket_start, {', '.join(ROLLUP_COLUMNS)} FROM rollups WHERE user_id = ? AND granularity = ? AND bucket_start IN ({{}})"
+    for (user_id, granularity), values in starts.items():
+        for bucket_start, *columns in _select_in(connection, sql, (user_id, granularity), values):
+            rollup = dict(zip(ROLLUP_COLUMNS, columns))
+            rollup["histogram"], rollup["terms"] = json.loads(rollup["histogram"]), json.loads(rollup["terms"])
+            stored[(user_id, granularity, bucket_start)] = rollup
+    return stored
+
+
+def _insert_entries(connection, entries):
+    """
+    Inserts entries, skipping existing ids and import_refs, and merges the new ones
+    into their rollups. Runs in the write transaction, so nothing can be inserted
+    between the lookup of existing keys and the insert.
+    """
+    rows = [entry_row(entry) for entry in entries]
+    seen = _existing_keys(connection, rows)
+    written, new_rows = [], []
+    for entry, row in zip(entries, rows):
+        keys = (row[0], row[IMPORT_REF_INDEX])
+        if any(key in seen for key in keys if key is not None):
+            continue
+        seen.update(key for key in keys if key is not None)
+        written.append(entry)
+        new_rows.append(row)
+    connection.executemany(INSERT_SQL, new_rows)
+
+    partials = {(user_id, granularity, to_millis(start)): partial
+                for (user_id, granularity, start), partial in accumulate(written).items()}
+    stored = _stored_rollups(connection, list(partials))
+    upserts = []
+    for key, partial in partials.items():
+        merged = merge_partial(stored.get(key), partial)
+        upserts.append(key + tuple(
+            json.dumps(merged[column]) if column in ("histogram", "terms") else merged[column] for column in ROLLUP_COLUMNS))
+    connection.executemany(UPSERT_ROLLUP_SQL, upserts)
+    return written
+
+
+def _select_scores(connection, user_id, limit, until=None):
+    where = "user_id = ? AND sentiment_score IS NOT NULL" + (" AND timestamp <= ?" if until is not None else "")
+    parameters = (user_id,) if until is None else (user_id, to_millis(until))
+    if limit:
+        # Newest N scores, flipped back into chronological order
+        rows = connection.execute(
+            f"SELECT sentiment_score FROM checkins WHERE {where} ORDER BY timestamp DESC, id DESC LIMIT ?",
+            parameters + (limit,)).fetchall()
+        return array("d", (score for (score,) in reversed(rows)))
+    cursor = connection.execute(f"SELECT sentiment_score FROM checkins WHERE {where} ORDER BY timestamp, id", parameters)
+    # Straight from the cursor into the array, without a list of row tuples in between
+    return array("d", (score for (score,) in cursor))
+
+
+def _has_scores_after(connection, user_id, until):
+    return connection.execute(
+        "SELECT 1 FROM checkins WHERE user_id = ? AND sentiment_score IS NOT NULL AND timestamp > ? LIMIT 1",
+        (user_id, to_millis(until))).fetchone() is not None
+
+
+def timeline_sql(fields, has_start: bool, has_end: bool, has_after: bool) -> str:
+    """The timeline query for one combination of projection and filters; each one is prepared once and cached."""
+    columns = ["id", "timestamp"] + list(fields or TIMELINE_FIELDS)
+    clauses = ["user_id = ?"]
+    if has_start:
+        clauses.append("timestamp >= ?")
+    if has_end:
+        clauses.append("timestamp < ?")
+    if has_after:
+        # Row values compare lexicographically, so this is one index range: (timestamp, id) > (after)
+        clauses.append("(timestamp, id) > (?, ?)")
+    return f"SELECT {', '.join(columns)} FROM checkins WHERE {' AND '.join(clauses)} ORDER BY timestamp, id LIMIT ?"
+
+
+def _select_timeline(connection, sql, parameters):
+    cursor = connection.execute(sql, parameters)
+    columns = [description[0] for description in cursor.description]
+    return columns, cursor.fetchall()
+
+
+def _select_rollups(connection, user_id, granularity, start, end):
+    sql = f"SELECT bucket_start, {', '.join(ROLLUP_COLUMNS)} FROM rollups WHERE user_id = ? AND granularity = ?"
+    parameters = [user_id, granularity]
+    if start is not None:
+        sql += " AND bucket_start >= ?"
+        parameters.append(to_millis(naive_local(start)))
+    if end is not None:
+        sql += " AND bucket_start < ?"
+        parameters.append(to_millis(naive_local(end)))
+    rows = connection.execute(sql + " ORDER BY bucket_start", parameters).fetchall()
+    documents = []
+    for row in rows:
+        document = dict(zip(ROLLUP_COLUMNS, row[1:]), user_id=user_id, granularity=granularity)
+        document["bucket_start"] = from_millis(row[0])
+        document["histogram"], document["terms"] = json.loads(document["histogram"]), json.loads(document["terms"])
+        documents.append(document)
+    return documents
+
+
+# --- Async interface (mirrors database_async.py) ---
+
+async def connect_sqlite():
+    sqlite_store.open()
+    print(f"Opened SQLite storage: '{sqlite_store.path}' ({sqlite_store.read_threads} readers, synchronous={SQLITE_SYNCHRONOUS})")
+
+
+async def close_sqlite():
+    await asyncio.to_thread(sqlite_store.close)
+    print("SQLite storage closed.")
+
+
+async def ensure_schema_async():
+    """Counterpart of ensure_indexes_async(): creates the tables and the user_timestamp index."""
+    await sqlite_store.write(_create_schema)
+
+
+async def write_entries_async(chunk):
+    """Writes one chunk and its rollup updates in a single transaction; returns the entries that were new."""
+    written = await sqlite_store.write(_insert_entries, chunk)
+    bump_user_versions(*{entry["user_id"] for entry in written})
+    return written
+
+
+# Batches single check-ins when WRITE_BEHIND is on; one transaction per batch saves a commit per check-in
+write_buffer = WriteBehindBuffer(write_entries_async)
+
+
+async def insert_checkin_entry_async(user_text, sentiment_score, keyword_intensity, anomaly_flag=False, user_id=DEFAULT_USER_ID,
+                                     anomaly_detectors=None, model_version=None, keyword_terms=None):
+    """Counterpart of database_async.insert_checkin_entry_async()."""
+    entry_data = build_checkin_entry(
+        user_text, sentiment_score, keyword_intensity, anomaly_flag, user_id=user_id, anomaly_detectors=anomaly_detectors,
+        model_version=model_version, keyword_terms=keyword_terms,
+    )
+    if write_buffer.enabled:
+        entry_id = await write_buffer.add(entry_data)
+        baseline_store.add(user_id, sentiment_score)
+        bump_user_versions(user_id)
+        return entry_id
+
+    await write_entries_async([entry_data])
+    baseline_store.add(user_id, sentiment_score)
+    return entry_data["_id"]
+
+
+async def insert_pending_entry_async(user_text, user_id=DEFAULT_USER_ID):
+    raise RuntimeError("Deferred check-ins need STORAGE_BACKEND=mongo: the job workers read entries from MongoDB")
+
+
+async def insert_checkin_entries_async(entries, chunk_size=INSERT_CHUNK_SIZE):
+    """Counterpart of database_async.insert_checkin_entries_async(): one transaction per chunk."""
+    inserted = 0
+    for offset in range(0, len(entries), chunk_size):
+        written = await write_entries_async(entries[offset:offset + chunk_size])
+        inserted += len(written)
+        for entry in written:
+            baseline_store.add(entry["user_id"], entry["sentiment_score"])
+    return inserted
+
+
+async def load_sentiment_history_async(user_id=DEFAULT_USER_ID, limit=None, until=None):
+    return await sqlite_store.read(_select_scores, user_id, limit, until)
+
+
+async def get_score_baseline_async(user_id=DEFAULT_USER_ID, until=None):
+    """Counterpart of database_async.get_score_baseline_async(), buffered check-ins included."""
+    if until is not None:
+        async with write_buffer.lock:
+            buffered = write_buffer.buffered(user_id)
+            if any(entry["timestamp"] > until for entry in buffered) or await sqlite_store.read(_has_scores_after, user_id, until):
+                scores = await load_sentiment_history_async(user_id, limit=BASELINE_WINDOW or None, until=until)
+                scores.extend(entry["sentiment_score"] for entry in buffered if entry["timestamp"] <= until)
+                return baseline_store.build(scores[-BASELINE_WINDOW:] if BASELINE_WINDOW else scores)
+    if not baseline_store.is_loaded(user_id):
+        async with write_buffer.lock:
+            version = baseline_store.version(user_id)
+            scores = await load_sentiment_history_async(user_id, limit=BASELINE_WINDOW or None)
+            scores.extend(entry["sentiment_score"] for entry in write_buffer.buffered(user_id))
+            baseline_store.seed(user_id, scores[-BASELINE_WINDOW:] if BASELINE_WINDOW else scores, version)
+    return baseline_store.get(user_id)
+
+
+class SQLiteTimelineCursor:
+    """
+    Stands in for the Motor cursor returned by find_timeline_entries_async:
+    iterate it with `async for` or call to_list(). Rows are fetched in
+    TIMELINE_BATCH_SIZE keyset batches, each its own short read.
+    """
+
+    def __init__(self, user_id, start=None, end=None, after=None, limit=None, fields=None):
+        # Without a cursor, only the first batch runs without the keyset clause
+        self.sql = {has_after: timeline_sql(fields, start is not None, end is not None, has_after) for has_after in (False, True)}
+        self.parameters = [user_id]
+        if start is not None:
+            self.parameters.append(to_millis(naive_local(start)))
+        if end is not None:
+            self.parameters.append(to_millis(naive_local(end)))
+        self.after = (to_millis(after[0]), str(after[1])) if after is not None else None
+        self.limit = limit
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        after, remaining = self.after, self.limit
+        while True:
+            size = min(TIMELINE_BATCH_SIZE, remaining) if remaining else TIMELINE_BATCH_SIZE
+            keyset = list(after) if after is not None else []
+            columns, rows = await sqlite_store.read(_select_timeline, self.sql[after is not None], self.parameters + keyset + [size])
+            for row in rows:
+                yield row_document(columns, row)
+            if len(rows) < size:
+                return
+            if remaining:
+                remaining -= len(rows)
+                if remaining <= 0:
+                    return
+            # Columns start with id, timestamp
+            after = (rows[-1][1], rows[-1][0])
+
+    async def to_list(self, length=None):
+        entries = []
+        async for entry in self:
+            entries.append(entry)
+            if length is not None and len(entries) >= length:
+                break
+        return entries
+
+
+def find_timeline_entries_async(user_id=DEFAULT_USER_ID, start=None, end=None, after=None, limit=None, fields=None):
+    """Counterpart of database_async.find_timeline_entries_async()."""
+    return SQLiteTimelineCursor(user_id, start, end, after, limit, fields)
+
+
+class SQLiteRollupCursor:
+    """Stands in for the Motor cursor returned by find_rollups_async; only to_list() is needed."""
+
+    def __init__(self, user_id, granularity, start, end):
+        self.arguments = (user_id, granularity, start, end)
+
+    async def to_list(self, length=None):
+        documents = await sqlite_store.read(_select_rollups, *self.arguments)
+        return documents if length is None else documents[:length]
+
+
+def find_rollups_async(user_id=DEFAULT_USER_ID, granularity="day", start=None, end=None):
+    """Counterpart of database_async.find_rollups_async()."""
+    return SQLiteRollupCursor(user_id, granularity, start, end)
@@ -0,0 +1,72 @@
+# conftest.py
+"""
+Shared pytest setup. The backend modules import each other as top-level modules,
+so the backend directory goes on sys.path. API tests run against mongomock,
+behind both the PyMongo and the Motor client, and never load the real model.
+Files the modules create at runtime (user version counters, the job queue,
+caches) are kept in a scratch directory instead of the working tree.
+"""
+
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+SCRATCH_DIR = tempfile.mkdtemp(prefix="checkin-tests-")
+os.environ.setdefault("USER_VERSION_PATH", os.path.join(SCRATCH_DIR, "user_versions.bin"))
+os.environ.setdefault("JOB_QUEUE_PATH", os.path.join(SCRATCH_DIR, "jobs.sqlite3"))
+# The app lifespan would otherwise start loading the model in the background
+os.environ.setdefault("MODEL_LOAD_MODE", "lazy")
+
+
+@pytest.fixture
+def mongo(monkeypatch):
+    """An empty in-memory check-in collection that the app's sync and async layers both use."""
+    mongomock = pytest.importorskip("mongomock")
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    import database
+    import database_async
+    from anomaly import baseline_store
+
+    client = mongomock.MongoClient()
+    collection = client[database.DB_NAME][database.COLLECTION_NAME]
+    monkeypatch.setattr(database, "mongo_client", client)
+    monkeypatch.setattr(database, "mongo_collection", collection)
+    monkeypatch.setattr(database_async, "AsyncIOMotorClient",
+                        lambda *args, **kwargs: mongomock_motor.AsyncMongoMockClient(mock_mongo_client=client))
+    from response_cache import response_cache
+    # Baselines and responses cached by earlier tests describe another collection
+    baseline_store.reset()
+    response_cache.clear()
+    yield collection
+    baseline_store.reset()
+    response_cache.clear()
+
+
+@pytest.fixture
+def api(mongo):
+    """A TestClient with the app lifespan running."""
+    from fastapi.testclient import TestClient
+    import main
+
+    with TestClient(main.app) as client:
+        yield client
+
+
+@pytest.fixture
+def local_timezone(monkeypatch):
+    """
+    Runs the test five hours behind UTC, so naive local times and UTC differ.
+    Yields a function that turns a naive local time into the same instant in UTC.
+    """
+    monkeypatch.setenv("TZ", "EST5")
+    time.tzset()
+    yield lambda moment: moment.astimezone().astimezone(datetime.timezone.utc)
+    monkeypatch.undo()
+    time.tzset()
@@ -0,0 +1,154 @@
+import asyncio
+import math
+
+import pytest
+
+import nlp_model
+from admission import AdmissionController, Overloaded
+
+TARGET_MS = 100.0
+
+
+def make_controller(**overrides):
+    options = dict(max_limit=8, enabled=True, target_ms=TARGET_MS, min_limit=1, queue_timeout_ms=0, max_queued=4)
+    options.update(overrides)
+    return AdmissionController(**options)
+
+
+async def saturated_round(controller, latency):
+    """Fills every slot, has one more request shed, then completes the admitted ones at `latency` seconds."""
+    slots = [await controller.acquire() for _ in range(int(controller.limit))]
+    with pytest.raises(Overloaded) as shed:
+        await controller.acquire()
+    # Released directly rather than by exiting the slot, so the latency is the synthetic one
+    for _ in slots:
+        controller.release(latency)
+    return shed.value
+
+
+async def limits_over(controller, latency, rounds):
+    """Runs saturated rounds and returns each limit the controller moved through, in order."""
+    limits = [int(controller.limit)]
+    for _ in range(rounds):
+        shed = await saturated_round(controller, latency)
+        assert 1 <= shed.retry_after <= max(1, math.ceil(controller.latency_average))
+        if int(controller.limit) != limits[-1]:
+            limits.append(int(controller.limit))
+    return limits
+
+
+def test_limit_shrinks_under_slow_inference_and_recovers():
+    async def run():
+        controller = make_controller()
+
+        # p90 at 4x the target: each window halves the limit (the largest step), down to the minimum
+        assert await limits_over(controller, 0.4, 20) == [8, 4, 2, 1]
+        assert controller.decreases == 3
+        assert controller.window_p90 == pytest.approx(0.4)
+        assert controller.shed == 20
+
+        # Within target and still running into the limit: one more slot per window, back up to the maximum
+        assert await limits_over(controller, 0.02, 80) == list(range(1, 9))
+        assert controller.increases == 7
+        assert controller.shed == 100
+        stats = controller.stats()
+        assert (stats["limit"], stats["in_flight"], stats["queued"]) == (8, 0, 0)
+
+    asyncio.run(run())
+
+
+def test_queued_requests_get_freed_slots_or_time_out():
+    async def run():
+        controller = make_controller(max_limit=1, queue_timeout_ms=50, max_queued=1)
+        first = await controller.acquire()
+
+        # A waiter is handed the slot the moment it is released
+        waiter = asyncio.create_task(controller.acquire())
+        await asyncio.sleep(0)
+        assert controller.stats()["queued"] == 1
+        # The queue is full, so the next request is shed at once
+        with pytest.raises(Overloaded):
+            await controller.acquire()
+        with first:
+            pass
+        second = await waiter
+        assert controller.in_flight == 1
+
+        # With nothing released, the next waiter is shed after the queue timeout
+        with pytest.raises(Overloaded) as timed_out:
+            await controller.acquire()
+        assert controller.queue_timeouts == 1
+        assert timed_out.value.retry_after >= 1
+        with second:
+            pass
+        stats = controller.stats()
+        assert (stats["in_flight"], stats["queued"], stats["admitted"], stats["shed"]) == (0, 0, 2, 2)
+
+    asyncio.run(run())
+
+
+def test_disabled_controller_admits_everything():
+    async def run():
+        controller = make_controller(enabled=False, max_limit=1)
+        slots = [await controller.acquire() for _ in range(5)]
+        for slot in slots:
+            with slot:
+                pass
+        assert controller.in_flight == 0 and controller.shed == 0
+
+    asyncio.run(run())
+
+
+def test_checkin_is_shed_with_503_and_retry_after(monkeypatch):
+    httpx = pytest.importorskip("httpx")
+    import main
+
+    controller = make_controller(max_limit=1)
+    controller.latency_average = 2.5
+    monkeypatch.setattr(main, "admission_controller", controller)
+
+    async def run():
+        slot = await controller.acquire()
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            shed = await client.post("/checkin", json={"user_text": "A long day.", "user_id": "shed-user", "defer": False})
+            batch = await client.post("/checkin/batch", json={"entries": [{"user_text": "A long day.", "user_id": "shed-user"}]})
+        with slot:
+            pass
+        return shed, batch
+
+    shed, batch = asyncio.run(run())
+    for response in (shed, batch):
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "3"
+    assert controller.shed == 2
+
+
+class RecordingPipeline:
+    """Stands in for the transformers pipeline: a tokenizer and a call that only records its inputs."""
+
+    def __init__(self):
+        self.calls = []
+        self.tokenizer = lambda text, truncation: {"input_ids": text.split()[:512]}
+
+    def __call__(self, texts, batch_size, truncation):
+        self.calls.append((len(texts), batch_size, texts[0]))
+        return [{"label": "neutral", "score": 1.0}] * len(texts)
+
+
+def test_warm_up_runs_every_batch_size_and_input_length(monkeypatch):
+    monkeypatch.setattr(nlp_model, "WARMUP_BATCH_SIZES", [1, 4, 16])
+    monkeypatch.setattr(nlp_model, "warmup_shapes", [])
+    pipeline = RecordingPipeline()
+
+    nlp_model._warm_up(pipeline)
+
+    expected = [(size, text) for size in (1, 4, 16) for text in nlp_model.WARMUP_TEXTS]
+    assert [(count, text) for count, _, text in pipeline.calls] == expected
+    assert all(count == batch_size for count, batch_size, _ in pipeline.calls)
+    shapes = nlp_model.warmup_shapes
+    assert [(shape["batch_size"], shape["tokens"]) for shape in shapes] == [
+        (size, len(pipeline.tokenizer(text, truncation=True)["input_ids"])) for size, text in expected]
+    # Short, typical and full-window inputs are distinct shapes
+    assert len({shape["tokens"] for shape in shapes}) == len(nlp_model.WARMUP_TEXTS)
+    assert all(shape["seconds"] >= 0 for shape in shapes)
@@ -0,0 +1,154 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import database
+import main
+import reflag_anomalies
+from anomaly import (
+    anomaly_engine, AnomalyEngine, CUSUMDetector, EWMADetector, IQRDetector, RollingZScoreDetector, ANOMALY_MIN_HISTORY,
+)
+
+# A steady user around 0.6, one sharp dip, a recovery, then a sustained moderate slide
+STEADY = [0.60, 0.62, 0.58, 0.61, 0.59, 0.60, 0.62, 0.58, 0.61, 0.59]
+SERIES = STEADY + [0.05] + STEADY[:5] + [0.55] * 8
+
+
+def engine(*detectors) -> AnomalyEngine:
+    return AnomalyEngine(list(detectors))
+
+
+def stream(detectors, values):
+    """Checks every value against the state built from the values before it, as /checkin does."""
+    run = engine(*detectors)
+    state = run.new_state()
+    fired = []
+    for value in values:
+        fired.append(run.check(state, value)["fired"])
+        state.add(value)
+    return fired
+
+
+def test_iqr_matches_the_pandas_rule():
+    rng = np.random.default_rng(7)
+    values = np.round(rng.choice([0.2, 0.4, 0.5, 0.6, 0.9, -0.3], size=200), 2)
+    detector = IQRDetector(multiplier=1.5, mode="exact", window=0)
+    flags = stream([detector], values)
+    for index, value in enumerate(values):
+        history = pd.Series(values[:index])
+        if index < ANOMALY_MIN_HISTORY:
+            expected = False
+        else:
+            q1, q3 = history.quantile(0.25), history.quantile(0.75)
+            expected = value < q1 - 1.5 * (q3 - q1)
+        assert bool(flags[index]) == bool(expected), index
+
+
+def test_zscore_flags_only_the_sharp_dip():
+    detector = RollingZScoreDetector(window=10, threshold=3.0)
+    flags = stream([detector], SERIES)
+    assert [index for index, fired in enumerate(flags) if fired] == [10]
+
+    run = engine(detector)
+    state = run.new_state()
+    for value in STEADY:
+        state.add(value)
+    result = run.check(state, 0.05)["detectors"][0]
+    window = np.array(STEADY)
+    assert result["statistic"] == pytest.approx((0.05 - window.mean()) / window.std(ddof=1))
+
+
+def test_ewma_flags_the_dip_but_not_steady_values():
+    flags = stream([EWMADetector(alpha=0.2, threshold=3.0)], SERIES)
+    assert flags[10]
+    assert not any(flags[:10])
+
+
+def test_cusum_flags_a_sustained_shift_that_no_single_point_crosses():
+    # After a long steady history, 0.55 is ~3 standard deviations low: not a dip for a
+    # 4-sigma z-score, but repeated it adds up to a CUSUM alarm
+    history = STEADY * 3
+    slide = [0.555] * 6
+    zscore_flags = stream([RollingZScoreDetector(window=30, threshold=4.0)], history + slide)
+    cusum_flags = stream([CUSUMDetector(allowance=0.5, decision_interval=5.0)], history + slide)
+    assert not any(zscore_flags)
+    assert not any(cusum_flags[:len(history)])
+    alarms = [index - len(history) for index, fired in enumerate(cusum_flags) if fired]
+    assert alarms and alarms[0] > 0  # Needs more than one point of the slide
+
+
+@pytest.mark.parametrize("detector", [
+    IQRDetector(mode="exact", window=0),
+    IQRDetector(mode="exact", window=6),
+    RollingZScoreDetector(window=10, threshold=2.0),
+    EWMADetector(alpha=0.2, threshold=2.0),
+    CUSUMDetector(allowance=0.5, decision_interval=3.0),
+])
+def test_vectorized_history_scoring_agrees_with_streaming(detector):
+    values = np.array(SERIES + STEADY + [0.1, 0.6, 0.2])
+    magnitudes = detector.score_history(values)
+    state = detector.new_state()
+    for index, value in enumerate(values):
+        magnitude = detector.check(state, float(value))["magnitude"]
+        if magnitude is None:
+            assert np.isnan(magnitudes[index])
+        else:
+            assert magnitudes[index] == pytest.approx(magnitude, rel=1e-9, abs=1e-9)
+        detector.update(state, float(value))
+
+
+def test_state_copy_is_independent():
+    run = engine(IQRDetector(mode="exact", window=0), RollingZScoreDetector(window=10), EWMADetector(), CUSUMDetector())
+    state = run.new_state()
+    for value in STEADY:
+        state.add(value)
+    before = run.check(state, 0.3)
+    clone = state.copy()
+    for _ in range(10):
+        clone.add(0.0)
+    assert clone.count == state.count + 10
+    assert run.check(state, 0.3) == before
+    assert run.check(clone, 0.3) != before
+
+
+def seed(collection, values, flagged=()):
+    start = datetime.datetime(2025, 3, 1, 9, 0)
+    collection.insert_many([
+        {"user_id": "default", "timestamp": start + datetime.timedelta(days=index), "user_text": f"day {index}",
+         "sentiment_score": value, "keyword_intensity": 0.5, "anomaly_flag": index in flagged}
+        for index, value in enumerate(values)
+    ])
+
+
+def test_checkin_reports_every_configured_detector(api, mongo, monkeypatch):
+    seed(mongo, STEADY)
+    monkeypatch.setattr(main, "analyze_text", lambda text: {"sentiment": 0.05, "intensity": 0.4})
+    body = api.post("/checkin", json={"user_text": "A terrible day."}).json()
+
+    assert body["anomaly_flag"] is True and body["anomaly_detectors"]["iqr"] > 0
+    assert [detail["detector"] for detail in body["anomaly_details"]] == anomaly_engine.names
+    stored = mongo.find_one({"user_text": "A terrible day."})
+    assert stored["anomaly_detectors"] == body["anomaly_detectors"]
+
+
+def test_sustained_declines_get_their_own_message():
+    dip = main.generate_support_message(0.2, True, {"iqr": 1.2})
+    slide = main.generate_support_message(0.2, True, {"cusum": 0.4})
+    assert dip != slide and "Sustained" in slide
+
+
+def test_reflag_rewrites_only_changed_verdicts(mongo):
+    # The dip was never flagged and day 2 was flagged by mistake
+    seed(mongo, STEADY + [0.05] + STEADY[:3], flagged={2})
+    assert reflag_anomalies.reflag_anomalies(detectors="iqr", dry_run=True) == 2
+    assert mongo.count_documents({"anomaly_flag": True}) == 1
+
+    assert reflag_anomalies.reflag_anomalies(detectors="iqr") == 2
+    (flagged,) = mongo.find({"anomaly_flag": True})
+    assert flagged["user_text"] == "day 10" and flagged["anomaly_detectors"]["iqr"] > 0
+    # Rollups were rebuilt with the new anomaly counts
+    (month,) = database.get_rollup_collection().find({"granularity": "month"})
+    assert month["anomaly_count"] == 1
+    assert reflag_anomalies.reflag_anomalies(detectors="iqr") == 0
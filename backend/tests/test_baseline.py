@@ -0,0 +1,120 @@
+import random
+
+import pandas as pd
+import pytest
+
+from baseline import BaselineStore, ExactBaseline, SketchBaseline, new_baseline
+
+QUANTILES = (0.0, 0.1, 0.25, 0.5, 0.75, 0.9, 1.0)
+
+TIED_SERIES = [
+    [0.1] * 12,
+    [0.1, 0.1, 0.1, 0.5, 0.5, 0.9],
+    [0.3, 0.7, 0.3, 0.7, 0.3, 0.7, 0.3],
+    [0.0, 1.0, 0.5, 0.5, 0.5, 0.5, 0.25, 0.75, 0.5],
+    [round(random.Random(seed).choice([0.1, 0.2, 0.2, 0.35, 0.8]), 2) for seed in range(40)],
+]
+
+
+@pytest.mark.parametrize("scores", TIED_SERIES)
+def test_exact_quantiles_match_pandas_at_ties(scores):
+    baseline = ExactBaseline()
+    for score in scores:
+        baseline.add(score)
+    series = pd.Series(scores)
+    for q in QUANTILES:
+        # Bit-for-bit: the IQR rule must flag exactly what the pandas rule flagged
+        assert baseline.quantile(q) == series.quantile(q)
+
+
+def test_empty_baseline_has_no_quantiles():
+    assert pd.isna(ExactBaseline().quantile(0.5))
+
+
+@pytest.mark.parametrize("window", [1, 3, 8])
+def test_window_keeps_the_newest_scores(window):
+    rng = random.Random(window)
+    scores = [rng.choice([0.1, 0.4, 0.4, rng.random()]) for _ in range(50)]
+    baseline = ExactBaseline(window)
+    for index, score in enumerate(scores):
+        baseline.add(score)
+        recent = scores[max(0, index + 1 - window):index + 1]
+        assert baseline.count == len(recent)
+        assert list(baseline._sorted) == sorted(recent)
+        for q in (0.25, 0.75):
+            assert baseline.quantile(q) == pd.Series(recent).quantile(q)
+
+
+def test_window_evicts_one_of_several_equal_scores():
+    baseline = ExactBaseline(3)
+    for score in (0.5, 0.5, 0.2, 0.5, 0.9):
+        baseline.add(score)
+    assert list(baseline._sorted) == [0.2, 0.5, 0.9]
+
+
+@pytest.mark.parametrize("window", [0, 4])
+def test_exact_copy_is_independent(window):
+    original = ExactBaseline(window)
+    for score in (0.1, 0.2, 0.3, 0.4, 0.5):
+        original.add(score)
+    clone = original.copy()
+    # Scores are kept as float64 arrays, not lists of float objects
+    assert (clone._sorted.typecode, clone._arrivals.typecode) == ("d", "d")
+
+    clone.add(0.0)
+    clone.add(0.05)
+    assert original.count == (window or 5)
+    assert list(original._sorted) == ([0.2, 0.3, 0.4, 0.5] if window else [0.1, 0.2, 0.3, 0.4, 0.5])
+
+    original.add(0.9)
+    assert 0.9 not in clone._sorted
+    # The copy keeps evicting in arrival order of its own
+    clone.add(1.0)
+    expected = ([0.5, 0.0, 0.05, 1.0] if window else [0.1, 0.2, 0.3, 0.4, 0.5, 0.0, 0.05, 1.0])
+    assert list(clone._sorted) == sorted(expected)
+
+
+def test_sketch_copy_is_independent():
+    original = SketchBaseline()
+    for score in range(20):
+        original.add(score / 20)
+    before = (original.count, original.quantile(0.25), original.quantile(0.75))
+    clone = original.copy()
+    for _ in range(20):
+        clone.add(-1.0)
+    assert (original.count, original.quantile(0.25), original.quantile(0.75)) == before
+    assert clone.quantile(0.25) < before[1]
+
+
+def test_sketch_tracks_quartiles_of_a_long_stream():
+    rng = random.Random(7)
+    scores = [rng.random() for _ in range(5000)]
+    sketch = SketchBaseline()
+    for score in scores:
+        sketch.add(score)
+    series = pd.Series(scores)
+    assert sketch.count == len(scores)
+    for q in (0.25, 0.75):
+        assert sketch.quantile(q) == pytest.approx(series.quantile(q), abs=0.02)
+    with pytest.raises(ValueError):
+        sketch.quantile(0.5)
+
+
+def test_store_updates_seeded_keys_only():
+    store = BaselineStore(ExactBaseline)
+    store.seed("seeded", [0.2, 0.4, 0.6])
+    store.add("seeded", 0.8)
+    # A key that was never seeded picks its scores up from storage when first read
+    store.add("unseeded", 0.8)
+
+    assert store.get("seeded").count == 4
+    assert store.get("seeded").quantile(1.0) == 0.8
+    assert not store.is_loaded("unseeded")
+    store.reset("seeded")
+    assert not store.is_loaded("seeded")
+
+
+def test_unknown_modes_are_rejected():
+    assert isinstance(new_baseline("sketch"), SketchBaseline)
+    with pytest.raises(ValueError, match="BASELINE_MODE"):
+        new_baseline("approximate")
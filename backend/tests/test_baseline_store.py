@@ -0,0 +1,53 @@
+import multiprocessing
+
+from baseline import BaselineStore, ExactBaseline
+from versions import UserVersions
+
+
+def bump_in_child(path):
+    UserVersions(path, slots=64).bump(["alice"])
+
+
+def make_store(tmp_path):
+    versions = UserVersions(str(tmp_path / "versions.bin"), slots=64)
+    store = BaselineStore(ExactBaseline, version_of=versions.get)
+    return store, versions
+
+
+def test_seeded_baseline_stays_loaded_until_the_version_moves(tmp_path):
+    store, versions = make_store(tmp_path)
+    assert not store.is_loaded("alice")
+    store.seed("alice", [0.1, 0.2], store.version("alice"))
+    assert store.is_loaded("alice")
+
+    # A write by another process: nothing reaches this store except the counter
+    child = multiprocessing.get_context("fork").Process(target=bump_in_child, args=(versions.path,))
+    child.start()
+    child.join()
+    assert child.exitcode == 0
+    assert not store.is_loaded("alice")
+
+
+def test_own_bumps_are_acknowledged(tmp_path):
+    store, versions = make_store(tmp_path)
+    store.seed("alice", [0.1, 0.2], store.version("alice"))
+    store.add("alice", 0.3)
+    store.acknowledge(versions.bump(["alice"]))
+    assert store.is_loaded("alice")
+    assert store.get("alice").count == 3
+
+
+def test_own_bump_after_a_foreign_write_leaves_the_baseline_stale(tmp_path):
+    store, versions = make_store(tmp_path)
+    store.seed("alice", [0.1], store.version("alice"))
+    versions.bump(["alice"])  # Someone else's write, not acknowledged
+    store.acknowledge(versions.bump(["alice"]))
+    assert not store.is_loaded("alice")
+
+
+def test_without_versions_a_seed_is_kept_for_good():
+    store = BaselineStore(ExactBaseline)
+    store.seed("alice", [0.1])
+    assert store.is_loaded("alice")
+    store.reset("alice")
+    assert not store.is_loaded("alice")
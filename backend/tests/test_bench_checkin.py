@@ -0,0 +1,76 @@
+import asyncio
+import importlib.util
+import json
+import os
+
+import pytest
+
+from conftest import BACKEND_DIR
+
+spec = importlib.util.spec_from_file_location("bench_checkin", os.path.join(BACKEND_DIR, "benchmarks", "bench_checkin.py"))
+bench_checkin = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(bench_checkin)
+
+
+def row(storage="mongo", endpoint="checkin", history=10, p95_ms=20.0, throughput_rps=300.0, peak_rss_mb=60.0):
+    return {"storage": storage, "endpoint": endpoint, "history": history, "p95_ms": p95_ms,
+            "throughput_rps": throughput_rps, "peak_rss_mb": peak_rss_mb}
+
+
+def test_percentile_picks_the_rank_without_interpolating():
+    values = list(range(1, 101))
+    assert [bench_checkin.percentile(values, p) for p in (0.5, 0.95, 0.99)] == [51, 96, 100]
+    assert bench_checkin.percentile([], 0.5) == 0.0
+
+
+def test_stub_pipeline_is_deterministic():
+    stub = bench_checkin.StubPipeline(latency_ms=0)
+    first = stub(["a calm day", "a long day"])
+    assert first == stub(["a calm day", "a long day"])
+    assert stub("a calm day") == first[:1]
+    assert all(result["label"] in ("negative", "neutral", "positive") and 0.5 <= result["score"] < 1 for result in first)
+
+
+def test_compare_flags_regressions_beyond_the_tolerance(tmp_path, capsys):
+    baseline = tmp_path / "baseline.json"
+    # Baselines saved before --storage existed hold MongoDB runs without a storage key
+    legacy = {key: value for key, value in row().items() if key != "storage"}
+    baseline.write_text(json.dumps({"results": [legacy, row(endpoint="timeline", p95_ms=2.0)]}), encoding="utf-8")
+    rows = [
+        row(p95_ms=30.0, throughput_rps=200.0, peak_rss_mb=61.0),
+        row(storage="sqlite", p95_ms=90.0),
+        # Over the relative tolerance but within the noise floor
+        row(endpoint="timeline", p95_ms=4.0),
+        row(endpoint="timeline_page"),
+    ]
+    regressions = bench_checkin.compare_to_baseline(rows, str(baseline), tolerance=0.2, min_delta_ms=5.0)
+    assert len(regressions) == 2
+    assert regressions[0] == "mongo checkin history=10: p95 20.0ms -> 30.0ms"
+    assert "throughput" in regressions[1]
+    # Scenarios the baseline lacks are listed, not counted
+    assert "Not in baseline, skipped: mongo timeline_page history=10" in capsys.readouterr().out
+
+
+def test_checked_in_baseline_covers_both_storage_backends():
+    with open(os.path.join(BACKEND_DIR, "benchmarks", "baselines", "mongomock-stub.json"), encoding="utf-8") as handle:
+        rows = json.load(handle)["results"]
+    scenarios = {(row["storage"], row["endpoint"], row["history"]) for row in rows}
+    assert len(scenarios) == len(rows)
+    assert {storage for storage, _, _ in scenarios} == {"mongo", "sqlite"}
+
+
+def test_a_scenario_runs_in_process(mongo, monkeypatch):
+    pytest.importorskip("httpx")
+    import database_async
+    import nlp_model
+
+    # drive() patches these module globals; monkeypatch puts them back afterwards
+    for module, name in ((database_async, "AsyncIOMotorClient"), (nlp_model, "sentiment_pipeline"),
+                         (nlp_model, "global_labels"), (nlp_model, "model_status")):
+        monkeypatch.setattr(module, name, getattr(module, name))
+    options = {"requests": 6, "concurrency": 3, "model": "stub", "model_latency_ms": 1.0, "mongo_uri": None}
+
+    result = asyncio.run(bench_checkin.drive("mongo", "checkin", 20, options))
+    assert (result["storage"], result["endpoint"], result["history"], result["requests"], result["errors"]) == ("mongo", "checkin", 20, 6, 0)
+    assert 0 < result["p50_ms"] <= result["p95_ms"] <= result["p99_ms"]
+    assert result["throughput_rps"] > 0 and result["peak_rss_mb"] > 0
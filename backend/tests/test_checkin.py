@@ -0,0 +1,101 @@
+import asyncio
+import datetime
+import threading
+import time
+
+import pytest
+
+import database
+import main
+
+
+@pytest.fixture
+def scores(monkeypatch):
+    """Stubs inference: each check-in text is scored with the next value of the returned list."""
+    queued = []
+
+    def analyze_text(text):
+        return {"sentiment": queued.pop(0), "intensity": 0.4}
+
+    monkeypatch.setattr(main, "analyze_text", analyze_text)
+    return queued
+
+
+def seed_history(collection, values):
+    start = datetime.datetime(2025, 3, 1, 9, 0)
+    collection.insert_many([
+        {"user_id": "default", "timestamp": start + datetime.timedelta(days=index), "user_text": f"day {index}",
+         "sentiment_score": value, "keyword_intensity": 0.5, "anomaly_flag": False}
+        for index, value in enumerate(values)
+    ])
+
+
+def test_checkin_is_stored_through_the_async_layer(api, mongo, scores):
+    scores.append(0.72)
+    response = api.post("/checkin", json={"user_text": "A calm, productive day."})
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["sentiment_score"], body["anomaly_flag"], body["user_text"]) == (0.72, False, "A calm, productive day.")
+    assert body["support_message"]
+
+    stored = mongo.find_one({"_id": database.ObjectId(body["id"])})
+    assert stored["user_text"] == "A calm, productive day."
+    assert (stored["sentiment_score"], stored["keyword_intensity"], stored["anomaly_flag"]) == (0.72, 0.4, False)
+    # Both layers build the same document
+    assert set(stored) == set(database.build_checkin_entry("", 0.0, 0.0, keyword_terms=[])) | {"_id"}
+
+
+def test_sharp_drop_against_stored_history_is_flagged(api, mongo, scores):
+    seed_history(mongo, [0.7, 0.75, 0.8, 0.8, 0.85, 0.9])
+    scores.extend([0.1, 0.78])
+    drop = api.post("/checkin", json={"user_text": "Everything fell apart."}).json()
+    usual = api.post("/checkin", json={"user_text": "Back to normal."}).json()
+    assert drop["anomaly_flag"] is True
+    assert usual["anomaly_flag"] is False
+
+    # The baseline was seeded once and then followed both inserts
+    from anomaly import baseline_store
+    assert baseline_store.get(database.DEFAULT_USER_ID).count == 8
+
+
+def test_failed_inference_is_a_500(api, mongo, monkeypatch):
+    def broken(text):
+        raise RuntimeError("model crashed")
+
+    monkeypatch.setattr(main, "analyze_text", broken)
+    response = api.post("/checkin", json={"user_text": "Hello"})
+    assert response.status_code == 500
+    assert "model crashed" in response.json()["detail"]
+    assert mongo.count_documents({}) == 0
+
+
+def test_concurrent_checkins_share_the_event_loop(mongo, monkeypatch):
+    httpx = pytest.importorskip("httpx")
+
+    running, peak, lock = [0], [0], threading.Lock()
+
+    def slow_analysis(text):
+        # Blocks its executor thread, never the event loop
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+        return {"sentiment": 0.6, "intensity": 0.3}
+
+    monkeypatch.setattr(main, "analyze_text", slow_analysis)
+
+    async def run():
+        async with main.lifespan(main.app):
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                responses = await asyncio.gather(*[
+                    client.post("/checkin", json={"user_text": f"entry {index}"}) for index in range(8)
+                ])
+        return responses
+
+    responses = asyncio.run(run())
+    assert [response.status_code for response in responses] == [200] * 8
+    assert mongo.count_documents({}) == 8
+    assert peak[0] > 1
@@ -0,0 +1,110 @@
+import datetime
+import io
+import os
+import subprocess
+import sys
+
+import pytest
+from bson import ObjectId
+
+import export_checkins
+from conftest import BACKEND_DIR
+
+pa = pytest.importorskip("pyarrow")
+pq = pytest.importorskip("pyarrow.parquet")
+
+START = datetime.datetime(2025, 3, 1, 9, 0)
+
+
+def seed(collection):
+    entries = [
+        {"user_id": user_id, "timestamp": START + datetime.timedelta(hours=index), "user_text": f"{user_id} {index}",
+         "sentiment_score": index / 8, "keyword_intensity": 0.5, "anomaly_flag": index == 2, "model_version": "v1"}
+        for user_id in ("bob", "alice") for index in range(5)
+    ]
+    collection.insert_many(entries)
+    return entries
+
+
+def test_parquet_export_has_typed_columns_in_index_order(api, mongo):
+    seed(mongo)
+    response = api.get("/export")
+    assert response.status_code == 200
+    assert response.headers["content-disposition"] == 'attachment; filename="checkins-all.parquet"'
+
+    table = pq.read_table(io.BytesIO(response.content))
+    assert table.schema == export_checkins.export_schema()
+    assert table.column("user_id").to_pylist() == ["alice"] * 5 + ["bob"] * 5
+    epoch_ms = int((START - datetime.datetime(1970, 1, 1)).total_seconds() * 1000)
+    assert table.column("timestamp").to_pylist()[:2] == [epoch_ms, epoch_ms + 3_600_000]
+    assert table.column("sentiment_score").to_pylist()[:3] == [0.0, 0.125, 0.25]
+    assert "user_text" not in table.schema.names
+
+
+def test_arrow_export_filters_by_user_and_time(api, mongo):
+    seed(mongo)
+    params = {"format": "arrow", "user_id": "bob", "include_text": "true",
+              "start": (START + datetime.timedelta(hours=1)).isoformat(),
+              "end": (START + datetime.timedelta(hours=3)).isoformat()}
+    response = api.get("/export", params=params)
+    assert response.status_code == 200
+    table = pa.ipc.open_stream(response.content).read_all()
+    assert table.column("user_text").to_pylist() == ["bob 1", "bob 2"]
+    assert table.column("anomaly_flag").to_pylist() == [False, True]
+
+
+def test_cli_export_writes_one_row_group_per_chunk(mongo, tmp_path):
+    seed(mongo)
+    path = str(tmp_path / "checkins.parquet")
+    summary = export_checkins.export_checkins(path, chunk_rows=4)
+    assert (summary["rows"], summary["format"]) == (10, "parquet")
+    assert pq.ParquetFile(path).num_row_groups == 3
+    with pytest.raises(ValueError, match="guess the format"):
+        export_checkins.export_checkins(str(tmp_path / "checkins.csv"))
+
+
+def test_export_without_pyarrow_is_a_501(api, mongo, monkeypatch):
+    monkeypatch.setattr(export_checkins, "pa", None)
+    assert api.get("/export").status_code == 501
+
+
+def test_chunk_batches_match_batches_built_from_documents():
+    documents = [
+        {"user_id": "alice",
+         "timestamp": START, "sentiment_score": 0.5, "keyword_intensity": 0.25, "keyword_terms": ["tired", "alone"],
+         "anomaly_flag": True, "model_version": "v1", "user_text": "first"},
+        # A pending deferred check-in, and an entry from before keyword terms existed
+        {"user_id": "alice", "timestamp": START + datetime.timedelta(hours=1), "sentiment_score": None,
+         "keyword_intensity": None, "keyword_terms": [], "user_text": "second"},
+        {"user_id": "bob", "timestamp": START + datetime.timedelta(hours=2), "sentiment_score": 0.75,
+         "keyword_intensity": 0.0, "anomaly_flag": False, "model_version": "v1", "user_text": "third"},
+    ]
+    for document in documents:
+        document["_id"] = ObjectId()
+
+    schema = export_checkins.export_schema(include_text=True)
+    chunk = export_checkins.ExportChunk(include_text=True)
+    for document in documents:
+        chunk.add(document)
+    expected = pa.RecordBatch.from_arrays([
+        pa.array([str(document["_id"]) for document in documents], pa.string()),
+        pa.array([document.get("user_id") for document in documents], pa.string()).dictionary_encode(),
+        pa.array([document["timestamp"] for document in documents], pa.timestamp("ms")).cast(pa.int64()),
+        pa.array([document.get("sentiment_score") for document in documents], pa.float64()).cast(pa.float32()),
+        pa.array([document.get("keyword_intensity") for document in documents], pa.float64()).cast(pa.float32()),
+        pa.array([document.get("keyword_terms") for document in documents], pa.list_(pa.string())),
+        pa.array([bool(document.get("anomaly_flag", False)) for document in documents], pa.bool_()),
+        pa.array([document.get("model_version") for document in documents], pa.string()).dictionary_encode(),
+        pa.array([document["user_text"] for document in documents], pa.string()),
+    ], schema=schema)
+    assert chunk.record_batch(schema).equals(expected)
+
+
+def test_the_app_loads_pyarrow_only_on_the_first_export():
+    code = "import sys, main; print('pyarrow' in sys.modules, main.EXPORT_FORMAT_PATTERN)"
+    imported = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, env=dict(os.environ, MODEL_LOAD_MODE="lazy"),
+                              capture_output=True, text=True)
+    assert imported.returncode == 0, imported.stderr
+    loaded, pattern = imported.stdout.splitlines()[-1].split()
+    assert loaded == "False"
+    assert set(pattern[2:-2].split("|")) == set(export_checkins.EXPORT_FORMATS)
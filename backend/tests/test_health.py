@@ -0,0 +1,28 @@
+import nlp_model
+
+
+def test_liveness_answers_before_the_model_is_loaded(api, monkeypatch):
+    monkeypatch.setattr(nlp_model, "model_status", "loading")
+    assert api.get("/health/live").status_code == 200
+
+    ready = api.get("/health/ready")
+    assert ready.status_code == 503
+    assert ready.json()["status"] == "not_ready"
+    assert ready.json()["model"]["status"] == "loading"
+
+
+def test_readiness_reports_a_loaded_model(api, monkeypatch):
+    monkeypatch.setattr(nlp_model, "model_status", "ready")
+    monkeypatch.setattr(nlp_model, "startup_timings", {"weights": 1.5, "total": 2.0})
+    ready = api.get("/health/ready")
+    assert ready.status_code == 200
+    model = ready.json()["model"]
+    assert (model["ready"], model["startup_timings"]["total"]) == (True, 2.0)
+
+
+def test_failed_load_is_not_ready(api, monkeypatch):
+    monkeypatch.setattr(nlp_model, "model_status", "failed")
+    monkeypatch.setattr(nlp_model, "model_error", "weights not found")
+    ready = api.get("/health/ready")
+    assert ready.status_code == 503
+    assert ready.json()["model"]["error"] == "weights not found"
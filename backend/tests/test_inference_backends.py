@@ -0,0 +1,127 @@
+import sys
+import types
+
+import pytest
+
+import inference_backends
+import nlp_model
+from inference_backends import load_weights, pipeline_device, validate_backend
+
+
+class FakeModel:
+    def __init__(self, name, **kwargs):
+        self.name, self.kwargs, self.evaluated = name, kwargs, False
+
+    def eval(self):
+        self.evaluated = True
+
+
+@pytest.fixture
+def fake_torch(monkeypatch):
+    """torch and transformers stand-ins recording thread caps and quantization calls."""
+    calls = {"threads": [], "quantized": []}
+
+    def quantize_dynamic(model, layers, dtype):
+        calls["quantized"].append((model, layers, dtype))
+        return types.SimpleNamespace(quantized=model)
+
+    torch = types.ModuleType("torch")
+    torch.nn = types.SimpleNamespace(Linear="Linear")
+    torch.qint8 = "qint8"
+    torch.cuda = types.SimpleNamespace(is_available=lambda: True)
+    torch.set_num_threads = calls["threads"].append
+    torch.ao = types.SimpleNamespace(quantization=types.SimpleNamespace(quantize_dynamic=quantize_dynamic))
+    transformers = types.ModuleType("transformers")
+    transformers.AutoModelForSequenceClassification = types.SimpleNamespace(from_pretrained=FakeModel)
+    monkeypatch.setitem(sys.modules, "torch", torch)
+    monkeypatch.setitem(sys.modules, "transformers", transformers)
+    return calls
+
+
+@pytest.fixture
+def fake_optimum(monkeypatch):
+    """onnxruntime and optimum stand-ins: from_pretrained records its arguments, save_pretrained creates the export dir."""
+    loads = []
+
+    class ORTModel(FakeModel):
+        @classmethod
+        def from_pretrained(cls, name, **kwargs):
+            loads.append((name, kwargs.get("export", False)))
+            return cls(name, **kwargs)
+
+        def save_pretrained(self, path):
+            import os
+            os.makedirs(path)
+
+    onnxruntime = types.ModuleType("onnxruntime")
+    onnxruntime.SessionOptions = types.SimpleNamespace
+    optimum_ort = types.ModuleType("optimum.onnxruntime")
+    optimum_ort.ORTModelForSequenceClassification = ORTModel
+    monkeypatch.setitem(sys.modules, "onnxruntime", onnxruntime)
+    monkeypatch.setitem(sys.modules, "optimum", types.ModuleType("optimum"))
+    monkeypatch.setitem(sys.modules, "optimum.onnxruntime", optimum_ort)
+    return loads
+
+
+def test_unknown_backends_are_rejected():
+    assert validate_backend("torch-int8") == "torch-int8"
+    with pytest.raises(ValueError, match="INFERENCE_BACKEND 'tensorrt'"):
+        validate_backend("tensorrt")
+
+
+def test_fp32_loads_plain_weights_on_the_gpu(fake_torch):
+    model = load_weights("some/model", "torch", threads=0)
+    assert isinstance(model, FakeModel) and model.evaluated
+    assert fake_torch == {"threads": [], "quantized": []}
+    assert pipeline_device("torch") == 0
+
+
+def test_int8_quantizes_linear_layers_on_the_cpu(fake_torch):
+    model = load_weights("some/model", "torch-int8", threads=2)
+    (original, layers, dtype), = fake_torch["quantized"]
+    assert model.quantized is original and original.evaluated
+    assert (layers, dtype) == ({"Linear"}, "qint8")
+    assert fake_torch["threads"] == [2]
+    assert pipeline_device("torch-int8") == -1
+
+
+def test_onnx_is_exported_once_and_then_reused(tmp_path, monkeypatch, fake_optimum):
+    monkeypatch.setattr(inference_backends, "ONNX_EXPORT_DIR", str(tmp_path))
+    first = load_weights("org/model", "onnx", threads=3)
+    second = load_weights("org/model", "onnx", threads=3)
+
+    export_path = str(tmp_path / "org__model")
+    assert fake_optimum == [("org/model", True), (export_path, False)]
+    options = second.kwargs["session_options"]
+    assert (options.intra_op_num_threads, options.inter_op_num_threads) == (3, 1)
+    assert first.name == "org/model"
+
+
+def test_onnx_without_optimum_names_the_missing_package(monkeypatch):
+    monkeypatch.setitem(sys.modules, "onnxruntime", None)
+    with pytest.raises(ImportError, match="optimum"):
+        load_weights("org/model", "onnx")
+
+
+def test_cache_keys_are_specific_to_the_backend():
+    assert nlp_model.MODEL_ID == f"{nlp_model.MODEL_NAME}:{inference_backends.INFERENCE_BACKEND}"
+
+
+def test_parity_report_measures_drift_and_label_agreement(monkeypatch):
+    outputs = {
+        "torch": [{"label": "positive", "score": 0.9}, {"label": "negative", "score": 0.8}],
+        "torch-int8": [{"label": "positive", "score": 0.8}, {"label": "neutral", "score": 0.5}],
+    }
+
+    def build(backend, timings=None):
+        return lambda texts, **kwargs: outputs[backend] if isinstance(texts, list) else None
+
+    monkeypatch.setattr(nlp_model, "_build_pipeline", build)
+    report = nlp_model.check_backend_parity("torch-int8", ["good", "bad"])
+    drifts = [abs(nlp_model.map_label_to_score(b["label"], b["score"]) - nlp_model.map_label_to_score(c["label"], c["score"]))
+              for b, c in zip(outputs["torch"], outputs["torch-int8"])]
+    assert report["max_abs_drift"] == pytest.approx(max(drifts))
+    assert report["mean_abs_drift"] == pytest.approx(sum(drifts) / 2)
+    assert 0 < min(drifts) < max(drifts)
+    assert report["label_agreement"] == 0.5
+    assert {"torch_ms_per_text", "torch-int8_ms_per_text"} <= set(report)
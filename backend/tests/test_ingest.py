@@ -0,0 +1,188 @@
+import datetime
+import json
+
+import pytest
+
+import database
+import import_checkins
+import main
+from anomaly import anomaly_engine, baseline_store
+from ingest import earliest_timestamp, parse_timestamp, prepare_checkin_batch
+
+START = datetime.datetime(2025, 3, 1, 9, 0)
+
+
+def analysis(score):
+    return {"sentiment": score, "intensity": 0.3}
+
+
+def scored_by_text(texts):
+    """Scores 'score=0.42'-style texts with their embedded value."""
+    return [analysis(float(text.rsplit("=", 1)[1])) for text in texts]
+
+
+def local(moment):
+    return moment.astimezone().replace(tzinfo=None)
+
+
+def test_parse_timestamp_accepts_iso_epoch_and_empty_values():
+    utc = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    assert parse_timestamp("2024-01-01T00:00:00Z") == local(utc)
+    assert parse_timestamp("2024-01-01T02:00:00+02:00").tzinfo is None
+    assert parse_timestamp("2024-01-01T08:30:00") == datetime.datetime(2024, 1, 1, 8, 30)
+    assert parse_timestamp(utc.timestamp()) == local(utc)
+    assert parse_timestamp(str(utc.timestamp())) == local(utc)
+    assert parse_timestamp("") is None and parse_timestamp(None) is None
+
+
+def test_aware_datetimes_become_naive_local():
+    utc = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    assert parse_timestamp(utc) == local(utc)
+    assert parse_timestamp(utc).tzinfo is None
+    naive = datetime.datetime(2024, 1, 1, 12)
+    assert parse_timestamp(naive) is naive
+
+
+def test_batch_with_mixed_timezones_is_sorted_chronologically():
+    plus_two = datetime.timezone(datetime.timedelta(hours=2))
+    records = [
+        {"user_text": "now"},
+        {"user_text": "utc string", "timestamp": "2024-01-01T00:00:00Z"},
+        {"user_text": "aware datetime", "timestamp": datetime.datetime(2023, 12, 31, 23, 0, tzinfo=plus_two)},
+        {"user_text": "naive", "timestamp": datetime.datetime(2020, 6, 1, 8, 30)},
+    ]
+    entries = prepare_checkin_batch(records, [analysis(0.5)] * len(records), None, user_id="tz-user")
+
+    assert [entry["user_text"] for entry in entries] == ["naive", "aware datetime", "utc string", "now"]
+    assert all(entry["timestamp"].tzinfo is None for entry in entries)
+    assert entries[1]["timestamp"] == local(datetime.datetime(2023, 12, 31, 21, 0, tzinfo=datetime.timezone.utc))
+
+
+def test_batch_is_flagged_in_chronological_order_against_a_copy():
+    live = anomaly_engine.new_state()
+    for score in (0.7, 0.75, 0.8, 0.85):
+        live.add(score)
+    records = [
+        {"user_text": "late drop", "timestamp": START + datetime.timedelta(days=2)},
+        {"user_text": "early", "timestamp": START},
+        {"user_text": "middle", "timestamp": START + datetime.timedelta(days=1), "import_ref": "file:7"},
+    ]
+    entries = prepare_checkin_batch(records, [analysis(0.1), analysis(0.8), analysis(0.78)], live)
+
+    assert [entry["user_text"] for entry in entries] == ["early", "middle", "late drop"]
+    assert [entry["anomaly_flag"] for entry in entries] == [False, False, True]
+    assert set(entries[2]["anomaly_detectors"]) == {"iqr"} and "anomaly_detectors" not in entries[1]
+    assert entries[1]["import_ref"] == "file:7" and "import_ref" not in entries[0]
+    # Only inserting the entries moves the live baseline
+    assert live.count == 4
+
+
+def test_batch_endpoint_stores_flags_and_follows_the_baseline(api, mongo, monkeypatch):
+    monkeypatch.setattr(main, "analyze_texts", scored_by_text)
+    mongo.insert_many([
+        {"user_id": "default", "timestamp": START + datetime.timedelta(days=index), "user_text": f"day {index}",
+         "sentiment_score": score, "keyword_intensity": 0.5, "anomaly_flag": False}
+        for index, score in enumerate((0.7, 0.75, 0.8, 0.85))
+    ])
+    entries = [
+        {"user_text": "drop score=0.1", "timestamp": (START + datetime.timedelta(days=6)).isoformat()},
+        {"user_text": "usual score=0.8", "timestamp": (START + datetime.timedelta(days=5)).isoformat()},
+        {"user_text": "today score=0.76"},
+    ]
+    response = api.post("/checkin/batch", json={"entries": entries})
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["inserted"], body["anomalies"]) == (3, 1)
+    assert [entry["user_text"] for entry in body["entries"]] == ["usual score=0.8", "drop score=0.1", "today score=0.76"]
+    assert [entry["anomaly_flag"] for entry in body["entries"]] == [False, True, False]
+    assert mongo.count_documents({"anomaly_flag": True}) == 1
+    assert baseline_store.get(database.DEFAULT_USER_ID).count == 7
+
+
+def seed_with_a_later_slump(collection):
+    """Steady days, then a slump a week later; backdated entries must only be judged against the steady part."""
+    collection.insert_many([
+        {"user_id": "default", "timestamp": START + datetime.timedelta(days=day), "user_text": f"day {day}",
+         "sentiment_score": score, "keyword_intensity": 0.5, "anomaly_flag": False}
+        for day, score in [(0, 0.7), (1, 0.75), (2, 0.8), (3, 0.85), (4, 0.8), (5, 0.75),
+                           (10, 0.1), (11, 0.15), (12, 0.2), (13, 0.1), (14, 0.15), (15, 0.2)]
+    ])
+
+
+def test_earliest_timestamp_ignores_records_stamped_now():
+    records = [{"user_text": "a"}, {"user_text": "b", "timestamp": (START + datetime.timedelta(days=2)).isoformat()},
+               {"user_text": "c", "timestamp": START.isoformat()}]
+    assert earliest_timestamp(records) == START
+    assert earliest_timestamp(records[:1]) is None
+
+
+def test_backdated_batch_is_flagged_against_the_earlier_history_only(api, mongo, monkeypatch):
+    seed_with_a_later_slump(mongo)
+    monkeypatch.setattr(main, "analyze_texts", scored_by_text)
+    cached = database.get_score_baseline()
+    entries = [{"user_text": "bad day score=0.2", "timestamp": (START + datetime.timedelta(days=7)).isoformat()}]
+
+    body = api.post("/checkin/batch", json={"entries": entries}).json()
+    assert body["entries"][0]["anomaly_flag"] is True
+    # The cached baseline still covers the whole history and follows the insert
+    assert baseline_store.get(database.DEFAULT_USER_ID) is cached and cached.count == 13
+    # Against the whole history, slump included, the same score is unremarkable
+    assert not anomaly_engine.check(cached, 0.2)["is_anomaly"]
+
+
+def test_baseline_until_reads_the_cache_when_nothing_is_later(mongo):
+    seed_with_a_later_slump(mongo)
+    assert database.get_score_baseline(until=START + datetime.timedelta(days=20)) is database.get_score_baseline()
+    assert database.get_score_baseline(until=START + datetime.timedelta(days=5)).count == 6
+
+
+@pytest.mark.parametrize("entries", [[], [{"user_text": "x"}] * (main.MAX_CHECKIN_BATCH_SIZE + 1)])
+def test_batch_size_is_bounded(api, mongo, entries):
+    assert api.post("/checkin/batch", json={"entries": entries}).status_code == 422
+
+
+def test_replayed_import_refs_are_skipped(mongo):
+    database.ensure_indexes()
+    entries = prepare_checkin_batch(
+        [{"user_text": f"entry {index}", "timestamp": START, "import_ref": f"file:{index}"} for index in range(5)],
+        [analysis(0.5)] * 5, None)
+    assert database.insert_checkin_entries([dict(entry) for entry in entries[:3]], chunk_size=2) == 3
+    assert database.insert_checkin_entries([dict(entry) for entry in entries], chunk_size=2) == 2
+    assert mongo.count_documents({}) == 5
+
+
+def test_import_resumes_from_its_checkpoint(tmp_path, mongo, monkeypatch):
+    source = tmp_path / "journal.jsonl"
+    lines = [{"entry": f"day {index} score=0.{index + 1}", "created_at": (START + datetime.timedelta(days=index)).isoformat()}
+             for index in range(5)]
+    lines.insert(2, {"entry": "  ", "created_at": START.isoformat()})
+    source.write_text("\n".join(json.dumps(line) for line in lines) + "\n", encoding="utf-8")
+
+    calls = []
+    monkeypatch.setattr(import_checkins, "load_model", lambda: True)
+    monkeypatch.setattr(import_checkins, "analyze_texts", lambda texts: calls.append(len(texts)) or scored_by_text(texts))
+
+    done = import_checkins.import_file(str(source), batch_size=2, text_field="entry", timestamp_field="created_at")
+    assert (done["records_done"], done["inserted"], done["skipped"]) == (6, 5, 1)
+    assert calls == [2, 2, 1]
+    assert sorted(mongo.distinct("import_ref")) == [f"default:journal.jsonl:{index}" for index in (0, 1, 3, 4, 5)]
+
+    # An interrupted run restarts after the last saved batch
+    checkpoint_path = str(source) + ".checkpoint"
+    import_checkins.save_checkpoint(checkpoint_path, dict(done, records_done=4))
+    resumed = import_checkins.import_file(str(source), batch_size=2, text_field="entry", timestamp_field="created_at")
+    assert calls[3:] == [2]
+    assert resumed["inserted"] == 5
+    assert mongo.count_documents({}) == 5
+
+
+def test_import_of_older_records_ignores_later_history(tmp_path, mongo, monkeypatch):
+    seed_with_a_later_slump(mongo)
+    source = tmp_path / "journal.jsonl"
+    source.write_text(json.dumps({"user_text": "bad day score=0.2", "timestamp": (START + datetime.timedelta(days=7)).isoformat()}) + "\n",
+                      encoding="utf-8")
+    monkeypatch.setattr(import_checkins, "load_model", lambda: True)
+    monkeypatch.setattr(import_checkins, "analyze_texts", scored_by_text)
+
+    assert import_checkins.import_file(str(source))["anomalies"] == 1
+    assert mongo.find_one({"user_text": "bad day score=0.2"})["anomaly_flag"] is True
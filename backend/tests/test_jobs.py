@@ -0,0 +1,170 @@
+import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import database
+import jobs
+import main
+from anomaly import baseline_store
+from jobs import JobQueue, JobRunner
+from metrics import render_metrics
+
+START = datetime.datetime(2025, 3, 1, 9, 0)
+STEADY = [0.6, 0.62, 0.58, 0.61, 0.59, 0.6]
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    """A fresh queue file, also used by enqueue_analysis/enqueue_rescore and the /jobs endpoints."""
+    fresh = JobQueue(str(tmp_path / "jobs.sqlite3"))
+    monkeypatch.setattr(jobs, "_job_queue", fresh)
+    yield fresh
+    fresh.close()
+
+
+def seed(collection, values, model_version=None):
+    collection.insert_many([
+        dict({"user_id": "default", "timestamp": START + datetime.timedelta(days=index), "user_text": f"day {index}",
+              "sentiment_score": value, "keyword_intensity": 0.5, "anomaly_flag": False},
+             **({"model_version": model_version} if model_version else {}))
+        for index, value in enumerate(values)
+    ])
+
+
+def wait_for(queue, job_id, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.get(job_id)
+        if job["status"] in ("done", "failed"):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} still {job['status']}")
+
+
+def test_jobs_are_claimed_in_order_and_deduplicated(queue):
+    first = queue.enqueue("rescore_user", {"user_id": "a"}, dedupe_key="rescore:a")
+    assert queue.enqueue("rescore_user", {"user_id": "a"}, dedupe_key="rescore:a") == first
+    second = queue.enqueue("rescore_user", {"user_id": "b"})
+
+    claimed = queue.claim()
+    assert (claimed["id"], claimed["payload"], claimed["attempts"]) == (first, {"user_id": "a"}, 1)
+    assert queue.claim()["id"] == second
+    assert queue.claim() is None
+    queue.complete(first, {"rescored": 3})
+    assert queue.get(first)["result"] == {"rescored": 3}
+    # A finished job no longer blocks its dedupe key
+    assert queue.enqueue("rescore_user", {"user_id": "a"}, dedupe_key="rescore:a") != first
+    assert queue.counts() == {"queued": 1, "running": 1, "done": 1, "failed": 0}
+
+
+def test_expired_leases_are_handed_out_again(queue):
+    job_id = queue.enqueue("analyze_checkin", {"entry_id": "x"})
+    assert queue.claim(lease_seconds=-1)["id"] == job_id
+    reclaimed = queue.claim()
+    assert (reclaimed["id"], reclaimed["attempts"]) == (job_id, 2)
+
+
+def test_failures_back_off_then_give_up(queue, monkeypatch):
+    job_id = queue.enqueue("analyze_checkin", {"entry_id": "x"})
+    assert queue.fail(job_id, "boom", queue.claim()["attempts"], max_attempts=2) == "queued"
+    # Not runnable until the backoff has passed
+    assert queue.claim() is None
+
+    monkeypatch.setattr(jobs, "JOB_RETRY_DELAY_SECONDS", 0)
+    queue.fail(job_id, "boom", 1, max_attempts=2)
+    assert queue.fail(job_id, "boom again", queue.claim()["attempts"], max_attempts=2) == "failed"
+    job = queue.get(job_id)
+    assert (job["status"], job["error"], job["attempts"]) == ("failed", "boom again", 2)
+
+
+def test_analyze_checkin_completes_a_pending_entry_once(mongo, monkeypatch):
+    seed(mongo, STEADY)
+    monkeypatch.setattr(jobs, "analyze_text", lambda text: {"sentiment": 0.05, "intensity": 0.4, "model_version": "m#1"})
+    entry_id = mongo.insert_one(database.build_pending_entry("A terrible day.")).inserted_id
+
+    result = jobs.analyze_checkin({"entry_id": str(entry_id)})
+    assert (result["sentiment"], result["anomaly_flag"], result["skipped"]) == (0.05, True, False)
+    stored = mongo.find_one({"_id": entry_id})
+    assert (stored["sentiment_score"], stored["anomaly_flag"], stored["model_version"]) == (0.05, True, "m#1")
+    assert "analysis_status" not in stored
+    assert jobs.analyze_checkin({"entry_id": str(entry_id)}) == {"skipped": True}
+
+
+def test_analyze_checkin_reuses_the_cached_baseline(mongo, monkeypatch):
+    seed(mongo, STEADY)
+    monkeypatch.setattr(jobs, "analyze_text", lambda text: {"sentiment": 0.6, "intensity": 0.4})
+    cached = database.get_score_baseline("default")
+    entry_ids = [mongo.insert_one(database.build_pending_entry(f"entry {index}")).inserted_id for index in range(2)]
+
+    for entry_id in entry_ids:
+        assert jobs.analyze_checkin({"entry_id": str(entry_id)})["skipped"] is False
+    # Neither job re-seeded the baseline; both scores were added to it
+    assert baseline_store.get("default") is cached
+    assert baseline_store.is_loaded("default") and cached.count == len(STEADY) + 2
+
+
+def test_job_gauge_does_not_create_the_queue(tmp_path, monkeypatch):
+    path = tmp_path / "jobs.sqlite3"
+    monkeypatch.setattr(jobs, "JOB_QUEUE_PATH", str(path))
+    monkeypatch.setattr(jobs, "_job_queue", None)
+    assert 'background_jobs{status="queued"} 0' in render_metrics()
+    assert not path.exists() and jobs._job_queue is None
+
+
+def test_rescore_only_touches_other_model_versions(mongo, monkeypatch):
+    seed(mongo, STEADY[:3], model_version="old")
+    seed(mongo, STEADY[3:], model_version=jobs.MODEL_VERSION)
+    monkeypatch.setattr(jobs, "load_model", lambda: True)
+    monkeypatch.setattr(jobs, "analyze_texts", lambda texts: [{"sentiment": 0.3, "intensity": 0.1} for _ in texts])
+
+    payload = {"user_id": "default", "model_version": jobs.MODEL_VERSION}
+    assert jobs.rescore_user(payload) == {"user_id": "default", "rescored": 3}
+    assert sorted(entry["sentiment_score"] for entry in mongo.find()) == sorted([0.3] * 3 + STEADY[3:])
+    assert jobs.rescore_user(payload)["rescored"] == 0
+    with pytest.raises(RuntimeError, match="model_version"):
+        jobs.rescore_user(dict(payload, model_version="other"))
+
+
+def test_rescore_replaces_confidence_with_lexicon_intensity(mongo, monkeypatch):
+    import nlp_model
+    # Before the lexicon stage, keyword_intensity held the classifier's confidence
+    seed(mongo, STEADY[:2], model_version="cardiffnlp/twitter-roberta-base-sentiment-latest#map-1")
+    mongo.update_many({}, {"$set": {"keyword_intensity": 0.97, "user_text": "I feel hopeless and can't sleep"}})
+    monkeypatch.setattr(jobs, "load_model", lambda: True)
+    monkeypatch.setattr(jobs, "analyze_texts", lambda texts: nlp_model._with_keywords(texts, [{"sentiment": 0.3} for _ in texts]))
+
+    assert jobs.MODEL_VERSION.endswith("#map-2#lex-" + nlp_model.LEXICON_VERSION)
+    assert jobs.rescore_user({"user_id": "default", "model_version": jobs.MODEL_VERSION})["rescored"] == 2
+    expected = nlp_model.lexicon_matcher.analyze_batch(["I feel hopeless and can't sleep"])[0]
+    for entry in mongo.find():
+        assert (entry["keyword_intensity"], entry["keyword_terms"]) == (expected["intensity"], ["hopeless", "can't sleep"])
+        assert entry["model_version"] == jobs.MODEL_VERSION
+
+
+def test_deferred_checkin_is_answered_202_and_analysed_by_a_runner(api, mongo, queue, monkeypatch):
+    seed(mongo, STEADY)
+    monkeypatch.setattr(jobs, "analyze_text", lambda text: {"sentiment": 0.05, "intensity": 0.4})
+    # Thread workers instead of spawned processes, so the job sees the in-memory collection
+    monkeypatch.setattr(jobs, "ProcessPoolExecutor", lambda max_workers, mp_context, initializer: ThreadPoolExecutor(max_workers))
+
+    response = api.post("/checkin", json={"user_text": "A terrible day.", "defer": True})
+    assert response.status_code == 202
+    body = response.json()
+    assert (body["analysis_status"], body["sentiment_score"]) == ("pending", None)
+    assert api.get(f"/jobs/{body['job_id']}").json()["status"] == "queued"
+
+    runner = JobRunner(queue, workers=1)
+    runner.start()
+    try:
+        job = wait_for(queue, body["job_id"])
+    finally:
+        runner.stop()
+    assert job["status"] == "done" and job["result"]["anomaly_flag"] is True
+    assert mongo.find_one({"_id": database.ObjectId(body["id"])})["anomaly_flag"] is True
+    # The runner's process drops its cached baseline; the next read re-seeds it with the new score
+    assert not baseline_store.is_loaded("default")
+    assert database.get_score_baseline("default").count == len(STEADY) + 1
+    assert api.get("/jobs").json()["jobs"]["done"] == 1
+    assert api.get("/jobs/999").status_code == 404
@@ -0,0 +1,100 @@
+import json
+import math
+import random
+import re
+
+import pytest
+
+from lexicon import DEFAULT_LEXICON, LexiconMatcher, lexicon_matcher, load_lexicon
+
+# Nested and overlapping terms, where the automaton has to follow failure links:
+# "panic attack at night" fails over to "attack at night", "at night" and "night"
+NESTED_LEXICON = {
+    "distress": {
+        "panic": 0.6, "panic attack": 0.9, "panic attack at night": 1.0, "attack": 0.3, "attack at night": 0.5,
+        "night": 0.2, "at night alone": 0.7, "alone": 0.4, "can't sleep": 0.6, "sleep": 0.1,
+    },
+    "coping": {"night walk": 0.5, "walk": 0.3, "called my sister": 0.6, "my sister": 0.2},
+}
+
+FILLERS = ["i", "had", "a", "today", "and", "then", "my", "was", "it", "at"]
+# Words that contain, or are contained in, lexicon words without being one
+NEAR_MISSES = ["panicked", "attacks", "nights", "alonely", "hopeless2", "stressful", "calmer", "cant't", "sleepy"]
+SEPARATORS = [" ", " ", " ", ", ", ". ", "! ", " - ", "\n", "  ", "; "]
+
+
+def naive_find(lexicon, text):
+    """Reference scan: one regex per term over the raw text, then leftmost longest without overlaps."""
+    matches = []
+    for category, terms in lexicon.items():
+        for term, weight in terms.items():
+            words = [re.escape(word).replace("'", "['’‘ʼ]") for word in term.split(" ")]
+            pattern = r"(?<![a-z0-9'’‘ʼ])" + r"[^a-z0-9'’‘ʼ]+".join(words) + r"(?![a-z0-9])(?!['’‘ʼ][a-z])"
+            for match in re.finditer(f"(?=({pattern}))", text, re.IGNORECASE):
+                matches.append((match.start(1), -match.end(1), term, category, weight))
+
+    found, covered_until = [], 0
+    for start, negative_end, term, category, weight in sorted(matches):
+        if start >= covered_until:
+            found.append((term, category, weight))
+            covered_until = -negative_end
+    return found
+
+
+def random_texts(lexicon, seed, count=300):
+    rng = random.Random(seed)
+    words = [word for terms in lexicon.values() for term in terms for word in term.split(" ")]
+    vocabulary = words * 3 + FILLERS + NEAR_MISSES
+    texts = []
+    for _ in range(count):
+        text = ""
+        for _ in range(rng.randint(1, 25)):
+            word = rng.choice(vocabulary)
+            word = rng.choice([word, word, word.upper(), word.capitalize()])
+            word = word.replace("'", rng.choice(["'", "’"]))
+            text += word + rng.choice(SEPARATORS)
+        texts.append(text)
+    return texts
+
+
+@pytest.mark.parametrize("lexicon", [NESTED_LEXICON, DEFAULT_LEXICON], ids=["nested", "default"])
+def test_matches_agree_with_a_naive_regex_scan(lexicon, tmp_path):
+    path = tmp_path / "lexicon.json"
+    path.write_text(json.dumps(lexicon), encoding="utf-8")
+    normalized = load_lexicon(str(path))
+    matcher = LexiconMatcher(normalized)
+    for text in random_texts(normalized, seed=len(normalized["distress"])):
+        assert matcher.find(text) == naive_find(normalized, text), text
+
+
+def test_leftmost_longest_resolves_nested_terms():
+    matcher = LexiconMatcher(NESTED_LEXICON)
+    terms = lambda text: [term for term, _, _ in matcher.find(text)]
+    assert terms("Panic attack at night, alone.") == ["panic attack at night", "alone"]
+    # The longest term at "panic" is cut short, so the scan falls back to what fits
+    assert terms("panic attack at noon") == ["panic attack"]
+    assert terms("a panic, then an attack at night alone") == ["panic", "attack at night", "alone"]
+    # Overlapping terms: the leftmost wins and the overlapped one is not counted
+    assert terms("an attack at night alone") == ["attack at night", "alone"]
+    assert terms("at night alone") == ["at night alone"]
+    assert terms("night walk") == ["night walk"]
+
+
+def test_case_apostrophes_and_word_boundaries():
+    terms = lambda text: [term for term, _, _ in lexicon_matcher.find(text)]
+    assert terms("HOPELESS and Overwhelmed") == ["hopeless", "overwhelmed"]
+    assert terms("I can’t sleep") == ["can't sleep"]
+    assert terms("I cant sleep") == ["cant sleep"]
+    # Terms only match whole words
+    assert terms("hopelessness") == ["hopelessness"]
+    assert terms("panicked, stressful, unhopeful") == []
+    assert terms("self-harm") == ["self harm"]
+    assert terms("self\nharm") == ["self harm"]
+
+
+def test_analyze_counts_repeated_terms_once():
+    matcher = LexiconMatcher(NESTED_LEXICON)
+    once = matcher.analyze("panic")
+    twice = matcher.analyze("panic. panic!")
+    assert twice == once
+    assert once["intensity"] == pytest.approx(1 - math.exp(-0.6))
@@ -0,0 +1,121 @@
+import os
+import types
+
+import pytest
+
+import main
+import profiling
+from metrics import Counter, Gauge, Histogram, MongoPoolListener, mongo_pool_checked_out, mongo_pool_connections, render_metrics
+
+
+def samples(text, name):
+    """Maps each sample line of `name` in a Prometheus exposition to its value."""
+    lines = (line.rsplit(" ", 1) for line in text.splitlines() if line.startswith(name) and not line.startswith("#"))
+    return {series: float(value) for series, value in lines}
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("demo_seconds", "Demo.", ("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, "/a")
+    rendered = "\n".join(histogram.render())
+    assert samples(rendered, "demo_seconds") == {
+        'demo_seconds_bucket{route="/a",le="0.1"}': 2,
+        'demo_seconds_bucket{route="/a",le="1.0"}': 3,
+        'demo_seconds_bucket{route="/a",le="+Inf"}': 4,
+        'demo_seconds_sum{route="/a"}': 3.65,
+        'demo_seconds_count{route="/a"}': 4,
+    }
+    assert "# TYPE demo_seconds histogram" in rendered
+
+
+def test_counters_gauges_and_label_escaping():
+    counter = Counter("demo_total", "Demo.", ("reason",))
+    counter.inc('say "hi"\n')
+    counter.inc('say "hi"\n', amount=2)
+    assert list(counter.render())[-1] == 'demo_total{reason="say \\"hi\\"\\n"} 3.0'
+
+    gauge = Gauge("demo_depth", "Demo.", callback=lambda: {(): 7})
+    assert list(gauge.render())[-1] == "demo_depth 7"
+
+
+def test_pool_listener_tracks_connections_and_checkouts():
+    listener = MongoPoolListener()
+    event = types.SimpleNamespace(address=("db.test", 27017), duration=0.002)
+    address = "db.test:27017"
+    connections, checked_out = mongo_pool_connections._values.get((address,), 0), mongo_pool_checked_out._values.get((address,), 0)
+
+    listener.connection_created(event)
+    listener.connection_checked_out(event)
+    assert (mongo_pool_connections._values[(address,)], mongo_pool_checked_out._values[(address,)]) == (connections + 1, checked_out + 1)
+    listener.connection_checked_in(event)
+    listener.connection_closed(event)
+    assert (mongo_pool_connections._values[(address,)], mongo_pool_checked_out._values[(address,)]) == (connections, checked_out)
+
+
+def test_metrics_endpoint_reports_routes_and_stages(api, mongo, monkeypatch):
+    monkeypatch.setattr(main, "analyze_text", lambda text: {"sentiment": 0.6, "intensity": 0.2})
+    assert api.post("/checkin", json={"user_text": "hello"}).status_code == 200
+    assert api.get("/timeline", params={"cursor": "bad"}).status_code == 400
+
+    response = api.get("/metrics")
+    assert response.status_code == 200 and response.headers["content-type"].startswith("text/plain")
+    text = response.text
+    assert samples(text, 'http_request_duration_seconds_count{method="POST",route="/checkin",status="200"}')
+    assert samples(text, 'http_request_duration_seconds_count{method="GET",route="/timeline",status="400"}')
+    for stage in ("inference", "baseline", "anomaly_check", "insert"):
+        assert samples(text, f'checkin_stage_duration_seconds_count{{endpoint="checkin",stage="{stage}"}}')
+    assert "inference_queue_depth 0" in text
+    assert text == text.rstrip("\n") + "\n"
+    assert render_metrics().startswith("# HELP")
+
+
+class FakeProfiler:
+    """pyinstrument.Profiler stand-in."""
+
+    def __init__(self, interval, async_mode):
+        self.running = False
+
+    def start(self):
+        self.running = True
+
+    def stop(self):
+        self.running = False
+
+    def output_text(self, unicode, color):
+        return "fake call tree"
+
+
+@pytest.fixture
+def profiler(monkeypatch):
+    monkeypatch.setattr(main, "PROFILING_TOKEN", "secret")
+    monkeypatch.setattr(profiling, "Profiler", FakeProfiler)
+    fresh = profiling.RequestProfiler()
+    monkeypatch.setattr(main, "request_profiler", fresh)
+    return fresh
+
+
+def test_profiling_needs_the_token(api, mongo, profiler):
+    assert api.get("/debug/profiling").status_code == 403
+    assert api.get("/debug/profiling", headers={"X-Profiling-Token": "wrong"}).status_code == 403
+    status = api.get("/debug/profiling", headers={"X-Profiling-Token": "secret"}).json()
+    assert status["enabled"] is False and status["worker_pid"] == os.getpid()
+
+
+def test_profiling_without_pyinstrument_is_a_501(api, mongo, profiler, monkeypatch):
+    monkeypatch.setattr(profiling, "Profiler", None)
+    response = api.post("/debug/profiling", json={"enabled": True}, headers={"X-Profiling-Token": "secret"})
+    assert response.status_code == 501
+    assert "pyinstrument" in response.json()["detail"]
+
+
+def test_header_selected_requests_are_profiled(api, mongo, profiler):
+    token = {"X-Profiling-Token": "secret"}
+    assert api.post("/debug/profiling", json={"enabled": True, "sample_rate": 0.0}, headers=token).json()["enabled"]
+    api.get("/timeline")
+    api.get("/timeline", headers={"X-Profile": "1"})
+
+    (stored,) = api.get("/debug/profiles", headers=token).json()
+    assert (stored["method"], stored["path"], stored["status"]) == ("GET", "/timeline", 200)
+    assert api.get(f"/debug/profiles/{stored['id']}", headers=token).text == "fake call tree"
+    assert api.get("/debug/profiles/999", headers=token).status_code == 404
@@ -0,0 +1,333 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import nlp_model
+from conftest import BACKEND_DIR
+from nlp_model import InferenceBatcher
+from sentiment_cache import sentiment_cache
+
+
+class WordTokenizer:
+    """One token per whitespace-separated word, with a small model window."""
+
+    model_max_length = 10
+
+    def __init__(self):
+        self.vocab, self.calls = [], 0
+
+    def num_special_tokens_to_add(self):
+        return 2
+
+    def __call__(self, text, add_special_tokens=True, **kwargs):
+        self.calls += 1
+        ids = []
+        for word in text.split():
+            if word not in self.vocab:
+                self.vocab.append(word)
+            ids.append(self.vocab.index(word))
+        return {"input_ids": ids}
+
+    def decode(self, ids):
+        return " ".join(self.vocab[index] for index in ids)
+
+
+class StubPipeline:
+    """Stands in for the transformers pipeline: labels by keyword and records each call's batch."""
+
+    def __init__(self):
+        self.calls = []
+        self.inputs = []
+        self.tokenizer = WordTokenizer()
+        self._lock = threading.Lock()
+
+    def __call__(self, texts, batch_size=1, **kwargs):
+        if isinstance(texts, str):
+            texts = [texts]
+        with self._lock:
+            self.calls.append(len(texts))
+            self.inputs.append(list(texts))
+        time.sleep(0.005)
+        return [self.predict(text) for text in texts]
+
+    @staticmethod
+    def predict(text):
+        if "good" in text:
+            return {"label": "positive", "score": 0.9}
+        if "bad" in text:
+            return {"label": "negative", "score": 0.8}
+        return {"label": "neutral", "score": 0.6}
+
+
+class StagedPipeline(StubPipeline):
+    """A StubPipeline that, like a transformers pipeline, runs each text through preprocess, _forward and postprocess."""
+
+    def __call__(self, texts, batch_size=1, **kwargs):
+        if isinstance(texts, str):
+            texts = [texts]
+        with self._lock:
+            self.calls.append(len(texts))
+        return [self.postprocess(self._forward(self.preprocess(text))) for text in texts]
+
+    def preprocess(self, text):
+        return {"input_ids": types.SimpleNamespace(shape=(1, len(text.split()))), "text": text}
+
+    def _forward(self, model_inputs):
+        return model_inputs
+
+    def postprocess(self, model_outputs):
+        return self.predict(model_outputs["text"])
+
+
+@pytest.fixture
+def stub_pipeline(monkeypatch):
+    pipeline = StubPipeline()
+    monkeypatch.setattr(nlp_model, "sentiment_pipeline", pipeline)
+    monkeypatch.setattr(nlp_model, "model_status", "ready")
+    sentiment_cache.clear()
+    yield pipeline
+    sentiment_cache.clear()
+
+
+@pytest.fixture
+def unloaded_model(monkeypatch):
+    """nlp_model as it is right after import: nothing loaded yet."""
+    for name, value in (("sentiment_pipeline", None), ("global_labels", {}), ("model_status", "not_loaded"),
+                        ("model_error", None), ("startup_timings", {})):
+        monkeypatch.setattr(nlp_model, name, value)
+    sentiment_cache.clear()
+    yield
+    sentiment_cache.clear()
+
+
+@pytest.fixture
+def fake_transformers(monkeypatch, unloaded_model):
+    """torch and transformers stand-ins that record what load_model() loads and build a StubPipeline."""
+    loaded = []
+
+    def from_pretrained(name, **kwargs):
+        loaded.append(name)
+        return types.SimpleNamespace(name=name, eval=lambda: None)
+
+    def pipeline(task, model, tokenizer, device):
+        built = StagedPipeline()
+        built.model = types.SimpleNamespace(config=types.SimpleNamespace(id2label={0: "negative", 1: "neutral", 2: "positive"}))
+        return built
+
+    torch = types.ModuleType("torch")
+    torch.cuda = types.SimpleNamespace(is_available=lambda: False)
+    transformers = types.ModuleType("transformers")
+    transformers.AutoTokenizer = types.SimpleNamespace(from_pretrained=from_pretrained)
+    transformers.AutoModelForSequenceClassification = types.SimpleNamespace(from_pretrained=from_pretrained)
+    transformers.pipeline = pipeline
+    monkeypatch.setitem(sys.modules, "torch", torch)
+    monkeypatch.setitem(sys.modules, "transformers", transformers)
+    return loaded
+
+
+def test_batcher_groups_concurrent_requests():
+    batches = []
+
+    def run_batch(texts):
+        batches.append(list(texts))
+        return [{"echo": text} for text in texts]
+
+    batcher = InferenceBatcher(run_batch, max_batch_size=4, max_wait_ms=50)
+    texts = [f"entry {index}" for index in range(10)]
+    futures = [batcher.submit(text) for text in texts]
+
+    assert [future.result(timeout=5) for future in futures] == [{"echo": text} for text in texts]
+    assert [text for batch in batches for text in batch] == texts
+    assert all(len(batch) <= 4 for batch in batches)
+    assert len(batches) == 3
+    stats = batcher.stats()
+    assert (stats["batches"], stats["requests"], stats["largest_batch"], stats["errors"]) == (3, 10, 4, 0)
+    assert stats["queue_depth"] == 0
+
+
+def test_batcher_failure_reaches_every_caller_in_the_batch():
+    failures = [RuntimeError("forward pass failed")]
+
+    def run_batch(texts):
+        if failures:
+            raise failures.pop()
+        return [{"echo": text} for text in texts]
+
+    batcher = InferenceBatcher(run_batch, max_batch_size=8, max_wait_ms=50)
+    futures = [batcher.submit(f"entry {index}") for index in range(3)]
+    for future in futures:
+        with pytest.raises(RuntimeError, match="forward pass failed"):
+            future.result(timeout=5)
+
+    # The worker thread survives a failed batch
+    assert batcher.submit("after").result(timeout=5) == {"echo": "after"}
+    assert batcher.stats()["errors"] == 3
+
+
+def test_concurrent_analyze_text_shares_forward_passes(stub_pipeline):
+    texts = [f"{('good', 'bad', 'plain')[index % 3]} day number {index}" for index in range(24)]
+    expected = nlp_model.analyze_texts(texts)
+    sentiment_cache.clear()
+    stub_pipeline.calls.clear()
+
+    with ThreadPoolExecutor(max_workers=len(texts)) as pool:
+        results = list(pool.map(nlp_model.analyze_text, texts))
+
+    assert results == expected
+    assert sum(stub_pipeline.calls) == len(texts)
+    assert len(stub_pipeline.calls) < len(texts)
+    assert max(stub_pipeline.calls) <= nlp_model.INFERENCE_MAX_BATCH_SIZE
+
+
+def test_batch_and_single_callers_never_share_the_pipeline(stub_pipeline, monkeypatch):
+    active, overlaps = [0], []
+    forward = stub_pipeline.__class__.__call__
+
+    def exclusive(self, texts, **kwargs):
+        active[0] += 1
+        overlaps.append(active[0])
+        try:
+            return forward(self, texts, **kwargs)
+        finally:
+            active[0] -= 1
+
+    monkeypatch.setattr(stub_pipeline.__class__, "__call__", exclusive)
+    batches = [[f"good batch {index} entry {entry}" for entry in range(4)] for index in range(6)]
+    singles = [f"bad single {index}" for index in range(12)]
+
+    with ThreadPoolExecutor(max_workers=len(batches) + len(singles)) as pool:
+        futures = [pool.submit(nlp_model.analyze_texts, batch) for batch in batches]
+        futures += [pool.submit(nlp_model.analyze_text, text) for text in singles]
+        for future in futures:
+            future.result()
+    assert max(overlaps) == 1
+
+
+def test_analyze_texts_maps_labels_to_scores(stub_pipeline):
+    good, bad, plain = nlp_model.analyze_texts(["a good day", "a bad day", "a day"])
+    assert good["sentiment"] == pytest.approx(0.9)
+    assert bad["sentiment"] == pytest.approx(0.2)
+    assert plain["sentiment"] == pytest.approx(0.56)
+    assert stub_pipeline.calls == [3]
+
+
+def test_repeated_and_cached_texts_skip_the_model(stub_pipeline):
+    first = nlp_model.analyze_texts(["a good day", "a  good day ", "a bad day"])
+    assert stub_pipeline.calls == [2]
+    assert first[0] == first[1]
+
+    assert nlp_model.analyze_text("a bad day") == first[2]
+    assert nlp_model.analyze_texts(["a good day", "a new day"])[0] == first[0]
+    assert stub_pipeline.calls == [2, 1]
+
+
+def test_long_entries_are_scored_as_overlapping_windows(stub_pipeline, monkeypatch):
+    monkeypatch.setattr(nlp_model, "CHUNK_OVERLAP_TOKENS", 2)
+    # 20 words; the window is 10 - 2 special tokens = 8 tokens, stepping by 6
+    long_text = " ".join(["good"] * 6 + ["plain"] * 6 + ["bad"] * 8)
+    (result,) = nlp_model.analyze_texts([long_text])
+
+    (windows,) = stub_pipeline.inputs
+    assert [len(window.split()) for window in windows] == [8, 8, 8]
+    # One positive window, two negative ones, equal weights
+    assert result["sentiment"] == pytest.approx((0.9 + 0.2 + 0.2) / 3)
+    assert nlp_model.get_inference_stats()["long_texts"]["chunked_texts"] >= 1
+
+
+def test_windows_share_a_length_sorted_batch_and_short_texts_skip_the_tokenizer(stub_pipeline, monkeypatch):
+    monkeypatch.setattr(nlp_model, "CHUNK_OVERLAP_TOKENS", 2)
+    long_text = " ".join(f"plain{index}" for index in range(12))
+    nlp_model.analyze_texts(["a good day but quite long", "bad", long_text])
+    (batch,) = stub_pipeline.inputs
+    assert len(batch) == 4
+    assert [len(text) for text in batch] == sorted(len(text) for text in batch)
+    # "bad" fits the window by byte length alone
+    assert stub_pipeline.tokenizer.calls == 2
+
+
+def test_token_budget_caps_the_windows_per_entry(stub_pipeline, monkeypatch):
+    monkeypatch.setattr(nlp_model, "CHUNK_OVERLAP_TOKENS", 2)
+    monkeypatch.setattr(nlp_model, "MAX_TOKENS_PER_TEXT", 10)
+    over_budget = nlp_model.get_inference_stats()["long_texts"]["over_budget_texts"]
+    nlp_model.analyze_texts([" ".join(f"word{index}" for index in range(40))])
+    (windows,) = stub_pipeline.inputs
+    # Sorted by length for batching: the short tail window goes first
+    assert [window.split() for window in windows] == [[f"word{index}" for index in range(6, 10)],
+                                                       [f"word{index}" for index in range(8)]]
+    assert nlp_model.get_inference_stats()["long_texts"]["over_budget_texts"] == over_budget + 1
+
+
+def test_truncate_mode_scores_one_input_per_entry(stub_pipeline, monkeypatch):
+    monkeypatch.setattr(nlp_model, "LONG_TEXT_MODE", "truncate")
+    long_text = " ".join(["good"] * 30)
+    nlp_model.analyze_texts([long_text])
+    assert stub_pipeline.inputs == [[long_text]]
+    assert stub_pipeline.tokenizer.calls == 0
+
+
+def test_importing_the_app_does_not_import_torch():
+    code = "import sys, main; print(sorted(name for name in ('torch', 'transformers') if name in sys.modules))"
+    imported = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, env=dict(os.environ, MODEL_LOAD_MODE="lazy"),
+                              capture_output=True, text=True)
+    assert imported.returncode == 0, imported.stderr
+    assert imported.stdout.splitlines()[-1] == "[]"
+
+
+def test_concurrent_callers_load_the_model_once(fake_transformers):
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        assert all(pool.map(lambda _: nlp_model.load_model(), range(8)))
+    assert fake_transformers == [nlp_model.MODEL_NAME, nlp_model.MODEL_NAME]
+    status = nlp_model.get_model_status()
+    assert status["ready"] and status["status"] == "ready"
+    assert {"imports", "tokenizer", "weights", "pipeline", "warmup", "total"} <= set(status["startup_timings"])
+    assert nlp_model.analyze_text("a good day")["sentiment"] == pytest.approx(0.9)
+
+    # The loaded pipeline is instrumented stage by stage
+    from metrics import inference_batch_size, model_stage_seconds
+    assert {("tokenize",), ("forward",), ("postprocess",)} <= set(model_stage_seconds._series)
+    assert inference_batch_size._series[()][2] > 0
+
+
+def test_failed_load_falls_back_to_neutral_scores(monkeypatch, unloaded_model):
+    # Importing torch and transformers fails, as on a host without them
+    monkeypatch.setitem(sys.modules, "torch", None)
+    monkeypatch.setitem(sys.modules, "transformers", None)
+    assert nlp_model.load_model() is False
+    status = nlp_model.get_model_status()
+    assert (status["status"], status["ready"]) == ("failed", False)
+    assert "transformers" in status["error"]
+    assert nlp_model.analyze_text("a good day")["sentiment"] == 0.5
+    assert [result["sentiment"] for result in nlp_model.analyze_texts(["a", "b"])] == [0.5, 0.5]
+
+
+def test_launcher_loads_without_warming_up(fake_transformers):
+    assert nlp_model.load_model(warmup=False)
+    assert "warmup" not in nlp_model.get_model_status()["startup_timings"]
+    # Each forked worker warms up on its own
+    assert nlp_model.warm_up_model() >= 0
+    assert "warmup" in nlp_model.get_model_status()["startup_timings"]
+
+
+def import_nlp_model(**env):
+    """Imports nlp_model in a fresh interpreter, since its configuration is read at import."""
+    return subprocess.run([sys.executable, "-c", "import nlp_model; print(nlp_model.LONG_TEXT_MODE)"],
+                          cwd=BACKEND_DIR, env=dict(os.environ, **env), capture_output=True, text=True)
+
+
+@pytest.mark.parametrize("value, expected", [("chunk", "chunk"), ("Truncate", "truncate")])
+def test_long_text_mode_accepts_known_values(value, expected):
+    imported = import_nlp_model(LONG_TEXT_MODE=value)
+    assert imported.returncode == 0, imported.stderr
+    assert imported.stdout.split()[-1] == expected
+
+
+def test_long_text_mode_rejects_unknown_values():
+    imported = import_nlp_model(LONG_TEXT_MODE="chunks")
+    assert imported.returncode != 0
+    assert "ValueError: Unknown LONG_TEXT_MODE 'chunks'. Use 'chunk' or 'truncate'." in imported.stderr
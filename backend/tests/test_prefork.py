@@ -0,0 +1,77 @@
+import sys
+import types
+
+import pytest
+
+import jobs
+import nlp_model
+import prefork
+import sentiment_cache
+from sentiment_cache import SentimentCache
+
+
+@pytest.fixture
+def cores(monkeypatch):
+    monkeypatch.setattr(prefork, "available_cpus", lambda: 8)
+
+
+def test_worker_count_and_threads_split_the_cores(cores, monkeypatch):
+    assert prefork.resolve_workers("auto") == prefork.resolve_workers("AUTO") == 8
+    monkeypatch.setattr(prefork, "SERVER_AUTO_MAX_WORKERS", 4)
+    assert prefork.resolve_workers("auto") == 4
+    assert prefork.resolve_workers("3") == 3
+    assert prefork.resolve_workers(0) == 1
+    assert prefork.worker_threads(3) == 2
+    assert prefork.worker_threads(16) == 1
+    assert prefork.worker_threads(3, threads=4) == 4
+
+
+@pytest.mark.parametrize("cpu_max, expected", [("max 100000", 16), ("250000 100000", 3), ("50000 100000", 1)])
+def test_available_cpus_follow_the_cgroup_quota(monkeypatch, tmp_path, cpu_max, expected):
+    monkeypatch.setattr(prefork.os, "sched_getaffinity", lambda pid: set(range(16)), raising=False)
+    (tmp_path / "cpu.max").write_text(cpu_max + "\n")
+    monkeypatch.setattr(prefork, "CGROUP_CPU_MAX", str(tmp_path / "cpu.max"))
+    assert prefork.available_cpus() == expected
+
+
+def test_only_cpu_torch_weights_are_shared(monkeypatch):
+    assert prefork.model_shareable("onnx") is False
+    torch = types.ModuleType("torch")
+    for cuda, shareable in ((False, True), (True, False)):
+        torch.cuda = types.SimpleNamespace(is_available=lambda cuda=cuda: cuda)
+        monkeypatch.setitem(sys.modules, "torch", torch)
+        assert prefork.model_shareable("torch") is shareable
+
+
+def test_set_inference_threads_reaches_torch(monkeypatch):
+    torch = types.ModuleType("torch")
+    torch.set_num_threads = lambda threads: calls.append(threads)
+    calls = []
+    monkeypatch.setitem(sys.modules, "torch", torch)
+    monkeypatch.setattr(nlp_model, "INFERENCE_BACKEND", "torch")
+    monkeypatch.setattr(nlp_model, "INFERENCE_THREADS", 0)
+    nlp_model.set_inference_threads(3)
+    assert calls == [3] and nlp_model.INFERENCE_THREADS == 3
+
+    # ONNX Runtime fixed its threads when the session was created
+    monkeypatch.setattr(nlp_model, "INFERENCE_BACKEND", "onnx")
+    nlp_model.set_inference_threads(2)
+    assert calls == [3] and nlp_model.INFERENCE_THREADS == 2
+
+
+def test_forked_workers_reopen_the_sentiment_cache(monkeypatch, tmp_path):
+    cache = SentimentCache(4, disk_path=str(tmp_path / "cache.sqlite3"))
+    cache.put("a", {"sentiment_score": 0.4})
+    monkeypatch.setattr(sentiment_cache, "sentiment_cache", cache)
+    inherited_conn, inherited_lock = cache.disk._conn, cache._lock
+
+    sentiment_cache._reset_after_fork()
+    assert cache.disk._conn is not inherited_conn and cache._lock is not inherited_lock
+    cache.clear()
+    assert cache.get("a") == {"sentiment_score": 0.4}
+
+
+def test_forked_workers_open_their_own_job_queue(monkeypatch):
+    monkeypatch.setattr(jobs, "_job_queue", object())
+    jobs._reset_after_fork()
+    assert jobs._job_queue is None
@@ -0,0 +1,70 @@
+import datetime
+import subprocess
+import sys
+
+from conftest import BACKEND_DIR
+from response_cache import ResponseCache, etag_matches, ENTRY_OVERHEAD_BYTES
+from versions import UserVersions
+
+
+def test_versions_are_shared_between_processes(tmp_path):
+    path = str(tmp_path / "versions.bin")
+    versions = UserVersions(path, slots=64)
+    assert versions.get("alice") == 0
+    versions.bump(["alice", "alice", "bob"])
+    assert (versions.get("alice"), versions.get("bob")) == (1, 1)
+
+    code = f"from versions import UserVersions; UserVersions({path!r}, slots=64).bump(['alice'])"
+    subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, check=True)
+    assert versions.get("alice") == 2
+    reopened = UserVersions(path, slots=64)
+    assert reopened.get("alice") == 2 and reopened.table_id == versions.table_id
+    # A recreated file gets a new table id, so ETags issued before never match again
+    recreated = UserVersions(str(tmp_path / "other.bin"), slots=64)
+    recreated.get("alice")
+    assert recreated.table_id != versions.table_id
+
+
+def test_etag_comparison_is_weak():
+    assert etag_matches('"abc"', '"abc"')
+    assert etag_matches('W/"abc", "def"', '"abc"')
+    assert etag_matches("*", '"abc"')
+    assert not etag_matches(None, '"abc"')
+    assert not etag_matches('"abd"', '"abc"')
+
+
+def test_cache_is_bounded_by_bytes():
+    entry = 100 + ENTRY_OVERHEAD_BYTES
+    cache = ResponseCache(max_bytes=2 * entry, max_entry_bytes=150)
+    cache.put("a", b"a" * 100, "application/json", {})
+    cache.put("b", b"b" * 100, "application/json", {})
+    assert cache.get("a") is not None
+    cache.put("c", b"c" * 100, "application/json", {})
+    assert cache.get("b") is None
+    cache.put("big", b"x" * 151, "application/json", {})
+    assert cache.get("big") is None
+    stats = cache.stats()
+    assert (stats["entries"], stats["bytes"], stats["evictions"], stats["oversized"]) == (2, 2 * entry, 1, 1)
+
+
+def test_unchanged_timeline_is_a_304_and_writes_invalidate_it(api, mongo, monkeypatch):
+    import main
+    monkeypatch.setattr(main, "analyze_text", lambda text: {"sentiment": 0.6, "intensity": 0.2})
+    mongo.insert_one({"user_id": "etag-user", "timestamp": datetime.datetime(2025, 3, 1, 9), "user_text": "first",
+                      "sentiment_score": 0.5, "keyword_intensity": 0.5, "anomaly_flag": False})
+
+    first = api.get("/timeline", params={"user_id": "etag-user"})
+    etag = first.headers["etag"]
+    assert api.get("/timeline", params={"user_id": "etag-user"}, headers={"If-None-Match": etag}).status_code == 304
+    # Another query is another ETag
+    assert api.get("/timeline", params={"user_id": "etag-user", "limit": 1}).headers["etag"] != etag
+
+    # A cached body is served without querying MongoDB
+    mongo.delete_many({})
+    cached = api.get("/timeline", params={"user_id": "etag-user"})
+    assert (cached.json(), cached.headers["etag"]) == (first.json(), etag)
+
+    api.post("/checkin", json={"user_text": "second", "user_id": "etag-user"})
+    changed = api.get("/timeline", params={"user_id": "etag-user"}, headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["etag"] != etag
+    assert [entry["user_text"] for entry in changed.json()] == ["second"]
@@ -0,0 +1,172 @@
+import sqlite3
+
+import pytest
+
+import sentiment_cache
+from sentiment_cache import DISK_SWEEP_INTERVAL_SECONDS, DiskCacheTier, SentimentCache, make_cache_key, normalize_text
+
+
+class FakeClock:
+    """Replaces the time module in sentiment_cache, so ages and sweeps don't depend on the wall clock."""
+
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(sentiment_cache, "time", clock)
+    return clock
+
+
+def stored_keys(path):
+    with sqlite3.connect(path) as conn:
+        return sorted(key for (key,) in conn.execute("SELECT key FROM sentiment_cache"))
+
+
+def result(score):
+    return {"sentiment_score": score, "label": "neutral"}
+
+
+def test_keys_ignore_whitespace_and_unicode_form_but_not_case_or_model():
+    composed, decomposed = "caf\u00e9 again", "cafe\u0301 again"
+    assert normalize_text("  Long   day,\n\ttired ") == "Long day, tired"
+    assert make_cache_key(composed, "model-a") == make_cache_key(f" {decomposed}  ", "model-a")
+    assert make_cache_key("Tired", "model-a") != make_cache_key("tired", "model-a")
+    assert make_cache_key("tired", "model-a") != make_cache_key("tired", "model-b")
+
+
+def test_memory_tier_evicts_least_recently_used(clock):
+    cache = SentimentCache(2)
+    cache.put("a", result(0.1))
+    cache.put("b", result(0.2))
+    assert cache.get("a") == result(0.1)
+    cache.put("c", result(0.3))
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (result(0.1), result(0.3))
+    stats = cache.stats()
+    assert (stats["size"], stats["evictions"], stats["hits"], stats["misses"]) == (2, 1, 3, 1)
+
+
+def test_cached_results_are_copies(clock):
+    cache = SentimentCache(4)
+    value = result(0.5)
+    cache.put("a", value)
+    value["sentiment_score"] = 0.0
+    cache.get("a")["sentiment_score"] = 1.0
+    assert cache.get("a") == result(0.5)
+
+
+def test_results_expire_after_the_ttl(clock):
+    cache = SentimentCache(4, ttl_seconds=30)
+    cache.put("a", result(0.1))
+    clock.advance(29)
+    assert cache.get("a") == result(0.1)
+    clock.advance(2)
+    assert cache.get("a") is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_disk_tier_survives_a_restart(tmp_path, clock):
+    path = str(tmp_path / "cache.sqlite3")
+    SentimentCache(4, disk_path=path).put("a", result(0.4))
+
+    restarted = SentimentCache(4, disk_path=path)
+    assert restarted.get("a") == result(0.4)
+    # Promoted into memory: the next read does not touch sqlite
+    assert restarted.get("a") == result(0.4)
+    stats = restarted.stats()
+    assert (stats["disk_hits"], stats["hits"], stats["size"]) == (1, 1, 1)
+
+
+def test_size_zero_disables_the_cache(tmp_path):
+    cache = SentimentCache(0, disk_path=str(tmp_path / "cache.sqlite3"))
+    cache.put("a", result(0.1))
+    assert cache.get("a") is None
+    assert cache.disk is None and not cache.enabled
+
+
+def test_disk_tier_evicts_least_recently_used_rows(tmp_path, clock):
+    path = str(tmp_path / "cache.sqlite3")
+    disk = DiskCacheTier(path, max_entries=3)
+    for key in ("a", "b", "c"):
+        disk.put(key, result(0.1))
+        clock.advance(1)
+    # Reading "a" makes "b" the least recently used
+    assert disk.get("a", ttl=0) == result(0.1)
+    clock.advance(1)
+    disk.put("d", result(0.2))
+    assert stored_keys(path) == ["a", "c", "d"]
+    # Rewriting a key replaces its row instead of adding one
+    disk.put("c", result(0.3))
+    assert disk.get("c", ttl=0) == result(0.3)
+    assert (disk.rows, disk.evictions) == (3, 1)
+
+
+def test_disk_tier_deletes_expired_rows_on_write(tmp_path, clock):
+    path = str(tmp_path / "cache.sqlite3")
+    disk = DiskCacheTier(path, max_entries=100, ttl=30)
+    disk.put("old", result(0.1))
+    clock.advance(DISK_SWEEP_INTERVAL_SECONDS + 1)
+    assert disk.get("old", ttl=30) is None
+    disk.put("new", result(0.2))
+    assert stored_keys(path) == ["new"]
+    assert (disk.rows, disk.expirations) == (1, 1)
+
+    # Reopening sweeps too, so a restarted server starts from a trimmed file
+    disk.close()
+    clock.advance(31)
+    reopened = DiskCacheTier(path, max_entries=100, ttl=30)
+    assert stored_keys(path) == []
+    assert reopened.rows == 0
+
+
+def test_disk_tier_bound_covers_rows_from_other_workers(tmp_path, clock):
+    path = str(tmp_path / "cache.sqlite3")
+    disk = DiskCacheTier(path, max_entries=4)
+    other = DiskCacheTier(path, max_entries=4)
+    for index in range(4):
+        other.put(f"other-{index}", result(0.1))
+        clock.advance(1)
+    # This worker only counts its own writes until the next sweep recounts the table
+    disk.put("mine", result(0.2))
+    assert len(stored_keys(path)) == 5
+    clock.advance(DISK_SWEEP_INTERVAL_SECONDS)
+    disk.put("mine-2", result(0.3))
+    assert stored_keys(path) == ["mine", "mine-2", "other-2", "other-3"]
+    assert disk.rows == 4
+
+
+def test_disk_tier_upgrades_files_without_used_at(tmp_path, clock):
+    path = str(tmp_path / "cache.sqlite3")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE sentiment_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)")
+        conn.executemany("INSERT INTO sentiment_cache VALUES (?, '{}', ?)", [(f"k{index}", float(index)) for index in range(5)])
+    disk = DiskCacheTier(path, max_entries=3)
+    # The oldest rows go first, and the table is within bounds before the first write
+    assert stored_keys(path) == ["k2", "k3", "k4"]
+    disk.put("k5", result(0.1))
+    assert stored_keys(path) == ["k3", "k4", "k5"]
+
+
+def test_cache_falls_through_to_the_bounded_disk_tier(tmp_path, clock):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = SentimentCache(2, disk_path=path, disk_max_entries=3)
+    for index in range(5):
+        cache.put(f"text-{index}", result(index / 10))
+        clock.advance(1)
+    assert cache.get("text-0") is None
+    assert cache.get("text-2") == result(0.2)
+    stats = cache.stats()
+    assert (stats["size"], stats["disk_size"], stats["disk_evictions"]) == (2, 3, 2)
+    assert (stats["hits"], stats["disk_hits"], stats["misses"]) == (0, 1, 1)
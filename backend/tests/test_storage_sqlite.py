@@ -0,0 +1,180 @@
+import asyncio
+import datetime
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+from bson import ObjectId
+
+import storage_sqlite
+from conftest import BACKEND_DIR
+from database import build_checkin_entry
+from rollups import accumulate, rollup_documents, summarize_rollup
+from storage_sqlite import SQLiteStore
+
+START = datetime.datetime(2025, 3, 5, 9, 0)
+
+
+@pytest.fixture
+def store(monkeypatch, tmp_path):
+    """An open SQLite store in a scratch file, with the schema created."""
+    sqlite_store = SQLiteStore(str(tmp_path / "checkins.sqlite3"), read_threads=2)
+    monkeypatch.setattr(storage_sqlite, "sqlite_store", sqlite_store)
+    asyncio.run(connect())
+    yield sqlite_store
+    sqlite_store.close()
+
+
+async def connect():
+    await storage_sqlite.connect_sqlite()
+    await storage_sqlite.ensure_schema_async()
+
+
+def entries(user_id="sqlite-user", count=10):
+    return [
+        build_checkin_entry(f"entry {index}", index / count, 0.1, anomaly_flag=index == 4, user_id=user_id,
+                            timestamp=START + datetime.timedelta(hours=7 * index), keyword_terms=["tired"] if index % 3 else [])
+        for index in range(count)
+    ]
+
+
+def test_inserts_skip_existing_ids_and_keep_rollups_in_step(store):
+    batch = entries()
+
+    async def run():
+        inserted = await storage_sqlite.insert_checkin_entries_async(batch, chunk_size=3)
+        again = await storage_sqlite.insert_checkin_entries_async(batch[:4])
+        rollups = await storage_sqlite.find_rollups_async("sqlite-user", "day").to_list()
+        return inserted, again, rollups
+
+    inserted, again, rollups = asyncio.run(run())
+    assert (inserted, again) == (10, 0)
+    # Rollups merged chunk by chunk match ones built from the whole history at once
+    expected = sorted((document for document in rollup_documents(accumulate(batch)) if document["granularity"] == "day"),
+                      key=lambda document: document["bucket_start"])
+    assert [summarize_rollup(rollup) for rollup in rollups] == [summarize_rollup(document) for document in expected]
+
+
+def test_insert_lookups_do_not_grow_with_the_batch(store, monkeypatch):
+    monkeypatch.setattr(storage_sqlite, "LOOKUP_CHUNK_SIZE", 16)
+    batch = entries(user_id="bulk-user", count=40)
+    for index, entry in enumerate(batch):
+        entry["import_ref"] = f"bulk:{index}"
+    # A replayed record within the same batch is skipped too
+    batch.append(dict(batch[5], _id=ObjectId()))
+    statements = []
+
+    async def run():
+        await store.write(lambda connection: connection.set_trace_callback(statements.append))
+        inserted = await storage_sqlite.insert_checkin_entries_async(batch, chunk_size=len(batch))
+        await store.write(lambda connection: connection.set_trace_callback(None))
+        rollups = await storage_sqlite.find_rollups_async("bulk-user", "day").to_list()
+        return inserted, rollups
+
+    inserted, rollups = asyncio.run(run())
+    assert inserted == 40
+    assert sum(rollup["count"] for rollup in rollups) == 40
+    # Existing ids and import_refs: 3 chunks each; rollups: one chunk per granularity
+    assert sum(statement.startswith("SELECT") for statement in statements) == 2 * 3 + 3
+
+
+def test_timeline_pages_through_keyset_batches(store, monkeypatch):
+    monkeypatch.setattr(storage_sqlite, "TIMELINE_BATCH_SIZE", 3)
+    batch = entries() + entries(user_id="someone-else", count=3)
+    # Two entries sharing a timestamp are ordered by id
+    batch[5]["timestamp"] = batch[6]["timestamp"]
+
+    async def run():
+        await storage_sqlite.insert_checkin_entries_async(batch)
+        full = await storage_sqlite.find_timeline_entries_async("sqlite-user").to_list()
+        after = (full[3]["timestamp"], full[3]["_id"])
+        page = await storage_sqlite.find_timeline_entries_async(
+            "sqlite-user", after=after, limit=4, fields=["sentiment_score"]).to_list()
+        ranged = await storage_sqlite.find_timeline_entries_async(
+            "sqlite-user", start=START + datetime.timedelta(hours=7), end=START + datetime.timedelta(hours=21)).to_list()
+        return full, page, ranged
+
+    full, page, ranged = asyncio.run(run())
+    expected = sorted(batch[:10], key=lambda entry: (entry["timestamp"], str(entry["_id"])))
+    assert [entry["_id"] for entry in full] == [entry["_id"] for entry in expected]
+    assert full[1]["keyword_terms"] == ["tired"] and full[4]["anomaly_flag"] is True
+    assert [entry["_id"] for entry in page] == [entry["_id"] for entry in expected[4:8]]
+    assert set(page[0]) == {"_id", "timestamp", "sentiment_score"}
+    assert [entry["user_text"] for entry in ranged] == ["entry 1", "entry 2"]
+
+
+def test_baseline_reads_the_newest_scores_in_order(store):
+    async def run():
+        await storage_sqlite.insert_checkin_entries_async(entries(user_id="baseline-user"))
+        return (await storage_sqlite.load_sentiment_history_async("baseline-user", limit=3),
+                await storage_sqlite.load_sentiment_history_async("baseline-user"))
+
+    newest, everything = asyncio.run(run())
+    assert list(newest) == [0.7, 0.8, 0.9]
+    assert list(everything) == [index / 10 for index in range(10)]
+    assert everything.typecode == "d"
+
+
+
+def test_baseline_until_leaves_out_later_entries(store):
+    async def run():
+        await storage_sqlite.insert_checkin_entries_async(entries(user_id="until-user"))
+        cached = await storage_sqlite.get_score_baseline_async("until-user")
+        earlier = await storage_sqlite.get_score_baseline_async("until-user", until=START + datetime.timedelta(hours=7 * 3))
+        latest = await storage_sqlite.get_score_baseline_async("until-user", until=START + datetime.timedelta(days=30))
+        return cached, earlier, latest
+
+    cached, earlier, latest = asyncio.run(run())
+    assert (cached.count, earlier.count) == (10, 4)
+    assert latest is cached
+
+def test_aware_bounds_match_local_timestamps(store, local_timezone):
+    async def run():
+        await storage_sqlite.insert_checkin_entries_async(entries(user_id="tz-user"))
+        start, end = local_timezone(START + datetime.timedelta(hours=7)), local_timezone(START + datetime.timedelta(days=1))
+        timeline = await storage_sqlite.find_timeline_entries_async("tz-user", start, end).to_list()
+        days = await storage_sqlite.find_rollups_async("tz-user", "day", local_timezone(START.replace(hour=0)), end).to_list()
+        return timeline, days
+
+    timeline, days = asyncio.run(run())
+    assert [entry["user_text"] for entry in timeline] == ["entry 1", "entry 2", "entry 3"]
+    assert [day["bucket_start"] for day in days] == [START.replace(hour=0), START.replace(hour=0) + datetime.timedelta(days=1)]
+
+
+def test_millis_treat_naive_times_as_utc():
+    start = datetime.datetime(2025, 3, 1, 9, 0)
+    aware = datetime.datetime(2025, 3, 1, 10, 0, tzinfo=datetime.timezone(datetime.timedelta(hours=1)))
+    assert storage_sqlite.to_millis(aware) == storage_sqlite.to_millis(start)
+    assert storage_sqlite.from_millis(storage_sqlite.to_millis(start)) == start
+    assert storage_sqlite.to_millis(datetime.datetime(1970, 1, 1, 0, 0, 1)) == 1000
+
+
+def test_api_runs_on_sqlite(tmp_path):
+    script = """
+import json
+from fastapi.testclient import TestClient
+import main
+
+main.analyze_text = lambda text: {"sentiment": 0.7, "intensity": 0.1, "terms": []}
+with TestClient(main.app) as client:
+    for index in range(3):
+        assert client.post("/checkin", json={"user_text": f"day {index}", "user_id": "edge"}).status_code == 200
+    timeline = client.get("/timeline", params={"user_id": "edge", "limit": 2})
+    trends = client.get("/trends", params={"user_id": "edge"}).json()
+    summary = {
+        "page": [entry["user_text"] for entry in timeline.json()],
+        "next": "X-Next-Cursor" in timeline.headers,
+        "counts": [bucket["count"] for bucket in trends],
+        "export": client.get("/export").status_code,
+        "storage": client.get("/health/ready").json()["storage"],
+    }
+print(json.dumps(summary))
+"""
+    env = dict(os.environ, STORAGE_BACKEND="sqlite", SQLITE_PATH=str(tmp_path / "api.sqlite3"))
+    result = subprocess.run([sys.executable, "-c", script], cwd=BACKEND_DIR, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert json.loads(result.stdout.splitlines()[-1]) == {
+        "page": ["day 0", "day 1"], "next": True, "counts": [3], "export": 501, "storage": "sqlite",
+    }
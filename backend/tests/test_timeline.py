@@ -0,0 +1,86 @@
+import datetime
+import json
+
+import pytest
+
+import database
+
+START = datetime.datetime(2025, 3, 1, 9, 0)
+
+
+def seed(collection, count=7):
+    """Check-ins an hour apart, with pairs sharing a timestamp so pages must break ties on _id."""
+    entries = [
+        {"user_id": "default", "timestamp": START + datetime.timedelta(hours=index // 2), "user_text": f"entry {index}",
+         "sentiment_score": index / 10, "keyword_intensity": 0.5, "anomaly_flag": index == 3}
+        for index in range(count)
+    ]
+    collection.insert_many(entries)
+    return sorted(entries, key=lambda entry: (entry["timestamp"], entry["_id"]))
+
+
+def test_timeline_returns_every_entry_in_order(api, mongo):
+    entries = seed(mongo)
+    response = api.get("/timeline")
+    assert response.status_code == 200
+    body = response.json()
+    assert [entry["id"] for entry in body] == [str(entry["_id"]) for entry in entries]
+    assert body[3] == {
+        "id": str(entries[3]["_id"]), "timestamp": entries[3]["timestamp"].isoformat(), "sentiment_score": 0.3,
+        "keyword_intensity": 0.5, "keyword_terms": None, "anomaly_flag": True, "anomaly_detectors": {}, "user_text": "entry 3",
+        "analysis_status": "complete",
+    }
+    assert "X-Next-Cursor" not in response.headers
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 7])
+def test_cursor_pages_cover_the_timeline_once(api, mongo, limit):
+    entries = seed(mongo)
+    seen, cursor = [], None
+    while True:
+        params = {"limit": limit, **({"cursor": cursor} if cursor else {})}
+        response = api.get("/timeline", params=params)
+        assert response.status_code == 200
+        page = response.json()
+        assert 0 < len(page) <= limit
+        seen.extend(entry["id"] for entry in page)
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+    assert seen == [str(entry["_id"]) for entry in entries]
+
+
+def test_time_range_projection_and_ndjson(api, mongo):
+    entries = seed(mongo)
+    params = {
+        "start": (START + datetime.timedelta(hours=1)).isoformat(),
+        "end": (START + datetime.timedelta(hours=3)).isoformat(),
+        "fields": "sentiment_score,anomaly_flag",
+        "format": "ndjson",
+    }
+    response = api.get("/timeline", params=params)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["id"] for line in lines] == [str(entry["_id"]) for entry in entries[2:6]]
+    assert all(set(line) == {"id", "timestamp", "sentiment_score", "anomaly_flag"} for line in lines)
+
+
+def test_aware_bounds_match_local_timestamps(api, mongo, local_timezone):
+    entries = seed(mongo)
+    params = {"start": local_timezone(START + datetime.timedelta(hours=1)).isoformat(),
+              "end": local_timezone(START + datetime.timedelta(hours=3)).isoformat()}
+    response = api.get("/timeline", params=params)
+    assert response.status_code == 200
+    assert [entry["id"] for entry in response.json()] == [str(entry["_id"]) for entry in entries[2:6]]
+
+
+@pytest.mark.parametrize("params", [{"cursor": "not-a-cursor"}, {"fields": "sentiment_score,mood"}])
+def test_bad_parameters_are_rejected(api, mongo, params):
+    response = api.get("/timeline", params=params)
+    assert response.status_code == 400
+
+
+def test_cursor_round_trip():
+    entry = {"timestamp": START, "_id": database.ObjectId()}
+    assert database.decode_timeline_cursor(database.encode_timeline_cursor(entry)) == (START, entry["_id"])
@@ -0,0 +1,101 @@
+import datetime
+import statistics
+
+import pytest
+
+import backfill_rollups
+import database
+import main
+from rollups import bucket_start, histogram_quantile, ROLLUP_BINS
+
+# A Wednesday
+START = datetime.datetime(2025, 3, 5, 9, 0)
+SCORES = [0.81, 0.64, 0.72, 0.35, 0.9, 0.55, 0.47, 0.68, 0.74, 0.6, 0.05, 0.77]
+
+
+@pytest.fixture
+def history(api, mongo, monkeypatch):
+    """Two check-ins a day for six days, uploaded through /checkin/batch."""
+    def analyze_texts(texts):
+        # Low scores come with a lexicon match
+        return [{"sentiment": float(text), "intensity": 0.2, "terms": ["tired"] if float(text) < 0.5 else []} for text in texts]
+
+    monkeypatch.setattr(main, "analyze_texts", analyze_texts)
+    entries = [{"user_text": str(score), "timestamp": (START + datetime.timedelta(hours=12 * index)).isoformat()}
+               for index, score in enumerate(SCORES)]
+    response = api.post("/checkin/batch", json={"entries": entries})
+    assert response.status_code == 200
+    return response.json()
+
+
+def stored_rollups():
+    return sorted(({key: value for key, value in rollup.items() if key != "_id"} for rollup in database.get_rollup_collection().find()),
+                  key=lambda rollup: (rollup["granularity"], rollup["bucket_start"]))
+
+
+def test_bucket_starts():
+    moment = datetime.datetime(2025, 3, 5, 17, 45)
+    assert bucket_start(moment, "day") == datetime.datetime(2025, 3, 5)
+    assert bucket_start(moment, "week") == datetime.datetime(2025, 3, 3)
+    assert bucket_start(moment, "month") == datetime.datetime(2025, 3, 1)
+    with pytest.raises(ValueError, match="granularity"):
+        bucket_start(moment, "year")
+
+
+def test_histogram_quantiles_are_within_one_bin():
+    scores = [index / 97 for index in range(98)]
+    histogram = {}
+    for score in scores:
+        key = str(min(int(score * ROLLUP_BINS), ROLLUP_BINS - 1))
+        histogram[key] = histogram.get(key, 0) + 1
+    for q, exact in zip((0.25, 0.5, 0.75), statistics.quantiles(scores, n=4, method="inclusive")):
+        assert histogram_quantile(histogram, len(scores), q, 0.0, 1.0) == pytest.approx(exact, abs=1 / ROLLUP_BINS)
+    assert histogram_quantile({}, 0, 0.5, None, None) is None
+
+
+def test_daily_trends_summarize_each_day(api, history):
+    days = api.get("/trends").json()
+    assert [day["bucket_start"] for day in days] == [(START.replace(hour=0) + datetime.timedelta(days=index)).isoformat() for index in range(6)]
+    assert all(day["count"] == 2 for day in days)
+    assert days[0]["mean"] == pytest.approx((0.81 + 0.64) / 2)
+    assert (days[1]["min"], days[1]["max"]) == (0.35, 0.72)
+    assert [day["terms"] for day in days] == [{}, {"tired": 1}, {}, {"tired": 1}, {}, {"tired": 1}]
+    assert sum(day["anomaly_count"] for day in days) == sum(entry["anomaly_flag"] for entry in history["entries"])
+
+
+def test_weeks_and_bounds(api, history):
+    weeks = api.get("/trends", params={"granularity": "week"}).json()
+    # Wednesday to Sunday, then Monday
+    assert [week["count"] for week in weeks] == [10, 2]
+    first_week = sorted(SCORES[:10])
+    # Ten sparse scores: the estimate lands between the two middle ones
+    assert first_week[4] <= weeks[0]["p50"] <= first_week[5]
+    assert (weeks[0]["min"], weeks[0]["max"]) == (first_week[0], first_week[-1])
+
+    params = {"start": (START + datetime.timedelta(days=1)).replace(hour=0).isoformat(),
+              "end": (START + datetime.timedelta(days=3)).replace(hour=0).isoformat()}
+    assert [day["count"] for day in api.get("/trends", params=params).json()] == [2, 2]
+    assert api.get("/trends", params={"granularity": "year"}).status_code == 422
+
+
+def test_aware_bounds_select_local_buckets(api, history, local_timezone):
+    params = {"start": local_timezone((START + datetime.timedelta(days=1)).replace(hour=0)).isoformat(),
+              "end": local_timezone((START + datetime.timedelta(days=3)).replace(hour=0)).isoformat()}
+    assert params["start"].endswith("+00:00")
+    days = api.get("/trends", params=params).json()
+    assert [day["bucket_start"] for day in days] == [(START + datetime.timedelta(days=offset)).replace(hour=0).isoformat() for offset in (1, 2)]
+
+
+def test_backfill_rebuilds_what_the_inserts_maintained(api, history, mongo):
+    maintained = stored_rollups()
+    database.get_rollup_collection().delete_many({})
+    totals = backfill_rollups.backfill_rollups()
+    assert (totals["users"], totals["entries"], totals["rollups"]) == (1, 12, len(maintained))
+
+    rebuilt = stored_rollups()
+    for old, new in zip(maintained, rebuilt):
+        assert new["score_sum"] == pytest.approx(old.pop("score_sum"))
+        new.pop("score_sum")
+        # Incremental upserts only create the terms field once a term matched
+        old.setdefault("terms", {})
+        assert new == old
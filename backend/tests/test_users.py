@@ -0,0 +1,74 @@
+import datetime
+
+import pytest
+
+import database
+import import_checkins
+import main
+
+START = datetime.datetime(2025, 3, 1, 9, 0)
+
+
+@pytest.fixture
+def scores(monkeypatch):
+    queued = []
+    monkeypatch.setattr(main, "analyze_text", lambda text: {"sentiment": queued.pop(0), "intensity": 0.4})
+    return queued
+
+
+def seed_history(collection, user_id, values):
+    collection.insert_many([
+        {"user_id": user_id, "timestamp": START + datetime.timedelta(days=index), "user_text": f"{user_id} {index}",
+         "sentiment_score": value, "keyword_intensity": 0.5, "anomaly_flag": False}
+        for index, value in enumerate(values)
+    ])
+
+
+def test_timelines_only_return_the_users_own_entries(api, mongo, scores):
+    scores.extend([0.6, 0.7, 0.8])
+    for user_id, text in (("alice", "a1"), ("bob", "b1"), ("alice", "a2")):
+        response = api.post("/checkin", json={"user_text": text, "user_id": user_id})
+        assert response.json()["user_id"] == user_id
+
+    assert [entry["user_text"] for entry in api.get("/timeline", params={"user_id": "alice"}).json()] == ["a1", "a2"]
+    assert [entry["user_text"] for entry in api.get("/timeline", params={"user_id": "bob"}).json()] == ["b1"]
+    assert api.get("/timeline").json() == []
+
+
+def test_baselines_are_per_user(api, mongo, scores):
+    seed_history(mongo, "steady", [0.7, 0.75, 0.8, 0.8, 0.85, 0.9])
+    seed_history(mongo, "low", [0.1, 0.15, 0.2, 0.2, 0.25, 0.3])
+    scores.extend([0.2, 0.2])
+    steady = api.post("/checkin", json={"user_text": "rough day", "user_id": "steady"}).json()
+    low = api.post("/checkin", json={"user_text": "rough day", "user_id": "low"}).json()
+    # The same score is a sharp drop for one user and an ordinary day for the other
+    assert (steady["anomaly_flag"], low["anomaly_flag"]) == (True, False)
+
+
+def test_empty_user_ids_are_rejected(api, mongo):
+    assert api.post("/checkin", json={"user_text": "hi", "user_id": ""}).status_code == 422
+    assert api.get("/timeline", params={"user_id": ""}).status_code == 422
+
+
+def test_startup_assigns_legacy_entries_and_creates_the_index(mongo):
+    from fastapi.testclient import TestClient
+
+    mongo.insert_one({"timestamp": START, "user_text": "legacy", "sentiment_score": 0.5,
+                      "keyword_intensity": 0.5, "anomaly_flag": False})
+    with TestClient(main.app) as client:
+        assert [entry["user_text"] for entry in client.get("/timeline").json()] == ["legacy"]
+    assert mongo.find_one({"user_text": "legacy"})["user_id"] == database.DEFAULT_USER_ID
+    assert "user_timestamp" in mongo.index_information()
+
+
+def test_import_is_scoped_to_its_user(tmp_path, mongo, monkeypatch):
+    source = tmp_path / "journal.csv"
+    source.write_text("user_text,timestamp\nfirst,2025-03-01T09:00:00\nsecond,2025-03-02T09:00:00\n", encoding="utf-8")
+    monkeypatch.setattr(import_checkins, "load_model", lambda: True)
+    monkeypatch.setattr(import_checkins, "analyze_texts", lambda texts: [{"sentiment": 0.5, "intensity": 0.0} for _ in texts])
+
+    import_checkins.import_file(str(source), user_id="carol")
+    assert mongo.distinct("user_id") == ["carol"]
+    # The checkpoint belongs to carol's import; reusing it for another user is refused
+    with pytest.raises(ValueError, match="user 'carol'"):
+        import_checkins.import_file(str(source), user_id="dave")
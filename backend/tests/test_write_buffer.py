@@ -0,0 +1,218 @@
+import asyncio
+import datetime
+import glob
+import multiprocessing
+import os
+
+import pytest
+from bson import ObjectId
+
+from write_buffer import WriteBehindBuffer, WriteBufferFull
+
+
+class FakeCollection:
+    """Stands in for write_entries_async: an unordered insert_many that skips duplicate _ids."""
+
+    def __init__(self):
+        self.documents = {}
+        self.insert_attempts = []
+
+    async def write(self, entries):
+        self.insert_attempts.extend(entry["_id"] for entry in entries)
+        written = [entry for entry in entries if entry["_id"] not in self.documents]
+        for entry in written:
+            self.documents[entry["_id"]] = entry
+        return written
+
+
+def make_entries(count, user_id="wal-user"):
+    start = datetime.datetime(2025, 3, 1, 12, 0)
+    return [
+        {"_id": ObjectId(), "user_id": user_id, "user_text": f"entry {index}", "sentiment_score": index / 10,
+         "timestamp": start + datetime.timedelta(minutes=index)}
+        for index in range(count)
+    ]
+
+
+def wal_segments(wal_dir):
+    return glob.glob(os.path.join(wal_dir, "wal-*.jsonl"))
+
+
+def crash_after_buffering(wal_dir, entries):
+    """Child process: buffers entries (each logged to the WAL), then dies before any flush."""
+    async def run():
+        async def unreachable(batch):
+            raise AssertionError("no flush may happen before the crash")
+
+        buffer = WriteBehindBuffer(unreachable, enabled=True, max_batch=1000, flush_ms=3_600_000, wal_dir=wal_dir)
+        await buffer.start()
+        for entry in entries:
+            await buffer.add(entry)
+        os._exit(0)
+
+    asyncio.run(run())
+
+
+def test_wal_replays_each_entry_once_after_a_crash(tmp_path):
+    wal_dir = str(tmp_path / "wal")
+    entries = make_entries(6)
+    child = multiprocessing.get_context("fork").Process(target=crash_after_buffering, args=(wal_dir, entries))
+    child.start()
+    child.join()
+    assert child.exitcode == 0
+    assert len(wal_segments(wal_dir)) == 1
+
+    # The first two reached MongoDB just before the crash, but their WAL records were not released yet
+    collection = FakeCollection()
+    collection.documents = {entry["_id"]: entry for entry in entries[:2]}
+
+    async def restart():
+        buffer = WriteBehindBuffer(collection.write, enabled=True, wal_dir=wal_dir)
+        await buffer.start()
+        await buffer.stop()
+        return buffer
+
+    buffer = asyncio.run(restart())
+    assert buffer.replayed_entries == 4
+    assert sorted(collection.documents) == sorted(entry["_id"] for entry in entries)
+    for entry in entries:
+        stored = collection.documents[entry["_id"]]
+        assert (stored["user_text"], stored["sentiment_score"], stored["timestamp"]) == \
+            (entry["user_text"], entry["sentiment_score"], entry["timestamp"])
+    assert wal_segments(wal_dir) == []
+
+    # A second restart finds nothing left to replay
+    assert asyncio.run(restart()).replayed_entries == 0
+    assert len(collection.documents) == len(entries)
+
+
+def test_stop_flushes_buffered_entries_and_removes_the_wal(tmp_path):
+    wal_dir = str(tmp_path / "wal")
+    collection = FakeCollection()
+
+    async def run():
+        buffer = WriteBehindBuffer(collection.write, enabled=True, max_batch=1000, flush_ms=3_600_000, wal_dir=wal_dir)
+        await buffer.start()
+        for entry in make_entries(5):
+            await buffer.add(entry)
+        assert collection.documents == {}
+        assert len(buffer.buffered("wal-user")) == 5
+        await buffer.stop()
+        return buffer
+
+    buffer = asyncio.run(run())
+    assert len(collection.documents) == 5
+    assert len(collection.insert_attempts) == 5
+    assert buffer.stats()["pending"] == 0
+    assert wal_segments(wal_dir) == []
+
+
+def test_failed_flush_keeps_entries_for_the_next_one():
+    collection = FakeCollection()
+    failures = [RuntimeError("MongoDB unavailable")]
+
+    async def flaky(entries):
+        if failures:
+            raise failures.pop()
+        return await collection.write(entries)
+
+    async def run():
+        buffer = WriteBehindBuffer(flaky, enabled=True, max_batch=1000, flush_ms=3_600_000)
+        await buffer.start()
+        for entry in make_entries(3):
+            await buffer.add(entry)
+        assert await buffer.flush() == 0
+        assert len(buffer.buffered("wal-user")) == 3
+        await buffer.stop()
+        return buffer
+
+    buffer = asyncio.run(run())
+    assert buffer.flush_errors == 1
+    assert len(collection.documents) == 3
+
+
+def test_full_buffer_refuses_entries_while_flushes_fail():
+    collection = FakeCollection()
+    available = [False]
+
+    async def outage(entries):
+        if not available[0]:
+            raise RuntimeError("MongoDB unavailable")
+        return await collection.write(entries)
+
+    async def run():
+        buffer = WriteBehindBuffer(outage, enabled=True, max_batch=2, flush_ms=3_600_000, max_pending=4)
+        # Not started: reaching max_batch has no flusher to wake and must not fail
+        for entry in make_entries(4):
+            await buffer.add(entry)
+        with pytest.raises(WriteBufferFull) as refused:
+            await buffer.add(make_entries(1)[0])
+        assert refused.value.retry_after >= 1
+        assert buffer.stats()["pending"] == 4
+
+        # Once storage is back, the waiting flush drains the buffer and the entry is taken
+        available[0] = True
+        await buffer.add(make_entries(1)[0])
+        assert buffer.stats()["pending"] == 1
+        return buffer
+
+    buffer = asyncio.run(run())
+    assert buffer.flush_errors == 1
+    assert len(collection.documents) == 4
+
+
+@pytest.fixture
+def write_behind_app(monkeypatch):
+    """The API on mongomock with the write-behind buffer on and no timed flushes."""
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    import database_async
+    import main
+
+    client = mongomock_motor.AsyncMongoMockClient()
+    monkeypatch.setattr(database_async, "AsyncIOMotorClient", lambda *args, **kwargs: client)
+    monkeypatch.setattr(main.write_buffer, "enabled", True)
+    monkeypatch.setattr(main.write_buffer, "flush_interval", 3600.0)
+    return main
+
+
+def test_timeline_merges_buffered_entries_without_duplicates(write_behind_app):
+    httpx = pytest.importorskip("httpx")
+    import database_async
+    import storage
+    from database import build_checkin_entry
+
+    main = write_behind_app
+    user_id = "timeline-wb-user"
+    now = datetime.datetime.now()
+
+    async def run():
+        async with main.lifespan(main.app):
+            collection = database_async.get_async_collection()
+            stored = [
+                build_checkin_entry(f"stored {index}", 0.5, 0.0, timestamp=now - datetime.timedelta(hours=2 - index), user_id=user_id)
+                for index in range(2)
+            ]
+            await storage.insert_checkin_entries_async(stored)
+            buffered_ids = [
+                await storage.insert_checkin_entry_async(f"buffered {index}", 0.4, 0.0, user_id=user_id)
+                for index in range(3)
+            ]
+            assert await collection.count_documents({"user_id": user_id}) == 2
+
+            # A flush landing while a request runs: the entry is in MongoDB and still buffered
+            in_flight = main.write_buffer.buffered(user_id)[0]
+            await collection.insert_one(dict(in_flight))
+
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                full = (await client.get("/timeline", params={"user_id": user_id})).json()
+                page = (await client.get("/timeline", params={"user_id": user_id, "limit": 4})).json()
+
+        # Shutdown flushed the buffer; the entry that was already written is not inserted twice
+        assert await collection.count_documents({"user_id": user_id}) == 5
+        return stored, buffered_ids, full, page
+
+    stored, buffered_ids, full, page = asyncio.run(run())
+    expected = [str(entry["_id"]) for entry in stored] + [str(entry_id) for entry_id in buffered_ids]
+    assert [entry["id"] for entry in full] == expected
+    assert [entry["id"] for entry in page] == expected[:4]
@@ -0,0 +1,118 @@
+# versions.py
+"""
+Per-user data version counters, used to build ETags for /timeline and /trends.
+
+Every write that changes what a user's timeline or trends return bumps the
+user's counter once the write is visible. Readers compare counters instead of
+querying MongoDB, so an unchanged timeline can be answered with 304.
+
+Counters live in a small memory-mapped file, so the pre-forked API workers, job
+worker processes and the maintenance scripts all see each other's bumps. Users
+are hashed into USER_VERSION_SLOTS slots; two users sharing a slot only means one
+user's write also invalidates the other's cached responses.
+"""
+
+import fcntl
+import mmap
+import os
+import struct
+import threading
+import zlib
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# --- Configuration ---
+USER_VERSION_PATH = os.environ.get("USER_VERSION_PATH", "user_versions.bin")
+USER_VERSION_SLOTS = int(os.environ.get("USER_VERSION_SLOTS", "65536"))
+# ---------------------
+
+# Header: 8-byte random table id (changes if the file is recreated, so old ETags never match), 8 bytes reserved
+HEADER_BYTES = 16
+SLOT = struct.Struct("<Q")
+
+
+class UserVersions:
+    """Fixed-size table of 64-bit counters in a shared file, bumped under per-slot record locks."""
+
+    def __init__(self, path: str = USER_VERSION_PATH, slots: int = USER_VERSION_SLOTS):
+        self.path = path
+        self.slots = max(1, slots)
+        self._fd = None
+        self._map = None
+        self.table_id = 0
+        # fcntl record locks only exclude other processes; threads of this one take this lock
+        self._lock = threading.Lock()
+
+    def _open(self):
+        if self._map is not None:
+            return
+        with self._lock:
+            if self._map is not None:
+                return
+            size = HEADER_BYTES + self.slots * SLOT.size
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.lockf(fd, fcntl.LOCK_EX)
+            try:
+                if os.fstat(fd).st_size < size:
+                    os.ftruncate(fd, size)
+                mapped = mmap.mmap(fd, size)
+                if SLOT.unpack_from(mapped, 0)[0] == 0:
+                    SLOT.pack_into(mapped, 0, int.from_bytes(os.urandom(8), "little") or 1)
+            finally:
+                fcntl.lockf(fd, fcntl.LOCK_UN)
+            self.table_id = SLOT.unpack_from(mapped, 0)[0]
+            self._fd, self._map = fd, mapped
+
+    def _offset(self, user_id: str) -> int:
+        # crc32 rather than hash(): the slot must be the same in every process
+        return HEADER_BYTES + (zlib.crc32(user_id.encode("utf-8")) % self.slots) * SLOT.size
+
+    def get(self, user_id: str) -> int:
+        """The user's current version. An aligned 8-byte read, no lock needed."""
+        self._open()
+        return SLOT.unpack_from(self._map, self._offset(user_id))[0]
+
+    def bump(self, user_ids: Iterable[str]) -> Dict[str, Tuple[int, int]]:
+        """
+        Increments each distinct user's counter once. Call after the write is visible to readers.
+        Returns each user's counter before and after the increment.
+        """
+        self._open()
+        offsets = {user_id: self._offset(user_id) for user_id in user_ids}
+        counters = {}
+        with self._lock:
+            for offset in sorted(set(offsets.values())):
+                fcntl.lockf(self._fd, fcntl.LOCK_EX, SLOT.size, offset)
+                try:
+                    before = SLOT.unpack_from(self._map, offset)[0]
+                    SLOT.pack_into(self._map, offset, before + 1)
+                finally:
+                    fcntl.lockf(self._fd, fcntl.LOCK_UN, SLOT.size, offset)
+                counters[offset] = (before, before + 1)
+        return {user_id: counters[offset] for user_id, offset in offsets.items()}
+
+
+# Process-wide table; opened on first use
+user_versions = UserVersions()
+
+# Called with {user_id: (before, after)} after each bump made by this process
+_bump_listeners: List[Callable[[Dict[str, Tuple[int, int]]], None]] = []
+
+
+def on_local_bump(listener: Callable[[Dict[str, Tuple[int, int]]], None]):
+    """Registers a callback for this process's own bumps, e.g. to tell them apart from other processes' writes."""
+    _bump_listeners.append(listener)
+
+
+def bump_user_versions(*user_ids: str):
+    """Marks these users' timelines and trends as changed."""
+    changes = user_versions.bump(user_ids)
+    for listener in _bump_listeners:
+        listener(changes)
+
+
+def _reset_after_fork():
+    # The mapping is shared with the parent on purpose; only the thread lock is per process
+    user_versions._lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
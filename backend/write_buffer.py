@@ -0,0 +1,287 @@
+# write_buffer.py
+"""
+Write-behind buffer for single check-ins.
+
+With WRITE_BEHIND=1, POST /checkin hands its document to this buffer instead of
+waiting for its own insert_one. The buffer flushes with one insert_many when it
+holds WRITE_BUFFER_MAX_BATCH entries or WRITE_BUFFER_FLUSH_MS after the last
+flush, so a burst of check-ins costs a few round trips instead of one each.
+
+Entries get their ObjectId before they are buffered, so writing the same entry
+twice (a retried flush, a WAL replay) is a duplicate-key no-op. With
+WRITE_BUFFER_WAL_DIR set, every entry is appended (and fsynced) to a local
+write-ahead log before the check-in is acknowledged; segments whose entries
+have all reached MongoDB are deleted, and leftover segments from a crashed
+process are replayed on startup. Buffered entries stay visible to /timeline
+until they are written (read-your-writes).
+"""
+
+import asyncio
+import fcntl
+import glob
+import itertools
+import math
+import os
+import threading
+from typing import Awaitable, Callable, List, Optional
+
+from bson import json_util, ObjectId
+
+# --- Configuration ---
+WRITE_BEHIND = os.environ.get("WRITE_BEHIND", "0").lower() in ("1", "true", "yes")
+# Flush as soon as this many entries are buffered...
+WRITE_BUFFER_MAX_BATCH = int(os.environ.get("WRITE_BUFFER_MAX_BATCH", "256"))
+# ...or at the latest this long after the previous flush
+WRITE_BUFFER_FLUSH_MS = float(os.environ.get("WRITE_BUFFER_FLUSH_MS", "50"))
+# While MongoDB is unavailable, check-ins wait for a flush once this many are buffered, and are refused if it fails
+WRITE_BUFFER_MAX_PENDING = int(os.environ.get("WRITE_BUFFER_MAX_PENDING", "10000"))
+# Directory for the write-ahead log; unset means a crash loses buffered entries
+WRITE_BUFFER_WAL_DIR = os.environ.get("WRITE_BUFFER_WAL_DIR", "")
+# fsync every append before acknowledging; off trusts the OS page cache (survives a process crash, not a power cut)
+WRITE_BUFFER_WAL_FSYNC = os.environ.get("WRITE_BUFFER_WAL_FSYNC", "1").lower() in ("1", "true", "yes")
+# Start a new segment once the current one is this large, so flushed segments can be deleted
+WAL_SEGMENT_BYTES = 1 << 20
+# ---------------------
+
+
+class WriteBufferFull(Exception):
+    """Raised by WriteBehindBuffer.add() when max_pending entries are buffered and a flush could not drain them."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class WalSegment:
+    """One append-only log file, locked by its writer for as long as it exists."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, "ab")
+        # Held until the segment is deleted, so other processes never replay a live segment
+        fcntl.flock(self.file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self.outstanding = 0  # Entries logged here that are not in MongoDB yet
+        self.sealed = False   # No more appends; deleted once outstanding reaches 0
+
+    def delete(self):
+        os.remove(self.path)
+        self.file.close()
+
+
+class WriteAheadLog:
+    """
+    Segmented JSON-lines log of buffered entries. Appends are thread-safe and
+    fsyncs run outside the lock, so concurrent check-ins share disk flushes.
+    """
+
+    def __init__(self, directory: str, fsync: bool = WRITE_BUFFER_WAL_FSYNC):
+        self.directory = directory
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._sequence = itertools.count()
+        self._current = None
+        os.makedirs(directory, exist_ok=True)
+
+    def _new_segment(self) -> WalSegment:
+        path = os.path.join(self.directory, f"wal-{os.getpid()}-{next(self._sequence):06d}.jsonl")
+        return WalSegment(path)
+
+    def append(self, entry: dict) -> WalSegment:
+        """Logs one entry durably and returns the segment that holds it."""
+        line = (json_util.dumps(entry) + "\n").encode("utf-8")
+        with self._lock:
+            segment = self._current
+            if segment is None:
+                segment = self._current = self._new_segment()
+            segment.file.write(line)
+            segment.file.flush()
+            segment.outstanding += 1
+            if segment.file.tell() >= WAL_SEGMENT_BYTES:
+                segment.sealed = True
+                self._current = None
+        if self.fsync:
+            os.fsync(segment.file.fileno())
+        return segment
+
+    def release(self, segments: List[WalSegment]):
+        """Marks one logged entry per listed segment as written, deleting segments that are done."""
+        with self._lock:
+            for segment in segments:
+                segment.outstanding -= 1
+                if segment.sealed and segment.outstanding == 0:
+                    segment.delete()
+
+    def close(self):
+        """Deletes the current segment if everything in it was written; otherwise it is replayed next start."""
+        with self._lock:
+            segment, self._current = self._current, None
+            if segment is None:
+                return
+            if segment.outstanding == 0:
+                segment.delete()
+            else:
+                segment.file.close()
+
+    def orphaned_segments(self):
+        """
+        Yields (path, entries, file) for segments no live process holds: leftovers of a
+        crash. The caller deletes each one after writing its entries.
+        """
+        for path in sorted(glob.glob(os.path.join(self.directory, "wal-*.jsonl"))):
+            handle = open(path, "rb")
+            try:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                handle.close()  # Another worker's live segment
+                continue
+            entries = []
+            for line in handle:
+                try:
+                    entries.append(json_util.loads(line))
+                except ValueError:
+                    # A torn final line was never acknowledged
+                    break
+            yield path, entries, handle
+
+
+class WriteBehindBuffer:
+    """
+    Buffers check-in documents and writes them in batches with `write_batch`, an
+    async callable that inserts a list of documents (tolerating duplicates) and
+    returns the ones it newly wrote.
+    """
+
+    def __init__(self, write_batch: Callable[[List[dict]], Awaitable[List[dict]]], enabled: bool = WRITE_BEHIND,
+                 max_batch: int = WRITE_BUFFER_MAX_BATCH, flush_ms: float = WRITE_BUFFER_FLUSH_MS,
+                 max_pending: int = WRITE_BUFFER_MAX_PENDING, wal_dir: str = WRITE_BUFFER_WAL_DIR):
+        self.write_batch = write_batch
+        self.enabled = enabled
+        self.max_batch = max(1, max_batch)
+        self.flush_interval = max(1.0, flush_ms) / 1000.0
+        self.max_pending = max(self.max_batch, max_pending)
+        self.wal_dir = wal_dir
+        self.wal = None
+        # Held for a whole flush; readers that must not see an entry twice (or not at all) take it too
+        self.lock = asyncio.Lock()
+        self._pending = []     # (entry, wal segment) in arrival order
+        self._in_flight = []   # Taken by the running flush, still visible to readers
+        self._wake = None
+        self._task = None
+
+        self.flushes = 0
+        self.flushed_entries = 0
+        self.flush_errors = 0
+        self.replayed_entries = 0
+
+    async def start(self):
+        """Replays leftover WAL segments, then starts the background flusher. Call from the app lifespan."""
+        if not self.enabled:
+            return
+        if self.wal_dir:
+            self.wal = WriteAheadLog(self.wal_dir)
+            await self.replay()
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._flush_loop(), name="write-behind-flusher")
+        print(f"Write-behind enabled: batches of {self.max_batch} or every {self.flush_interval * 1000:.0f} ms"
+              f"{', WAL in ' + self.wal_dir if self.wal else ', no WAL'}")
+
+    async def stop(self):
+        """Stops the flusher and writes whatever is still buffered."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await self.flush()
+        if self.wal is not None:
+            self.wal.close()
+        if self._pending:
+            print(f"WARNING: {len(self._pending)} buffered check-ins could not be written"
+                  f"{'; they stay in the WAL for the next start' if self.wal else ' and are lost'}")
+
+    async def add(self, entry: dict) -> ObjectId:
+        """Buffers an entry (logged first, if the WAL is on) and returns its id."""
+        entry.setdefault("_id", ObjectId())
+        # MongoDB keeps millisecond precision; match it so buffered and stored copies sort alike
+        timestamp = entry["timestamp"]
+        entry["timestamp"] = timestamp.replace(microsecond=timestamp.microsecond // 1000 * 1000)
+
+        if len(self._pending) >= self.max_pending:
+            # MongoDB is falling behind: make this caller wait for a flush instead of growing without bound
+            await self.flush()
+            if len(self._pending) >= self.max_pending:
+                raise WriteBufferFull(f"Write-behind buffer is full ({len(self._pending)} check-ins waiting for storage)",
+                                      retry_after=max(1, math.ceil(self.flush_interval)))
+        segment = await asyncio.to_thread(self.wal.append, entry) if self.wal is not None else None
+        self._pending.append((entry, segment))
+        # Before start() there is no flusher to wake; stop() or an explicit flush() writes the entries
+        if len(self._pending) >= self.max_batch and self._wake is not None:
+            self._wake.set()
+        return entry["_id"]
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    async def flush(self) -> int:
+        """Writes everything buffered so far in batches of max_batch. Returns how many entries were written."""
+        written = 0
+        async with self.lock:
+            while self._pending:
+                batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+                self._in_flight = batch
+                try:
+                    stored = await self.write_batch([entry for entry, _ in batch])
+                except Exception as e:
+                    # Keep the entries (and their WAL records) and retry on the next flush
+                    self._pending = batch + self._pending
+                    self.flush_errors += 1
+                    print(f"WARNING: Write-behind flush of {len(batch)} check-ins failed ({e}); retrying")
+                    break
+                finally:
+                    self._in_flight = []
+                if self.wal is not None:
+                    await asyncio.to_thread(self.wal.release, [segment for _, segment in batch])
+                self.flushes += 1
+                self.flushed_entries += len(stored)
+                written += len(stored)
+        return written
+
+    async def replay(self) -> int:
+        """Writes the entries of WAL segments left behind by a crashed process, then deletes them."""
+        replayed = 0
+        for path, entries, handle in self.wal.orphaned_segments():
+            try:
+                for offset in range(0, len(entries), self.max_batch):
+                    replayed += len(await self.write_batch(entries[offset:offset + self.max_batch]))
+                os.remove(path)
+            finally:
+                handle.close()
+        if replayed:
+            print(f"Replayed {replayed} check-ins from the write-behind WAL")
+        self.replayed_entries += replayed
+        return replayed
+
+    def buffered(self, user_id: str) -> List[dict]:
+        """One user's entries that are accepted but not yet confirmed written, in arrival order."""
+        return [entry for entry, _ in itertools.chain(self._in_flight, self._pending) if entry["user_id"] == user_id]
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "pending": len(self._pending),
+            "in_flight": len(self._in_flight),
+            "flushes": self.flushes,
+            "flushed_entries": self.flushed_entries,
+            "flush_errors": self.flush_errors,
+            "replayed_entries": self.replayed_entries,
+            "wal_dir": self.wal_dir or None,
+        }